@@ -1,22 +1,78 @@
+import json
+import os
+from contextlib import contextmanager
 from itertools import chain
+from time import time
 
 from AspireAPI.CategoryTransfers import CategoryTransfers
 from AspireAPI.Dashboard import Dashboard
-from AspireAPI.Locale import Locale
+from AspireAPI.Locale import Locale, Money
+from AspireAPI.Snapshot import RecordingSpreadsheetInterface, Snapshot, SnapshotSpreadsheetInterface, save_snapshot
 from AspireAPI.Transactions import Transactions
 from AspireAPI.sheets.AspireSheetInterface import AspireSheetInterface
 from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface
+from AspireAPI.sheets.BufferedSpreadsheetInterface import BufferedSpreadsheetInterface
+from AspireAPI.sheets.JournaledSpreadsheetInterface import JournaledSpreadsheetInterface, RecoveryResult
+from AspireAPI.sheets.Tracing import traced
 
 
 class Aspire:
+    """
+    # Configuration cache
+
+    If constructed with a configuration_cache_path, the values read from the configuration sheet are saved to that
+    file, and later constructions load them from it rather than from the sheet as long as the spreadsheet hasn't
+    changed since - as told by AspireSpreadsheetInterface.fingerprint, which is a cheaper query than reading the
+    configuration. Note that *any* change to the spreadsheet counts, including new transactions.
+
+    If configuration_cache_max_age is also given, a file saved less than that many seconds ago is used without even
+    checking the fingerprint, which takes no queries at all - at the risk of missing changes made to the configuration
+    in the meantime. Either way, each spreadsheet should have its own file.
+
+    # Amounts of money
+
+    All amounts of money (in the configuration, the tables and the dashboard) are floats, unless constructed with a
+    different money (see Locale.Money) - Money.CENTS or Money.DECIMAL make them exact, so that e.g. sums of them don't
+    pick up rounding errors.
+
+    # Journal
+
+    If constructed with a journal_path, every batch of writes is written down in that file before being sent, so that
+    one cut short halfway through (by a crash, or a quota error between the queries it takes) can be carried through
+    to the end rather than leaving a table half-shifted - see JournaledSpreadsheetInterface. The constructor does so
+    for whatever it finds unfinished in the journal (see .recover), and until that's done, no more writes are sent.
+
+    # Snapshots
+
+    .export_snapshot saves the tables, the configuration and the dashboard to a file, and Aspire.from_snapshot makes a
+    read-only Aspire object out of it that answers everything from the file, without touching the network - so that
+    many reports can share a single read of the spreadsheet. See AspireAPI.Snapshot for the format.
+    """
+
+    _CONFIGURATION_CACHE_FORMAT = 1
+    _DEFAULT_CONFIGURATION_ROWS = 109
+    _CONFIGURATION_RANGES = ["B5:C5", "D5", "E5:F5", "H9:H23", "I9:I23", "H28:H35", "I28:I35", "H42:H86", "H93:H107"]
+
+    @traced
     def __init__(self, spreadsheet_interface: AspireSpreadsheetInterface,
                  ensure_healthy = True,
+                 cache_tables = False,
+                 dashboard_snapshot_ttl = None,
+                 configuration_cache_path = None,
+                 configuration_cache_max_age = None,
+                 money = Money.FLOAT,
+                 journal_path = None,
                  dashboard_sheetname="Dashboard",
                  category_transfers_sheetname="Category Transfers",
                  transactions_sheetname="Transactions",
                  configuration_sheetname="Configuration"):
 
-        self._spreadsheet = spreadsheet_interface
+        if journal_path is not None:
+            self._journal = JournaledSpreadsheetInterface(spreadsheet_interface, journal_path)
+            spreadsheet_interface = self._journal
+        else:
+            self._journal = None
+        self._spreadsheet = BufferedSpreadsheetInterface(spreadsheet_interface)
 
         self.dashboard_sheetname = dashboard_sheetname
         self.category_transfers_sheetname = category_transfers_sheetname
@@ -24,17 +80,26 @@ class Aspire:
         self.configuration_sheetname = configuration_sheetname
 
         self._ensure_healthy = ensure_healthy
+        self._cache_tables = cache_tables
+        self._dashboard_snapshot_ttl = dashboard_snapshot_ttl
+        self.configuration_cache_path = configuration_cache_path
+        self.configuration_cache_max_age = configuration_cache_max_age
+        self.money = money
 
         self._transactions = None
         self._category_transfers = None
         self._dashboard = None
+        self._snapshot = None
+        if self._journal is not None and self._journal.unfinished:
+            self.recover()
         self._load_configuration()
 
     @property
     def transactions(self):
         if self._transactions is None:
             self._transactions_sheet = AspireSheetInterface(self.transactions_sheetname, self._spreadsheet)
-            self._transactions = Transactions(self._transactions_sheet)
+            self._transactions = Transactions(self._transactions_sheet, cached=self._cache_tables,
+                                             money=self.money)
             if self._ensure_healthy and not self._transactions.is_healthy():
                 raise Exception("Transactions sheet is not in the required format")
         return self._transactions
@@ -43,7 +108,8 @@ class Aspire:
     def category_transfers(self):
         if self._category_transfers is None:
             self._category_transfers_sheet = AspireSheetInterface(self.category_transfers_sheetname, self._spreadsheet)
-            self._category_transfers = CategoryTransfers(self._category_transfers_sheet)
+            self._category_transfers = CategoryTransfers(self._category_transfers_sheet,
+                                                          cached=self._cache_tables, money=self.money)
             if self._ensure_healthy and not self._category_transfers.is_healthy():
                 raise Exception("Category transfer sheet is not in the required format")
         return self._category_transfers
@@ -52,33 +118,202 @@ class Aspire:
     def dashboard(self):
         if self._dashboard is None:
             self._dashboard_sheet = AspireSheetInterface(self.dashboard_sheetname, self._spreadsheet)
-            self._dashboard = Dashboard(self._dashboard_sheet, self._account_index, self._category_or_group_index)
+            self._dashboard = Dashboard(self._dashboard_sheet, self._account_index, self._category_or_group_index,
+                                        snapshot_ttl=self._dashboard_snapshot_ttl, money=self.money)
         return self._dashboard
 
+    @contextmanager
+    def batch(self):
+        """
+        Context manager within which every write to the spreadsheet (through .transactions, .category_transfers or
+        anything else) is held back, to be sent all together in as few queries as possible when the block exits. Only
+        the writes made by the thread that entered the block are held back, not those of any other thread.
+
+        If the block exits through an exception, none of the writes made within it are sent, and .transactions and
+        .category_transfers are resynchronized with the spreadsheet. Note that reads which overlap a pending write
+        force the pending writes to be sent early - so a block that, say, pops twice from the same table, will still
+        be partially applied if it fails after the second pop.
+
+        Blocks may be nested, in which case only the outermost one has any effect.
+        """
+        try:
+            with self._spreadsheet.buffered():
+                yield self
+        except BaseException:
+            if not self._spreadsheet.is_buffering:
+                self._resync_tables()
+            raise
+
+    def _resync_tables(self):
+        if self._snapshot is not None:
+            # nothing can have been written, and the snapshot can't be read again anyway
+            return
+        for table in (self._transactions, self._category_transfers):
+            if table is not None:
+                table.resync()
+
+    @traced
+    def recover(self, abandon=False) -> RecoveryResult:
+        """
+        Finishes every batch of writes left unfinished in the journal - sending again whatever part of it may not have
+        gone through, or dropping it if none of it did - and resynchronizes .transactions and .category_transfers
+        with the spreadsheet. Done by the constructor, but also needed after a write fails midway (e.g. on running
+        out of quota), before writing anything else.
+
+        :param abandon: if True, unfinished batches are dropped as they are - see JournaledSpreadsheetInterface.recover
+        """
+        if self._journal is None:
+            raise Exception("Aspire object was constructed without a journal_path, so there is nothing to recover")
+        result = self._journal.recover(abandon=abandon)
+        self._resync_tables()
+        return result
+
+    @traced
+    def export_snapshot(self, path):
+        """
+        Saves the transactions, the category transfers, the configuration and the dashboard, as they are now, to a
+        file at path - to be loaded by Aspire.from_snapshot. Takes a query for the configuration (two, if it was last
+        reloaded with other than the default number of rows) and another for the dashboard, plus reading the tables
+        unless in cached mode.
+        """
+        # taken before reading, so that changes made in between leave the snapshot stale, rather than wrongly current
+        fingerprint = self._spreadsheet.fingerprint()
+        recorder = RecordingSpreadsheetInterface(self._spreadsheet)
+        # read again as from_snapshot's constructor and dashboard will, so that the snapshot can answer them - the
+        # constructor reads the configuration with the default number of rows, and from_snapshot then reads it again
+        # with as many as this object last did (see .reload_configuration), if that's different
+        configuration = AspireSheetInterface(self.configuration_sheetname, recorder)
+        for total_rows in dict.fromkeys([Aspire._DEFAULT_CONFIGURATION_ROWS, self._configuration_total_rows]):
+            configuration.batch_get(Aspire._configuration_ranges(total_rows))
+        Dashboard(AspireSheetInterface(self.dashboard_sheetname, recorder), self._account_index,
+                  self._category_or_group_index, money=self.money).snapshot()
+        tables = {type(table).__name__: table._compact_rows() for table in (self.transactions, self.category_transfers)}
+        sheetnames = {
+            "dashboard_sheetname": self.dashboard_sheetname,
+            "category_transfers_sheetname": self.category_transfers_sheetname,
+            "transactions_sheetname": self.transactions_sheetname,
+            "configuration_sheetname": self.configuration_sheetname,
+        }
+        save_snapshot(path, tables, recorder.reads, {"fingerprint": fingerprint, "saved_at": time(),
+                                                     "sheetnames": sheetnames,
+                                                     "configuration_total_rows": self._configuration_total_rows})
+
+    @classmethod
+    def from_snapshot(cls, path, money=Money.FLOAT) -> "Aspire":
+        """
+        Makes an Aspire object out of a file saved by .export_snapshot, which has the same methods and values - but
+        reads them all from the file (memory-mapped, so that only what is read is loaded) and makes no queries at all.
+        Anything that would write to the spreadsheet raises an exception instead.
+
+        The tables are in cached mode, and the dashboard is read from the snapshot too - so it's as of when the
+        snapshot was saved, whatever its snapshot_ttl.
+
+        :param money: how to represent amounts of money (see Locale.Money), whichever was used to save the snapshot
+        """
+        snapshot = Snapshot(path)
+        aspire = cls(SnapshotSpreadsheetInterface(snapshot), ensure_healthy=False, dashboard_snapshot_ttl=float("inf"),
+                     money=money, **snapshot.sheetnames)
+        aspire._snapshot = snapshot
+        total_rows = snapshot.header.get("configuration_total_rows", Aspire._DEFAULT_CONFIGURATION_ROWS)
+        if total_rows != Aspire._DEFAULT_CONFIGURATION_ROWS:
+            aspire.reload_configuration(total_rows)
+        aspire._transactions_sheet = AspireSheetInterface(aspire.transactions_sheetname, aspire._spreadsheet)
+        aspire._transactions = Transactions(aspire._transactions_sheet, money=money,
+                                            rows=snapshot.rows("Transactions", Transactions._SCHEMA, money))
+        aspire._category_transfers_sheet = AspireSheetInterface(aspire.category_transfers_sheetname,
+                                                                aspire._spreadsheet)
+        aspire._category_transfers = CategoryTransfers(
+            aspire._category_transfers_sheet, money=money,
+            rows=snapshot.rows("CategoryTransfers", CategoryTransfers._SCHEMA, money))
+        return aspire
+
     def _load_configuration(self):
+        total_rows = Aspire._DEFAULT_CONFIGURATION_ROWS
+        self._configuration_total_rows = total_rows
         self._configuration_sheet = AspireSheetInterface(self.configuration_sheetname, self._spreadsheet)
         self._account_index = dict()
         self._category_or_group_index = dict()
-        self.reload_configuration()
+        if self.configuration_cache_path is None:
+            self._reload_configuration(total_rows, None)
+            return
+        saved = self._read_configuration_cache(total_rows)
+        if saved is not None and self.configuration_cache_max_age is not None \
+                and 0 <= time() - saved["saved_at"] <= self.configuration_cache_max_age:
+            self._parse_configuration(saved["ranges"])
+            return
+        fingerprint = self._spreadsheet.fingerprint()
+        if saved is not None and fingerprint is not None and fingerprint == saved["fingerprint"]:
+            self._parse_configuration(saved["ranges"])
+            return
+        self._reload_configuration(total_rows, fingerprint)
 
+    def _read_configuration_cache(self, total_rows: int):
+        try:
+            with open(self.configuration_cache_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if saved.get("format") != Aspire._CONFIGURATION_CACHE_FORMAT \
+                or saved.get("sheetname") != self.configuration_sheetname or saved.get("total_rows") != total_rows:
+            return None
+        return saved
+
+    def _save_configuration_cache(self, ranges: list, fingerprint, total_rows: int):
+        saved = {
+            "format": Aspire._CONFIGURATION_CACHE_FORMAT,
+            "sheetname": self.configuration_sheetname,
+            "total_rows": total_rows,
+            "fingerprint": fingerprint,
+            "saved_at": time(),
+            "ranges": ranges,
+        }
+        # written to a different file first so that a crash midway can't leave a broken cache behind
+        temporary_path = "{}.tmp".format(self.configuration_cache_path)
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(temporary_path, self.configuration_cache_path)
+
+    @traced
     def reload_configuration(self, total_rows = 109):
-        self.monthly_income = Locale.parse_currency(self._configuration_sheet.get("B5:C5")[0][0])
-        self.unallocated_income = Locale.parse_currency(self._configuration_sheet.get("D5")[0][0])
-        self.half_year_fund = Locale.parse_currency(self._configuration_sheet.get("E5:F5")[0][0])
+        """
+        Rereads the configuration from the sheet (and saves it to the configuration cache, if there is one)
+        """
+        # taken before reading, so that changes made in between leave the cache stale, rather than wrongly current
+        fingerprint = None if self.configuration_cache_path is None else self._spreadsheet.fingerprint()
+        self._reload_configuration(total_rows, fingerprint)
+        self._configuration_total_rows = total_rows
+
+    @staticmethod
+    def _configuration_ranges(total_rows: int) -> list:
+        return Aspire._CONFIGURATION_RANGES + ["B9:F{}".format(total_rows-1)]
+
+    def _reload_configuration(self, total_rows: int, fingerprint):
+        ranges = self._configuration_sheet.batch_get(Aspire._configuration_ranges(total_rows))
+        if self.configuration_cache_path is not None:
+            self._save_configuration_cache(ranges, fingerprint, total_rows)
+        self._parse_configuration(ranges)
+
+    def _parse_configuration(self, ranges: list):
+        (monthly_income, unallocated_income, half_year_fund,
+         accounts, credit_cards, asset_categories, debt_categories, hidden_categories, hidden_accounts,
+         category_data) = ranges
+
+        self.monthly_income = Locale.parse_currency(monthly_income[0][0], self.money)
+        self.unallocated_income = Locale.parse_currency(unallocated_income[0][0], self.money)
+        self.half_year_fund = Locale.parse_currency(half_year_fund[0][0], self.money)
 
         deflate_dims = lambda l: [e[0] for e in l if len(e)>0]
-        self.accounts = deflate_dims(self._configuration_sheet.get("H9:H23"))
-        self.credit_cards = deflate_dims(self._configuration_sheet.get("I9:I23"))
-        self.asset_categories = deflate_dims(self._configuration_sheet.get("H28:H35"))
-        self.debt_categories = deflate_dims(self._configuration_sheet.get("I28:I35"))
-        self.hidden_categories = deflate_dims(self._configuration_sheet.get("H42:H86"))
-        self.hidden_accounts = deflate_dims(self._configuration_sheet.get("H93:H107"))
+        self.accounts = deflate_dims(accounts)
+        self.credit_cards = deflate_dims(credit_cards)
+        self.asset_categories = deflate_dims(asset_categories)
+        self.debt_categories = deflate_dims(debt_categories)
+        self.hidden_categories = deflate_dims(hidden_categories)
+        self.hidden_accounts = deflate_dims(hidden_accounts)
 
         self._account_index.clear()
         for index, account in enumerate(chain(self.accounts, self.credit_cards)):
             self._account_index[account] = index
 
-        category_data = self._configuration_sheet.get("B9:F{}".format(total_rows-1))
         header_symbol = "✦"
         tick_symbol = "✓"
 
@@ -102,8 +337,8 @@ class Aspire:
             self.category_groups[latest_header].append(name)
             self._category_or_group_index[name] = index
             self._category_data[name] = (index, symbol,
-                                         None if amt == "" else Locale.parse_currency(amt),
-                                         None if goal == "" else Locale.parse_currency(goal),
+                                         None if amt == "" else Locale.parse_currency(amt, self.money),
+                                         None if goal == "" else Locale.parse_currency(goal, self.money),
                                          is_necessary == tick_symbol)
 
         if self.category_groups[None]==[]:
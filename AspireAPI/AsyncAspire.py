@@ -0,0 +1,237 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from AspireAPI.Aspire import Aspire
+from AspireAPI.Dashboard import Dashboard, DashboardSnapshot
+from AspireAPI.sheets.ExecutorSpreadsheetInterface import ExecutorSpreadsheetInterface
+
+
+class AsyncTable:
+    """
+    Asynchronous version of a table (Transactions or CategoryTransfers, whose items it deals in). Each method does the
+    same as the synchronous method of the same name (with .get standing in for .__getitem__), but on the worker
+    threads of the ExecutorSpreadsheetInterface. Operations on the same table are run one at a time, in the order they
+    were awaited, since each one relies on the table being in normal form when it starts.
+    """
+
+    def __init__(self, table, interface: ExecutorSpreadsheetInterface):
+        self._table = table
+        self._interface = interface
+        self._lock = asyncio.Lock()
+
+    async def _run(self, function, *args, **kwargs):
+        async with self._lock:
+            return await self._interface.run(function, *args, **kwargs)
+
+    @property
+    def first_empty_index(self) -> int:
+        return self._table.first_empty_index
+
+    async def resync(self):
+        return await self._run(self._table.resync)
+
+    async def revalidate(self, tail_rows=20) -> bool:
+        return await self._run(self._table.revalidate, tail_rows)
+
+    async def get(self, index: int):
+        return await self._run(self._table.__getitem__, index)
+
+    async def batch_get(self, first_index: int, last_index: int) -> list:
+        return await self._run(self._table.batch_get, first_index, last_index)
+
+    async def push(self, item):
+        return await self._run(self._table.push, item)
+
+    async def batch_push(self, items: list):
+        return await self._run(self._table.batch_push, items)
+
+    async def pop(self, index: int):
+        return await self._run(self._table.pop, index)
+
+    async def batch_pop(self, first_index: int, last_index: int) -> list:
+        return await self._run(self._table.batch_pop, first_index, last_index)
+
+    async def insert(self, index: int, item):
+        return await self._run(self._table.insert, index, item)
+
+    async def batch_insert(self, start_index: int, items: list):
+        return await self._run(self._table.batch_insert, start_index, items)
+
+    async def insert_sorted(self, item) -> int:
+        return await self._run(self._table.insert_sorted, item)
+
+    async def batch_insert_sorted(self, items: list):
+        return await self._run(self._table.batch_insert_sorted, items)
+
+    async def replace(self, index: int, item):
+        return await self._run(self._table.replace, index, item)
+
+    async def batch_replace(self, start_index: int, items: list):
+        return await self._run(self._table.batch_replace, start_index, items)
+
+    async def iter_rows(self, chunk_size=2000, start=0, stop=None):
+        """
+        Asynchronous generator version of .iter_rows - the lock is only held while each chunk is read, so other
+        operations on the table may run in between, and shouldn't modify it until the iteration is over.
+        """
+        for first_index, last_index in self._table._chunk_ranges(chunk_size, start, stop):
+            for item in await self._run(self._table.batch_get, first_index, last_index):
+                yield item
+
+    async def is_healthy(self, safety_margin=1000, chunk_size=10000) -> bool:
+        return await self._run(self._table.is_healthy, safety_margin, chunk_size)
+
+    @property
+    def indexed(self) -> bool:
+        return self._table.indexed
+
+    async def find(self, item) -> Optional[int]:
+        return await self._run(self._table.find, item)
+
+    async def find_all(self, item) -> List[int]:
+        return await self._run(self._table.find_all, item)
+
+    async def count(self, item) -> int:
+        return await self._run(self._table.count, item)
+
+    async def contains(self, item) -> bool:
+        return await self._run(self._table.contains, item)
+
+    async def duplicates(self) -> List[List[int]]:
+        return await self._run(self._table.duplicates)
+
+    async def save_index(self, path):
+        return await self._run(self._table.save_index, path)
+
+    async def load_index(self, path) -> bool:
+        return await self._run(self._table.load_index, path)
+
+
+class AsyncDashboard:
+    """
+    Asynchronous version of Dashboard. Snapshots (see Dashboard.snapshot) are the way to go here - one await for the
+    whole dashboard, after which the values can be read off the snapshot without awaiting anything.
+    """
+
+    def __init__(self, dashboard: Dashboard, interface: ExecutorSpreadsheetInterface):
+        self._dashboard = dashboard
+        self._interface = interface
+        self._lock = asyncio.Lock()
+
+    async def _run(self, function, *args, **kwargs):
+        async with self._lock:
+            return await self._interface.run(function, *args, **kwargs)
+
+    async def snapshot(self) -> DashboardSnapshot:
+        return await self._run(self._dashboard.snapshot)
+
+    async def balance(self, account: str) -> float:
+        return await self._run(self._dashboard.balance, account)
+
+    async def available_to_budget(self) -> float:
+        return await self._run(self._dashboard.available_to_budget)
+
+    async def spent_this_month(self) -> float:
+        return await self._run(self._dashboard.spent_this_month)
+
+    async def budgeted_this_month(self) -> float:
+        return await self._run(self._dashboard.budgeted_this_month)
+
+    async def qt_pending_transactions(self) -> float:
+        return await self._run(self._dashboard.qt_pending_transactions)
+
+    async def available(self, category_or_group: str) -> float:
+        return await self._run(self._dashboard.available, category_or_group)
+
+    async def activity(self, category_or_group: str) -> float:
+        return await self._run(self._dashboard.activity, category_or_group)
+
+    async def budgeted(self, category_or_group: str) -> float:
+        return await self._run(self._dashboard.budgeted, category_or_group)
+
+
+class AsyncAspire:
+    """
+    Asynchronous version of Aspire, for use from an event loop. Build it with
+        aspire = await AsyncAspire.create(ExecutorSpreadsheetInterface(spreadsheet_interface), ...)
+    where spreadsheet_interface is whatever would be passed to Aspire itself.
+
+    The tables and the dashboard are loaded concurrently when it is created, and from then on queries to different
+    ones of them run concurrently too, as far as the ExecutorSpreadsheetInterface's max_workers allows - which is only
+    one at a time unless spreadsheet_interface is safe to use from several threads (see ExecutorSpreadsheetInterface).
+
+    The configuration (.categories, .category_amount(...), etc.) is available as on Aspire, as plain attributes.
+    Anything else of Aspire that queries the spreadsheet has a coroutine of its own here.
+    """
+
+    # what is read off of the Aspire object as is - none of it takes a query
+    _CONFIGURATION = frozenset([
+        "monthly_income", "unallocated_income", "half_year_fund", "accounts", "credit_cards", "asset_categories",
+        "debt_categories", "hidden_categories", "hidden_accounts", "category_groups", "categories", "category_symbol",
+        "category_amount", "category_goal", "is_category_necessary", "money", "dashboard_sheetname",
+        "category_transfers_sheetname", "transactions_sheetname", "configuration_sheetname",
+    ])
+
+    def __init__(self, aspire: Aspire, interface: ExecutorSpreadsheetInterface):
+        """
+        Use AsyncAspire.create instead
+        """
+        self._aspire = aspire
+        self._interface = interface
+        self.transactions = AsyncTable(aspire.transactions, interface)
+        self.category_transfers = AsyncTable(aspire.category_transfers, interface)
+        self.dashboard = AsyncDashboard(aspire.dashboard, interface)
+
+    @classmethod
+    async def create(cls, interface: ExecutorSpreadsheetInterface, **kwargs) -> "AsyncAspire":
+        """
+        :param interface: interface through which the spreadsheet is accessed
+        :param kwargs: as for Aspire's constructor
+        """
+        aspire = await interface.run(Aspire, interface.interface, **kwargs)
+        await asyncio.gather(interface.run(getattr, aspire, "transactions"),
+                             interface.run(getattr, aspire, "category_transfers"))
+        return cls(aspire, interface)
+
+    @asynccontextmanager
+    async def _exclusive(self):
+        # holds every lock (always in the same order), so that nothing else runs in the meantime
+        async with self.transactions._lock, self.category_transfers._lock, self.dashboard._lock:
+            yield
+
+    async def _run_exclusive(self, function, *args, **kwargs):
+        async with self._exclusive():
+            return await self._interface.run(function, *args, **kwargs)
+
+    async def batch(self, operations, *args, **kwargs):
+        """
+        Asynchronous counterpart to Aspire.batch: runs operations(aspire, *args, **kwargs), where aspire is the
+        synchronous Aspire object, within aspire.batch() - all on the same worker thread, and with nothing else of
+        this object running in the meantime. operations is a regular function (not a coroutine), e.g.
+            await aspire.batch(lambda aspire: [aspire.transactions.pop(3), aspire.transactions.insert(0, item)])
+
+        :return: what operations returns
+        """
+        def run():
+            with self._aspire.batch():
+                return operations(self._aspire, *args, **kwargs)
+        return await self._run_exclusive(run)
+
+    async def export_snapshot(self, path):
+        """
+        Asynchronous version of Aspire.export_snapshot
+        """
+        return await self._run_exclusive(self._aspire.export_snapshot, path)
+
+    async def reload_configuration(self, total_rows=109):
+        return await self._run_exclusive(self._aspire.reload_configuration, total_rows)
+
+    async def recover(self, abandon=False):
+        return await self._run_exclusive(self._aspire.recover, abandon)
+
+    def __getattr__(self, item):
+        # only reached for what isn't defined above
+        if item in AsyncAspire._CONFIGURATION:
+            return getattr(self._aspire, item)
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, item))
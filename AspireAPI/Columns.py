@@ -0,0 +1,260 @@
+from typing import Iterable, List, Optional
+
+from AspireAPI.CategoryTransfers import CategoryTransfer, CategoryTransferStatus
+from AspireAPI.Locale import Locale, Money, to_cents
+from AspireAPI.Transactions import Transaction, TransactionStatus
+
+
+# datetime.toordinal() of 1970-01-01, which is day 0 for numpy's datetime64
+_EPOCH_ORDINAL = 719163
+
+
+def _import_numpy():
+    # numpy is only needed for this module, so it isn't a requirement of the package as a whole
+    try:
+        import numpy
+    except ImportError as e:
+        raise ImportError("The columnar views of the tables require numpy (pip install numpy)") from e
+    return numpy
+
+
+class _Encoder:
+    """
+    Dictionary encoding of a column: each distinct value is given a code (in order of first appearance), and the column
+    becomes an array of codes plus the list of values (.labels) they stand for.
+    """
+
+    def __init__(self):
+        self.labels = []
+        self._codes = dict()
+        self.column = []
+
+    def append(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.labels)
+            self.labels.append(value)
+        self.column.append(code)
+
+
+def _sum_by(numpy, codes, values, qt_labels: int, mask):
+    if mask is not None:
+        codes = codes[mask]
+        values = values[mask]
+    sums = numpy.zeros(qt_labels, dtype=numpy.int64)
+    numpy.add.at(sums, codes, values)
+    return sums
+
+
+def _check_category_transfer_row(row: list) -> bool:
+    # same as row_to_category_transfer
+    if row == []:
+        return False
+    if len(row) < 4:
+        raise Exception("Badly formatted row")
+    return True
+
+
+class _Columns:
+
+    def __len__(self):
+        return len(self.date)
+
+    @property
+    def month(self):
+        """
+        The month of each row, as a datetime64[M] array - handy for masks, e.g.
+            columns.month == numpy.datetime64("2024-03")
+        """
+        return self.date.astype("datetime64[M]")
+
+    def _sum_by_month(self, values, mask) -> dict:
+        numpy = _import_numpy()
+        months = self.month
+        if mask is not None:
+            months = months[mask]
+            values = values[mask]
+        months, codes = numpy.unique(months, return_inverse=True)
+        sums = _sum_by(numpy, codes.reshape(-1), values, len(months), None)
+        return dict(zip(map(str, months), sums.tolist()))
+
+
+class TransactionColumns(_Columns):
+    """
+    The transactions table, column by column:
+    - date: datetime64[D] array
+    - outflow, inflow: int64 arrays, in cents
+    - category, account, status: int32 arrays of codes, which index into .categories, .accounts and .statuses
+      (a list of TransactionStatus)
+    - memo: list of str
+
+    The sums below are computed over every row, or only over the rows where mask (a boolean array) is True, e.g.
+        columns.sum_by_category(columns.month == numpy.datetime64("2024-03"))
+    for the activity of each category in March 2024. They are in cents, as inflow minus outflow.
+    """
+
+    def __init__(self, date, outflow, inflow, category, categories: List[str], account, accounts: List[str],
+                 memo: List[str], status, statuses: List[TransactionStatus]):
+        self.date = date
+        self.outflow = outflow
+        self.inflow = inflow
+        self.category = category
+        self.categories = categories
+        self.account = account
+        self.accounts = accounts
+        self.memo = memo
+        self.status = status
+        self.statuses = statuses
+
+    @staticmethod
+    def from_rows(rows: Iterable[list]) -> "TransactionColumns":
+        """
+        :param rows: rows of the transactions table, as read from the sheet (empty ones are skipped)
+        """
+        parse_date = Locale.parse_date
+        parse_currency = Locale.parse_currency
+        return TransactionColumns._build((parse_date(row[0]).toordinal(),
+                                          parse_currency(row[1] if len(row) > 1 else "", Money.CENTS),
+                                          parse_currency(row[2] if len(row) > 2 else "", Money.CENTS),
+                                          row[3] if len(row) > 3 else "",
+                                          row[4] if len(row) > 4 else "",
+                                          row[5] if len(row) > 5 else "",
+                                          TransactionStatus(row[6] if len(row) > 6 else ""))
+                                         for row in rows if row != [])
+
+    @staticmethod
+    def from_transactions(transactions: Iterable[Optional[Transaction]],
+                          money: Money = Money.FLOAT) -> "TransactionColumns":
+        """
+        :param transactions: Transactions (None are skipped), with amounts represented as given by money
+        """
+        return TransactionColumns._build((t.date.toordinal(), to_cents(t.outflow, money), to_cents(t.inflow, money),
+                                          t.category, t.account, t.memo, t.status)
+                                         for t in transactions if t is not None)
+
+    @staticmethod
+    def _build(rows: Iterable[tuple]) -> "TransactionColumns":
+        numpy = _import_numpy()
+        dates, outflows, inflows, memos = [], [], [], []
+        categories, accounts, statuses = _Encoder(), _Encoder(), _Encoder()
+        for date, outflow, inflow, category, account, memo, status in rows:
+            dates.append(date-_EPOCH_ORDINAL)
+            outflows.append(outflow)
+            inflows.append(inflow)
+            categories.append(category)
+            accounts.append(account)
+            memos.append(memo)
+            statuses.append(status)
+        return TransactionColumns(numpy.array(dates, dtype=numpy.int64).astype("datetime64[D]"),
+                                  numpy.array(outflows, dtype=numpy.int64),
+                                  numpy.array(inflows, dtype=numpy.int64),
+                                  numpy.array(categories.column, dtype=numpy.int32), categories.labels,
+                                  numpy.array(accounts.column, dtype=numpy.int32), accounts.labels,
+                                  memos,
+                                  numpy.array(statuses.column, dtype=numpy.int32), statuses.labels)
+
+    def net(self):
+        """
+        :return: inflow minus outflow of each row, in cents
+        """
+        return self.inflow - self.outflow
+
+    def sum_by_category(self, mask=None) -> dict:
+        numpy = _import_numpy()
+        sums = _sum_by(numpy, self.category, self.net(), len(self.categories), mask)
+        return dict(zip(self.categories, sums.tolist()))
+
+    def sum_by_account(self, mask=None) -> dict:
+        numpy = _import_numpy()
+        sums = _sum_by(numpy, self.account, self.net(), len(self.accounts), mask)
+        return dict(zip(self.accounts, sums.tolist()))
+
+    def sum_by_month(self, mask=None) -> dict:
+        """
+        :return: dict from month (as "YYYY-MM") to the sum of the rows in it
+        """
+        return self._sum_by_month(self.net(), mask)
+
+
+class CategoryTransferColumns(_Columns):
+    """
+    The category transfers table, column by column:
+    - date: datetime64[D] array
+    - amount: int64 array, in cents
+    - from_, to: int32 arrays of codes, which index into .categories
+    - status: int32 array of codes, which index into .statuses (a list of CategoryTransferStatus)
+    - memo: list of str
+
+    As with TransactionColumns, the sums below can be restricted to the rows where mask (a boolean array) is True.
+    """
+
+    def __init__(self, date, amount, from_, to, categories: List[str], memo: List[str], status,
+                 statuses: List[CategoryTransferStatus]):
+        self.date = date
+        self.amount = amount
+        self.from_ = from_
+        self.to = to
+        self.categories = categories
+        self.memo = memo
+        self.status = status
+        self.statuses = statuses
+
+    @staticmethod
+    def from_rows(rows: Iterable[list]) -> "CategoryTransferColumns":
+        """
+        :param rows: rows of the category transfers table, as read from the sheet (empty ones are skipped)
+        """
+        parse_date = Locale.parse_date
+        parse_currency = Locale.parse_currency
+        return CategoryTransferColumns._build((parse_date(row[0]).toordinal(),
+                                               parse_currency(row[1], Money.CENTS),
+                                               row[2],
+                                               row[3],
+                                               row[4] if len(row) > 4 else "",
+                                               CategoryTransferStatus(row[5] if len(row) > 5 else ""))
+                                              for row in rows if _check_category_transfer_row(row))
+
+    @staticmethod
+    def from_category_transfers(transfers: Iterable[Optional[CategoryTransfer]],
+                                money: Money = Money.FLOAT) -> "CategoryTransferColumns":
+        """
+        :param transfers: CategoryTransfers (None are skipped), with amounts represented as given by money
+        """
+        return CategoryTransferColumns._build((t.date.toordinal(), to_cents(t.amount, money), t.from_, t.to, t.memo,
+                                               t.status)
+                                              for t in transfers if t is not None)
+
+    @staticmethod
+    def _build(rows: Iterable[tuple]) -> "CategoryTransferColumns":
+        numpy = _import_numpy()
+        dates, amounts, froms, tos, memos = [], [], [], [], []
+        categories, statuses = _Encoder(), _Encoder()
+        for date, amount, from_, to, memo, status in rows:
+            dates.append(date-_EPOCH_ORDINAL)
+            amounts.append(amount)
+            categories.append(from_)
+            categories.append(to)
+            memos.append(memo)
+            statuses.append(status)
+        # from_ and to share their labels, so their codes were interleaved
+        codes = numpy.array(categories.column, dtype=numpy.int32)
+        return CategoryTransferColumns(numpy.array(dates, dtype=numpy.int64).astype("datetime64[D]"),
+                                       numpy.array(amounts, dtype=numpy.int64),
+                                       codes[0::2], codes[1::2], categories.labels,
+                                       memos,
+                                       numpy.array(statuses.column, dtype=numpy.int32), statuses.labels)
+
+    def sum_by_category(self, mask=None) -> dict:
+        """
+        :return: dict from category to how much was transferred into it minus how much was transferred out of it
+        """
+        numpy = _import_numpy()
+        sums = _sum_by(numpy, self.to, self.amount, len(self.categories), mask) \
+            - _sum_by(numpy, self.from_, self.amount, len(self.categories), mask)
+        return dict(zip(self.categories, sums.tolist()))
+
+    def sum_by_month(self, mask=None) -> dict:
+        """
+        :return: dict from month (as "YYYY-MM") to the total amount transferred in it
+        """
+        return self._sum_by_month(self.amount, mask)
@@ -0,0 +1,239 @@
+import csv
+import os
+import re
+from collections import Counter, namedtuple
+from datetime import datetime as Datetime, timedelta as TimeDelta
+from decimal import Decimal
+from functools import lru_cache
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Optional, Union
+
+from AspireAPI.Locale import Locale, Money, PARSE_CACHE_SIZE, from_cents
+from AspireAPI.Transactions import Transaction, Transactions, TransactionStatus, transaction_fingerprint
+from AspireAPI.sheets.Tracing import traced
+
+
+# Sends the transactions whose memo matches pattern (a regex, searched for case insensitively) to category
+CategoryRule = namedtuple("CategoryRule", "pattern category")
+
+# What CsvImporter.import_statement did:
+# - qt_read: number of transactions in the statement
+# - qt_duplicates: how many of them were already in the table
+# - transactions: the rest, which were added to it (sorted by date)
+ImportResult = namedtuple("ImportResult", "qt_read qt_duplicates transactions")
+
+# A column of the statement - either the name of the column (as given in its header), or a function that takes the
+# whole line (as a dict from column name to value) and returns the value
+Column = Union[str, Callable[[dict], str]]
+
+
+def _column_reader(column: Optional[Union[Column, Iterable[str]]]) -> Optional[Callable[[dict], str]]:
+    if column is None or callable(column):
+        return column
+    if isinstance(column, str):
+        return lambda line: line[column] or ""
+    columns = list(column)
+    return lambda line: " ".join(line[name] for name in columns if line[name])
+
+
+def parse_amount(string: str, decimal_separator=".") -> int:
+    """
+    Reads an amount of money the way banks tend to write them - e.g. "-1,234.56", "1.234,56-", "(12.50)" or
+    "EUR 12.5" - ignoring everything but the digits, the sign and the decimal separator.
+
+    :return: the amount, as an integer amount of cents (rounded to the closest one)
+    """
+    string = string.strip()
+    negative = (string.startswith("(") and string.endswith(")")) or "-" in string
+    kept = "".join(c for c in string if c in "0123456789" or c == decimal_separator)
+    if kept.strip(decimal_separator) == "":
+        if string in ("", "-"):
+            return 0
+        raise ValueError("Can't read an amount of money from {!r}".format(string))
+    if kept.count(decimal_separator) > 1:
+        raise ValueError("Can't read an amount of money from {!r} (with decimal separator {!r})"
+                         .format(string, decimal_separator))
+    integer, _, fraction = kept.partition(decimal_separator)
+    if len(fraction) <= 2:
+        cents = int("{}{:0<2}".format(integer, fraction))
+    else:
+        cents = int((Decimal("{}.{}".format(integer or "0", fraction))*100).to_integral_value())
+    return -cents if negative else cents
+
+
+class CsvImporter:
+    """
+    Imports the CSV statements that banks export into the transactions table, skipping the transactions that are
+    already in it - so that importing overlapping statements (or the same one twice) only ever adds each transaction
+    once.
+
+    A statement is read line by line, twice: first to find out which dates it covers, and then to turn each line into
+    a Transaction (through the columns given to the constructor and the category rules) and check its
+    transaction_fingerprint against those of the transactions already in the table *within those dates* - which are
+    read .chunk_size rows at a time, or not at all if the table's fingerprint index has been built or loaded (see
+    Transactions.indexed). Only the new transactions are kept in memory, to be added to the table in a single
+    write when it's done, so the memory used doesn't grow with the size of the statement or of the table - except for
+    the transactions that actually have to be added.
+
+    Two identical lines in a statement (e.g. two coffees on the same day) are taken to be two different transactions,
+    and are only skipped if the table has at least as many of them.
+    """
+
+    def __init__(self, account: str, date: Column, amount: Optional[Column] = None,
+                 outflow: Optional[Column] = None, inflow: Optional[Column] = None,
+                 memo: Optional[Union[Column, Iterable[str]]] = None,
+                 date_format: Optional[str] = None, decimal_separator=".",
+                 rules: Iterable[Union[CategoryRule, Callable[[Transaction], Optional[str]]]] = (),
+                 default_category="", status=TransactionStatus.SETTLED,
+                 skip_lines=0, encoding="utf-8-sig", csv_options: Optional[dict] = None, chunk_size=10000):
+        """
+        :param account: the account the statement is for
+        :param date: the column with the date of each transaction
+        :param amount: the column with the amount of each transaction, negative for money going out. Alternatively,
+                       give outflow and inflow, if the statement has a column for each (with positive amounts)
+        :param memo: the column to use as the memo, or a list of columns to be joined by spaces
+        :param date_format: format of the dates, as for datetime.strptime. By default, the format of Locale
+        :param decimal_separator: "." or ","; the other one is taken to be the thousands separator
+        :param rules: CategoryRules, or functions that take a Transaction and return its category (or None if the rule
+                      doesn't apply to it). The category of each transaction is given by the first rule that applies
+                      to it, or is default_category if none do
+        :param status: status of the imported transactions
+        :param skip_lines: lines to skip at the start of the file, before the header
+        :param csv_options: passed on to csv.DictReader - e.g. {"delimiter": ";"}, or {"fieldnames": [...]} for
+                            statements with no header
+        :param chunk_size: how many rows of the table to read at a time when looking for duplicates
+        """
+        if (amount is None) == (outflow is None and inflow is None):
+            raise Exception("CsvImporter needs either an amount column, or outflow and/or inflow columns")
+        self.account = account
+        self._date = _column_reader(date)
+        self._amount = _column_reader(amount)
+        self._outflow = _column_reader(outflow)
+        self._inflow = _column_reader(inflow)
+        self._memo = _column_reader(memo)
+        if date_format is None:
+            self._parse_date = Locale.parse_date
+        else:
+            self._parse_date = lru_cache(maxsize=PARSE_CACHE_SIZE)(
+                lambda string: Datetime.strptime(string, date_format))
+        self.decimal_separator = decimal_separator
+        self._rules = [rule if callable(rule) else _category_rule(rule) for rule in rules]
+        self.default_category = default_category
+        self.status = status
+        self.skip_lines = skip_lines
+        self.encoding = encoding
+        self.csv_options = dict() if csv_options is None else csv_options
+        self.chunk_size = chunk_size
+
+    def _lines(self, source) -> Iterator[dict]:
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, "r", encoding=self.encoding, newline="") as f:
+                yield from csv.DictReader(islice(f, self.skip_lines, None), **self.csv_options)
+        else:
+            yield from csv.DictReader(islice(source, self.skip_lines, None), **self.csv_options)
+
+    def _line_to_date(self, line: dict) -> Datetime:
+        return self._parse_date(self._date(line).strip())
+
+    def _line_to_transaction(self, line: dict, money: Money) -> Transaction:
+        if self._amount is not None:
+            cents = parse_amount(self._amount(line), self.decimal_separator)
+            outflow, inflow = max(-cents, 0), max(cents, 0)
+        else:
+            outflow = 0 if self._outflow is None else abs(parse_amount(self._outflow(line), self.decimal_separator))
+            inflow = 0 if self._inflow is None else abs(parse_amount(self._inflow(line), self.decimal_separator))
+        transaction = Transaction(date=self._line_to_date(line),
+                                  outflow=from_cents(outflow, money), inflow=from_cents(inflow, money),
+                                  category=self.default_category, account=self.account,
+                                  memo="" if self._memo is None else self._memo(line).strip(),
+                                  status=self.status)
+        for rule in self._rules:
+            category = rule(transaction)
+            if category is not None:
+                return transaction._replace(category=category)
+        return transaction
+
+    def _read(self, source, convert: Callable[[dict], object]) -> Iterator:
+        for line_number, line in enumerate(self._lines(source), start=1):
+            try:
+                yield convert(line)
+            except (KeyError, TypeError, ValueError) as e:
+                raise Exception("Couldn't read line {} of the statement (not counting the header): {!r}"
+                                .format(line_number, e)) from e
+
+    def read(self, source, money: Money = Money.FLOAT) -> Iterator[Transaction]:
+        """
+        Reads the transactions in a statement, one line at a time.
+
+        :param source: path of the statement, or the statement itself as a file object (opened with newline="")
+        :param money: how to represent the amounts (see Locale.Money)
+        """
+        return self._read(source, lambda line: self._line_to_transaction(line, money))
+
+    @traced
+    def import_statement(self, transactions: Transactions, source, dry_run=False) -> ImportResult:
+        """
+        Adds the transactions in a statement that aren't already in the table, in one write - pushing them if they all
+        go after the last row of the table, or inserting them in order otherwise. The table is assumed to be sorted by
+        date (see Transactions.is_healthy).
+
+        :param source: path of the statement, or the statement itself as a seekable file object (opened with
+                       newline=""), since it is read twice
+        :param dry_run: if True, works out what would be added, but doesn't add it
+        """
+        start_position = None if isinstance(source, (str, os.PathLike)) else source.tell()
+        first_date, last_date, qt_read = None, None, 0
+        for date in self._read(source, self._line_to_date):
+            qt_read += 1
+            if first_date is None or date < first_date:
+                first_date = date
+            if last_date is None or date > last_date:
+                last_date = date
+        if qt_read == 0:
+            return ImportResult(0, 0, [])
+
+        probed = dict()
+        if transactions.indexed:
+            # looked up in the table's fingerprint index as they come up, rather than read from the table
+            known = Counter()
+        else:
+            known = self._known_fingerprints(transactions, first_date, last_date, probed)
+        if start_position is not None:
+            source.seek(start_position)
+        new = []
+        for transaction in self.read(source, transactions.money):
+            fingerprint = transaction_fingerprint(transaction, transactions.money)
+            if transactions.indexed and fingerprint not in known:
+                known[fingerprint] = transactions.count(transaction)
+            if known[fingerprint] > 0:
+                known[fingerprint] -= 1
+            else:
+                new.append(transaction)
+        new.sort(key=lambda t: t.date)
+
+        if new and not dry_run:
+            if transactions.first_empty_index == 0 \
+                    or new[0].date >= transactions.date_at(transactions.first_empty_index-1, probed):
+                transactions.batch_push(new)
+            else:
+                transactions.batch_insert_sorted(new)
+        return ImportResult(qt_read, qt_read-len(new), new)
+
+    def _known_fingerprints(self, transactions: Transactions, first_date: Datetime, last_date: Datetime,
+                            probed: dict) -> Counter:
+        """
+        :return: how many times each transaction_fingerprint appears among the transactions of the table, for this
+                 account, between first_date and last_date
+        """
+        start = transactions.bisect_date(first_date-TimeDelta(microseconds=1), 0, probed)
+        stop = transactions.bisect_date(last_date, start, probed)
+        known = Counter()
+        for transaction in transactions.iter_rows(self.chunk_size, start, stop):
+            if transaction is not None and transaction.account == self.account:
+                known[transaction_fingerprint(transaction, transactions.money)] += 1
+        return known
+
+
+def _category_rule(rule: CategoryRule) -> Callable[[Transaction], Optional[str]]:
+    pattern = re.compile(rule.pattern, re.IGNORECASE)
+    return lambda transaction: rule.category if pattern.search(transaction.memo) else None
@@ -1,48 +1,188 @@
-from AspireAPI.Locale import Locale
+from time import monotonic
+from types import MappingProxyType
+from typing import Optional
+
+from AspireAPI.Locale import Locale, Money
 from AspireAPI.sheets.AspireSheetInterface import AspireSheetInterface
+from AspireAPI.sheets.Tracing import traced
+
+
+class DashboardSnapshot:
+    """
+    Immutable copy of all the values in the dashboard, as they were at some point in time. Obtained through
+    Dashboard.snapshot, and read through the same methods as Dashboard - except that these never touch the network.
+    """
+
+    __slots__ = ("taken_at", "_totals", "_balances", "_categories")
+
+    def __init__(self, taken_at: float, totals: tuple, balances: dict, categories: dict):
+        """
+        :param taken_at: time.monotonic() at the time the values were read
+        :param totals: (available to budget, spent this month, budgeted this month, number of pending transactions)
+        :param balances: dict from account name to balance
+        :param categories: dict from category (or group) name to a tuple (available, activity, budgeted)
+        """
+        object.__setattr__(self, "taken_at", taken_at)
+        object.__setattr__(self, "_totals", totals)
+        object.__setattr__(self, "_balances", MappingProxyType(balances))
+        object.__setattr__(self, "_categories", MappingProxyType(categories))
+
+    def __setattr__(self, key, value):
+        raise AttributeError("DashboardSnapshot is immutable")
+
+    def balance(self, account: str) -> float:
+        return self._balances[account]
+
+    def available_to_budget(self) -> float:
+        return self._totals[0]
+
+    def spent_this_month(self) -> float:
+        return self._totals[1]
+
+    def budgeted_this_month(self) -> float:
+        return self._totals[2]
+
+    def qt_pending_transactions(self) -> float:
+        return self._totals[3]
+
+    def available(self, category_or_group: str) -> float:
+        return self._categories[category_or_group][0]
+
+    def activity(self, category_or_group: str) -> float:
+        return self._categories[category_or_group][1]
+
+    def budgeted(self, category_or_group: str) -> float:
+        return self._categories[category_or_group][2]
+
+
+def _cell(rows: list, row: int, column: int) -> str:
+    # the API leaves out trailing empty cells and rows
+    if row < len(rows) and column < len(rows[row]):
+        return rows[row][column]
+    return ""
 
 
 class Dashboard:
 
-    def __init__(self, sheet_interface: AspireSheetInterface, account_index, category_or_group_index):
+    def __init__(self, sheet_interface: AspireSheetInterface, account_index, category_or_group_index,
+                 snapshot_ttl: Optional[float] = None, money: Money = Money.FLOAT):
+        """
+        :param snapshot_ttl: if None, every method below reads its value from the sheet when called. Otherwise, they
+                             read it from a snapshot (see .snapshot), which is retaken whenever it is older than this
+                             many seconds.
+        :param money: how the amounts of money are returned (see Locale.Money)
+        """
         self._sheet = sheet_interface
         self._account_index = account_index
         self._category_or_group_index = category_or_group_index
+        self.snapshot_ttl = snapshot_ttl
+        self.money = money
+        self._snapshot = None
+
+    @traced
+    def snapshot(self) -> DashboardSnapshot:
+        """
+        Reads the whole dashboard (totals, accounts and categories) in a single query.
+        """
+        first_category_row = 6+min(self._category_or_group_index.values(), default=0)
+        last_category_row = 6+max(self._category_or_group_index.values(), default=0)
+        last_account_row = 8+2*max(self._account_index.values(), default=0)
+
+        totals, accounts, categories = self._sheet.batch_get([
+            "H2:O2",
+            "C8:D{}".format(last_account_row),
+            "I{}:O{}".format(first_category_row, last_category_row),
+        ])
+
+        totals = (Locale.parse_currency(_cell(totals, 0, 0), self.money),
+                  Locale.parse_currency(_cell(totals, 0, 1), self.money),
+                  Locale.parse_currency(_cell(totals, 0, 3), self.money),
+                  int(_cell(totals, 0, 7) or 0))
+        balances = {account: Locale.parse_currency(_cell(accounts, 2*index, 0), self.money)
+                    for account, index in self._account_index.items()}
+        category_values = dict()
+        for category_or_group, index in self._category_or_group_index.items():
+            row = index+6-first_category_row
+            category_values[category_or_group] = (Locale.parse_currency(_cell(categories, row, 0), self.money),
+                                                  Locale.parse_currency(_cell(categories, row, 3), self.money),
+                                                  Locale.parse_currency(_cell(categories, row, 6), self.money))
+
+        self._snapshot = DashboardSnapshot(monotonic(), totals, balances, category_values)
+        return self._snapshot
+
+    def _fresh_snapshot(self) -> Optional[DashboardSnapshot]:
+        if self.snapshot_ttl is None:
+            return None
+        if self._snapshot is None or monotonic()-self._snapshot.taken_at > self.snapshot_ttl:
+            self.snapshot()
+        return self._snapshot
 
+    @traced
     def balance(self, account: str) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.balance(account)
         data = self._sheet.get("C{0}:D{0}".format(8+2*self._account_index[account]))[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def available_to_budget(self) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.available_to_budget()
         data = self._sheet.get("H2")[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def spent_this_month(self) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.spent_this_month()
         data = self._sheet.get("I2:J2")[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def budgeted_this_month(self) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.budgeted_this_month()
         data = self._sheet.get("K2:L2")[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def qt_pending_transactions(self) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.qt_pending_transactions()
         data = self._sheet.get("O2")[0][0]
         return int(data)
 
+    @traced
     def available(self, category_or_group: str) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.available(category_or_group)
         index = self._category_or_group_index[category_or_group]
         row_index = index+6
         data = self._sheet.get("I{}".format(row_index))[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def activity(self, category_or_group: str) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.activity(category_or_group)
         index = self._category_or_group_index[category_or_group]
         row_index = index+6
         data = self._sheet.get("L{}".format(row_index))[0][0]
-        return Locale.parse_currency(data)
+        return Locale.parse_currency(data, self.money)
 
+    @traced
     def budgeted(self, category_or_group: str) -> float:
+        snapshot = self._fresh_snapshot()
+        if snapshot is not None:
+            return snapshot.budgeted(category_or_group)
         index = self._category_or_group_index[category_or_group]
         row_index = index+6
         data = self._sheet.get("O{}".format(row_index))[0][0]
-        return Locale.parse_currency(data)
\ No newline at end of file
+        return Locale.parse_currency(data, self.money)
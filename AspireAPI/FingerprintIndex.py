@@ -0,0 +1,174 @@
+import json
+import os
+import sys
+from array import array
+from bisect import insort
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+
+class FingerprintIndex:
+    """
+    Keeps track of which rows of a table hold which fingerprint (e.g. transaction_fingerprint), so that finding the
+    rows that hold a given one - or just whether any do - doesn't take reading the table.
+
+    It is a list with the fingerprint of each row (None for empty ones), plus
+    - how many rows hold each fingerprint, which is always kept up to date, so .count and `in` are O(1)
+    - the indices of the rows that hold each fingerprint, which is kept up to date through .assign (and through
+      inserting and deleting rows at the end of the table), but is dropped when rows are inserted or deleted further
+      up - since every index after them would have to be shifted - and rebuilt (in O(n)) the next time it's needed.
+    """
+
+    _FORMAT = 1
+
+    def __init__(self, fingerprints: Iterable[Optional[int]] = ()):
+        self._fingerprints = list(fingerprints)
+        self._trim()
+        self._counts = Counter(fingerprint for fingerprint in self._fingerprints if fingerprint is not None)
+        self._positions = None
+
+    def __len__(self):
+        """
+        :return: number of rows up to the last non-empty one
+        """
+        return len(self._fingerprints)
+
+    def __contains__(self, fingerprint: int) -> bool:
+        return self._counts[fingerprint] > 0
+
+    def count(self, fingerprint: int) -> int:
+        return self._counts[fingerprint]
+
+    def find_all(self, fingerprint: int) -> List[int]:
+        """
+        :return: indices of the rows that hold fingerprint, in ascending order
+        """
+        if self._counts[fingerprint] == 0:
+            return []
+        return list(self._get_positions()[fingerprint])
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """
+        :return: index of the first row that holds fingerprint, or None if none do
+        """
+        if self._counts[fingerprint] == 0:
+            return None
+        return self._get_positions()[fingerprint][0]
+
+    def duplicates(self) -> Dict[int, List[int]]:
+        """
+        :return: dict from each fingerprint held by more than one row to the indices of those rows
+        """
+        positions = self._get_positions()
+        return {fingerprint: list(positions[fingerprint])
+                for fingerprint, count in self._counts.items() if count > 1}
+
+    def _get_positions(self) -> Dict[int, List[int]]:
+        if self._positions is None:
+            positions = dict()
+            for index, fingerprint in enumerate(self._fingerprints):
+                if fingerprint is not None:
+                    if fingerprint in positions:
+                        positions[fingerprint].append(index)
+                    else:
+                        positions[fingerprint] = [index]
+            self._positions = positions
+        return self._positions
+
+    def _trim(self):
+        fingerprints = self._fingerprints
+        while fingerprints and fingerprints[-1] is None:
+            fingerprints.pop()
+
+    def _forget(self, index: int, fingerprint: int):
+        self._counts[fingerprint] -= 1
+        if self._counts[fingerprint] == 0:
+            del self._counts[fingerprint]
+        if self._positions is not None:
+            indices = self._positions[fingerprint]
+            indices.remove(index)
+            if not indices:
+                del self._positions[fingerprint]
+
+    def assign(self, start: int, fingerprints: List[Optional[int]]):
+        """
+        Sets the fingerprints of the rows from start onwards (None to empty them), as with setting or clearing them.
+        """
+        if len(self._fingerprints) < start+len(fingerprints):
+            self._fingerprints.extend([None] * (start+len(fingerprints)-len(self._fingerprints)))
+        for index, new in enumerate(fingerprints, start):
+            old = self._fingerprints[index]
+            if old == new:
+                continue
+            if old is not None:
+                self._forget(index, old)
+            if new is not None:
+                self._counts[new] += 1
+                if self._positions is not None:
+                    insort(self._positions.setdefault(new, []), index)
+            self._fingerprints[index] = new
+        self._trim()
+
+    def insert(self, start: int, qt_rows: int):
+        """
+        Inserts qt_rows empty rows at start, shifting down everything from there on.
+        """
+        if start >= len(self._fingerprints):
+            return
+        self._fingerprints[start:start] = [None] * qt_rows
+        self._positions = None
+
+    def delete(self, first: int, last: int):
+        """
+        Deletes the rows from first to last, shifting up everything below them.
+        """
+        if last+1 >= len(self._fingerprints):
+            # nothing below them, so nothing shifts
+            self.assign(first, [None] * (len(self._fingerprints)-first))
+            return
+        for fingerprint in self._fingerprints[first:last+1]:
+            if fingerprint is not None:
+                self._counts[fingerprint] -= 1
+                if self._counts[fingerprint] == 0:
+                    del self._counts[fingerprint]
+        del self._fingerprints[first:last+1]
+        self._positions = None
+
+    def save(self, path, header: dict):
+        """
+        Saves the index to path, along with header (which should be enough to tell whether it's still current when
+        loaded back) - as a line of json, followed by the fingerprints as 8 byte little endian integers.
+        """
+        fingerprints = array("Q", (0 if fingerprint is None else fingerprint for fingerprint in self._fingerprints))
+        if sys.byteorder != "little":
+            fingerprints.byteswap()
+        header = dict(header, format=FingerprintIndex._FORMAT, qt_rows=len(fingerprints),
+                      empty=[index for index, fingerprint in enumerate(self._fingerprints) if fingerprint is None])
+        # written to a different file first so that a crash midway can't leave a broken index behind
+        temporary_path = "{}.tmp".format(path)
+        with open(temporary_path, "wb") as f:
+            f.write(json.dumps(header, ensure_ascii=False).encode("utf-8"))
+            f.write(b"\n")
+            fingerprints.tofile(f)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path) -> Optional[tuple]:
+        """
+        :return: the (header, index) saved to path by .save, or None if there is no such file or it can't be read
+        """
+        try:
+            with open(path, "rb") as f:
+                header = json.loads(f.readline().decode("utf-8"))
+                if header.get("format") != FingerprintIndex._FORMAT:
+                    return None
+                fingerprints = array("Q")
+                fingerprints.fromfile(f, header["qt_rows"])
+            if sys.byteorder != "little":
+                fingerprints.byteswap()
+            fingerprints = fingerprints.tolist()
+            for index in header["empty"]:
+                fingerprints[index] = None
+        except (OSError, EOFError, ValueError, KeyError, TypeError, IndexError, AttributeError):
+            return None
+        return header, FingerprintIndex(fingerprints)
@@ -1,15 +1,150 @@
 from datetime import datetime as DateTime
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from typing import Callable, Iterable, List, Union
 import re
 
 
+# How many distinct strings each locale remembers having parsed. Dates in particular repeat a lot (every transaction
+# of a given day has the same one), so this saves most of the parsing when reading whole tables.
+PARSE_CACHE_SIZE = 4096
+
+_ASCII_DIGITS = frozenset("0123456789")
+_ASCII_DIGITS_AND_DOTS = frozenset("0123456789.")
+
+
+class Money(Enum):
+    """
+    How amounts of money are represented in Transaction, CategoryTransfer, the dashboard, etc.
+    """
+    FLOAT = "float"  # e.g. 12.5 - what this API has always used, and still does by default
+    DECIMAL = "decimal"  # e.g. Decimal("12.50")
+    CENTS = "cents"  # e.g. 1250 - an integer amount of cents (or whatever the smallest unit of the currency is)
+
+
+def _currency_parser(symbol: str, pattern) -> Callable[[str, Money], Union[float, Decimal, int]]:
+    """
+    Builds a parse_currency for a locale: "" is 0, and "-€1.234,56" (for symbol "€") is -1234.56,
+    Decimal("-1234.56") or -123456, depending on the Money asked for.
+
+    The usual shape of such strings is parsed by hand, and anything else is left to the regex, which makes the final
+    call on what is valid (and what exception is raised if it isn't).
+    """
+    @lru_cache(maxsize=PARSE_CACHE_SIZE)
+    def parse_currency(string: str, money: Money = Money.FLOAT) -> Union[float, Decimal, int]:
+        if string == "":
+            return Decimal(0) if money is Money.DECIMAL else 0
+        start = 1 if string[0] == "-" else 0
+        if string.startswith(symbol, start) and len(string) >= start + len(symbol) + 4 and string[-3] == "," \
+                and _ASCII_DIGITS_AND_DOTS.issuperset(string[start+len(symbol):-3]) \
+                and _ASCII_DIGITS.issuperset(string[-2:]):
+            s, i, w = string[:start], string[start+len(symbol):-3], string[-2:]
+        else:
+            s, i, w = re.match(pattern, string).groups()
+        if money is Money.FLOAT:
+            return float("{}{}.{}".format(s, i.replace(".",""), w))
+        elif money is Money.CENTS:
+            return int("{}{}{}".format(s, i.replace(".",""), w))
+        else:
+            return Decimal("{}{}.{}".format(s, i.replace(".",""), w))
+
+    return parse_currency
+
+
+def to_cents(amount: Union[float, Decimal, int], money: Money = Money.FLOAT) -> int:
+    """
+    :return: amount (represented as given by money) as an integer amount of cents, rounded to the closest one
+    """
+    if money is Money.FLOAT:
+        return round(amount*100)
+    elif money is Money.CENTS:
+        return amount
+    else:
+        return int((Decimal(amount)*100).to_integral_value())
+
+
+def from_cents(cents: int, money: Money = Money.FLOAT) -> Union[float, Decimal, int]:
+    """
+    :return: an integer amount of cents, represented as given by money
+    """
+    if money is Money.FLOAT:
+        return cents/100
+    elif money is Money.CENTS:
+        return cents
+    else:
+        return Decimal(cents).scaleb(-2)
+
+
+def _currency_formatter(symbol: str) -> Callable[[Union[float, Decimal, int], Money], str]:
+    """
+    Builds a format_currency for a locale, which writes amounts rounded to the cent - e.g. -1234.5 as "-€1234,50" (for
+    symbol "€") - and anything that rounds to 0 as "", same as the sheet leaves it.
+    """
+    def format_currency(amount: Union[float, Decimal, int], money: Money = Money.FLOAT) -> str:
+        cents = to_cents(amount, money)
+        if cents == 0:
+            return ""
+        units, cents = divmod(abs(cents), 100)
+        return "{}{}{},{:02d}".format("-" if amount < 0 else "", symbol, units, cents)
+
+    return format_currency
+
+
+def _date_parser(order: str, long_format: str, short_format: str) -> Callable[[str], DateTime]:
+    """
+    Builds a parse_date for a locale, which should accept the same strings as
+        DateTime.strptime(string, long_format), or failing that DateTime.strptime(string, short_format)
+    where the formats are e.g. "%d/%m/%Y" and "%d/%m/%y" for order "dmy".
+
+    strptime is slow (it goes through a regex built from the format, a lock and a bunch of python), so dates made of
+    plain digits are parsed by hand instead - following its rules: one or two digits for the day and month, and either
+    four digits for the year, or two for a year between 1969 and 2068. Anything else, including dates that don't
+    exist, is left to strptime, so that it raises the same errors it always has.
+    """
+    day_position, month_position, year_position = order.index("d"), order.index("m"), order.index("y")
+
+    def parse_with_strptime(string: str) -> DateTime:
+        try:
+            return DateTime.strptime(string, long_format)
+        except ValueError:
+            return DateTime.strptime(string, short_format)
+
+    @lru_cache(maxsize=PARSE_CACHE_SIZE)
+    def parse_date(string: str) -> DateTime:
+        parts = string.split("/")
+        if len(parts) == 3 and all(part and _ASCII_DIGITS.issuperset(part) for part in parts):
+            day, month, year = parts[day_position], parts[month_position], parts[year_position]
+            if len(day) <= 2 and len(month) <= 2 and len(year) in (2, 4) \
+                    and 1 <= int(day) <= 31 and 1 <= int(month) <= 12:
+                year_number = int(year)
+                if len(year) == 2:
+                    year_number += 2000 if year_number <= 68 else 1900
+                try:
+                    return DateTime(year_number, int(month), int(day))
+                except ValueError:
+                    pass
+        return parse_with_strptime(string)
+
+    return parse_date
+
+
 class AbstractLocale:
+    """
+    Amounts of money are floats unless the Money to use is given - see Money.
+
+    parse_currency and parse_date remember the last PARSE_CACHE_SIZE strings they were given (see
+    functools.lru_cache), and parse_currency_many and parse_date_many do the same for a whole column at once.
+    """
+
+    currency_symbol = None
 
     @staticmethod
-    def parse_currency(string: str) -> float:
+    def parse_currency(string: str, money: Money = Money.FLOAT) -> Union[float, Decimal, int]:
         raise NotImplementedError()
 
     @staticmethod
-    def format_currency(amount: float) -> str:
+    def format_currency(amount: Union[float, Decimal, int], money: Money = Money.FLOAT) -> str:
         raise NotImplementedError()
 
     @staticmethod
@@ -20,33 +155,26 @@ class AbstractLocale:
     def format_date(amount: DateTime) -> str:
         raise NotImplementedError()
 
+    @classmethod
+    def parse_currency_many(cls, strings: Iterable[str],
+                            money: Money = Money.FLOAT) -> List[Union[float, Decimal, int]]:
+        parse_currency = cls.parse_currency
+        return [parse_currency(string, money) for string in strings]
 
-class EuropeLocale(AbstractLocale):
+    @classmethod
+    def parse_date_many(cls, strings: Iterable[str]) -> List[DateTime]:
+        parse_date = cls.parse_date
+        return [parse_date(string) for string in strings]
 
-    currency_parser = re.compile(r"^(-?)€([\d.]+),(\d\d)$")
 
-    @staticmethod
-    def parse_currency(string: str) -> float:
-        if string == "":
-            return 0
-        s, i, w = re.match(EuropeLocale.currency_parser, string).groups()
-        return float("{}{}.{}".format(s, i.replace(".",""), w))
+class EuropeLocale(AbstractLocale):
 
-    @staticmethod
-    def format_currency(amount: float) -> str:
-        if amount == 0:
-            return ""
-        elif amount > 0:
-            return "€{}".format(str(amount).replace(".", ","))
-        else:
-            return "-€{}".format(str(-amount).replace(".", ","))
+    currency_symbol = "€"
+    currency_parser = re.compile(r"^(-?)€([\d.]+),(\d\d)$")
 
-    @staticmethod
-    def parse_date(string: str) -> DateTime:
-        try:
-            return DateTime.strptime(string, "%d/%m/%Y")
-        except ValueError:
-            return DateTime.strptime(string, "%d/%m/%y")
+    parse_currency = staticmethod(_currency_parser(currency_symbol, currency_parser))
+    format_currency = staticmethod(_currency_formatter(currency_symbol))
+    parse_date = staticmethod(_date_parser("dmy", "%d/%m/%Y", "%d/%m/%y"))
 
     @staticmethod
     def format_date(date: DateTime) -> str:
@@ -55,30 +183,12 @@ class EuropeLocale(AbstractLocale):
 
 class USLocale(AbstractLocale):
 
+    currency_symbol = "$"
     currency_parser = re.compile(r"^(-?)\$([\d.]+),(\d\d)$")
 
-    @staticmethod
-    def parse_currency(string: str) -> float:
-        if string == "":
-            return 0
-        s, i, w = re.match(USLocale.currency_parser, string).groups()
-        return float("{}{}.{}".format(s, i.replace(".",""), w))
-
-    @staticmethod
-    def format_currency(amount: float) -> str:
-        if amount == 0:
-            return ""
-        elif amount > 0:
-            return "${}".format(str(amount).replace(".", ","))
-        else:
-            return "-${}".format(str(-amount).replace(".", ","))
-
-    @staticmethod
-    def parse_date(string: str) -> DateTime:
-        try:
-            return DateTime.strptime(string, "%m/%d/%Y")
-        except ValueError:
-            return DateTime.strptime(string, "%m/%d/%y")
+    parse_currency = staticmethod(_currency_parser(currency_symbol, currency_parser))
+    format_currency = staticmethod(_currency_formatter(currency_symbol))
+    parse_date = staticmethod(_date_parser("mdy", "%m/%d/%Y", "%m/%d/%y"))
 
     @staticmethod
     def format_date(date: DateTime) -> str:
@@ -87,31 +197,12 @@ class USLocale(AbstractLocale):
 
 class ChinaLocale(AbstractLocale):
 
+    currency_symbol = "¥"
     currency_parser = re.compile(r"^(-?)¥([\d.]+),(\d\d)$")
 
-    @staticmethod
-    def parse_currency(string: str) -> float:
-        if string == "":
-            return 0
-        s, i, w = re.match(ChinaLocale.currency_parser, string).groups()
-        return float("{}{}.{}".format(s, i.replace(".",""), w))
-
-    @staticmethod
-    def format_currency(amount: float) -> str:
-
-        if amount == 0:
-            return ""
-        elif amount > 0:
-            return "¥{}".format(str(amount).replace(".", ","))
-        else:
-            return "-¥{}".format(str(-amount).replace(".", ","))
-
-    @staticmethod
-    def parse_date(string: str) -> DateTime:
-        try:
-            return DateTime.strptime(string, "%Y/%m/%d")
-        except ValueError:
-            return DateTime.strptime(string, "%y/%m/%d")
+    parse_currency = staticmethod(_currency_parser(currency_symbol, currency_parser))
+    format_currency = staticmethod(_currency_formatter(currency_symbol))
+    parse_date = staticmethod(_date_parser("ymd", "%Y/%m/%d", "%y/%m/%d"))
 
     @staticmethod
     def format_date(date: DateTime) -> str:
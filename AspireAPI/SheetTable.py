@@ -0,0 +1,1079 @@
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import copy_context
+from datetime import datetime as Datetime
+from decimal import Decimal
+from enum import Enum
+from functools import lru_cache
+from itertools import compress, islice, repeat, zip_longest
+from typing import Callable, Iterator, List, Optional, Tuple, Type
+
+from AspireAPI.FingerprintIndex import FingerprintIndex
+from AspireAPI.Locale import Locale, Money, PARSE_CACHE_SIZE, to_cents, from_cents
+from AspireAPI.sheets.A1Notation import column_index, column_letters
+from AspireAPI.sheets.AspireSheetInterface import AspireSheetInterface
+from AspireAPI.sheets.AspireSpreadsheetInterface import SheetWrite
+from AspireAPI.sheets.Tracing import traced
+
+
+# The codecs below say how each column of a table is handled: parse/format read/write a cell of the sheet (and
+# parse_many/format_many a whole column at once), and pack/unpack (and unpack_many) store values in the local copy of
+# the table - in an array of the given typecode (or a list, if None), where empty rows hold .empty
+
+
+def _convert_distinct(convert: Callable, values, money: Money) -> list:
+    # columns tend to repeat a lot of values (dates, amounts...), so each distinct one is only converted once
+    distinct = {value: convert(value, money) for value in set(values)}
+    return list(map(distinct.__getitem__, values))
+
+
+class _DateCodec:
+    """
+    A column of dates - kept in the local copy of a table as their ordinal (see datetime.toordinal), since the sheet
+    doesn't hold times anyway.
+    """
+    typecode = "i"
+    empty = 0
+
+    @staticmethod
+    def parse(string: str, money: Money) -> Datetime:
+        return Locale.parse_date(string)
+
+    @staticmethod
+    def format(date: Datetime, money: Money) -> str:
+        return Locale.format_date(date)
+
+    def parse_many(self, strings, money: Money) -> List[Datetime]:
+        return _convert_distinct(self.parse, strings, money)
+
+    def format_many(self, dates, money: Money) -> List[str]:
+        return _convert_distinct(self.format, dates, money)
+
+    @staticmethod
+    def pack(date: Datetime, money: Money) -> int:
+        return date.toordinal()
+
+    @staticmethod
+    @lru_cache(maxsize=PARSE_CACHE_SIZE)
+    def unpack(ordinal: int, money: Money) -> Datetime:
+        return Datetime.fromordinal(ordinal)
+
+    def unpack_many(self, ordinals, money: Money) -> List[Datetime]:
+        return _convert_distinct(self.unpack, ordinals, money)
+
+
+class _MoneyCodec:
+    """
+    A column of amounts of money - kept in the local copy of a table as integer cents.
+    """
+    typecode = "q"
+    empty = 0
+
+    @staticmethod
+    def parse(string: str, money: Money):
+        return Locale.parse_currency(string, money)
+
+    @staticmethod
+    def format(amount, money: Money) -> str:
+        return Locale.format_currency(amount, money)
+
+    @staticmethod
+    def parse_many(strings, money: Money) -> list:
+        # most rows leave one of their amounts empty (e.g. a transaction has an outflow or an inflow, not both)
+        distinct = {string: Locale.parse_currency(string, money) for string in set(strings) if string != ""}
+        distinct[""] = Decimal(0) if money is Money.DECIMAL else 0
+        return list(map(distinct.__getitem__, strings))
+
+    def format_many(self, amounts, money: Money) -> List[str]:
+        return _convert_distinct(self.format, amounts, money)
+
+    @staticmethod
+    def pack(amount, money: Money) -> int:
+        return to_cents(amount, money)
+
+    @staticmethod
+    def unpack(cents: int, money: Money):
+        if cents == 0:
+            # the sheet leaves zeros empty, and that is what reading an empty cell gives (see parse_currency)
+            return Decimal(0) if money is Money.DECIMAL else 0
+        return from_cents(cents, money)
+
+    def unpack_many(self, cents, money: Money) -> list:
+        return _convert_distinct(self.unpack, cents, money)
+
+
+class _TextCodec:
+    """
+    A column of plain text.
+    """
+    typecode = None
+    empty = ""
+
+    @staticmethod
+    def parse(string: str, money: Money) -> str:
+        return string
+
+    @staticmethod
+    def format(string: str, money: Money) -> str:
+        return string
+
+    @staticmethod
+    def parse_many(strings, money: Money) -> List[str]:
+        return list(strings)
+
+    @staticmethod
+    def format_many(strings, money: Money) -> List[str]:
+        return list(strings)
+
+    @staticmethod
+    def pack(string: str, money: Money) -> str:
+        return string
+
+    @staticmethod
+    def unpack(string: str, money: Money) -> str:
+        return string
+
+    @staticmethod
+    def unpack_many(strings: List[str], money: Money) -> List[str]:
+        return list(strings)
+
+
+class EnumCodec:
+    """
+    A column of the members of an Enum, written as their values - kept in the local copy of a table as their position
+    within the Enum.
+    """
+    typecode = "B"
+    empty = 0
+
+    def __init__(self, enum: Type[Enum]):
+        self._enum = enum
+        self._members = list(enum)
+        self._by_value = {member.value: member for member in self._members}
+        self._codes = {member: code for code, member in enumerate(self._members)}
+
+    def parse(self, string: str, money: Money) -> Enum:
+        member = self._by_value.get(string)
+        # the enum itself raises the usual error for values that aren't in it
+        return self._enum(string) if member is None else member
+
+    def format(self, member: Enum, money: Money) -> str:
+        return member.value
+
+    def parse_many(self, strings, money: Money) -> List[Enum]:
+        by_value = self._by_value
+        try:
+            return [by_value[string] for string in strings]
+        except KeyError:
+            # one of them isn't in the enum, so go through them one by one for the usual error
+            return [self.parse(string, money) for string in strings]
+
+    @staticmethod
+    def format_many(members, money: Money) -> List[str]:
+        return [member.value for member in members]
+
+    def pack(self, member: Enum, money: Money) -> int:
+        return self._codes[member]
+
+    def unpack(self, code: int, money: Money) -> Enum:
+        return self._members[code]
+
+    def unpack_many(self, codes, money: Money) -> List[Enum]:
+        return list(map(self._members.__getitem__, codes))
+
+
+DATE = _DateCodec()
+MONEY = _MoneyCodec()
+TEXT = _TextCodec()
+# Same as TEXT, except that it is written to the sheet as is, rather than as if typed in by hand - which would e.g. turn
+# "00123" into 123, or "=1+1" into 2 - so that it reads back the same (see TableSchema.typed_rows). For free-form
+# text, such as memos
+RAW_TEXT = _TextCodec()
+
+
+class TableSchema:
+    """
+    What SheetTable needs to know about a table:
+    - name: what to call it in error messages, e.g. "transactions"
+    - row_type: the namedtuple its rows are read into
+    - first_column: letter(s) of its first column; the rest follow, one per codec
+    - table_start: row number (as in A1 notation) of its first row
+    - codecs: how each column is read, written and stored - DATE, MONEY, TEXT, RAW_TEXT or an EnumCodec. The first
+      column must be the date, which the rows are sorted by
+    - fingerprint: function (row, money) -> int, as used by the fingerprint index
+    - min_cells: rows with fewer cells than this (but not empty) are badly formatted
+    """
+
+    def __init__(self, name: str, row_type: type, first_column: str, table_start: int, codecs: list,
+                 fingerprint: Callable[[tuple, Money], int], min_cells=0):
+        self.name = name
+        self.row_type = row_type
+        self.first_column = first_column
+        self.last_column = column_letters(column_index(first_column)+len(codecs)-1)
+        self.table_start = table_start
+        self.codecs = codecs
+        self.fingerprint = fingerprint
+        self.min_cells = min_cells
+        # text is left as it is, so only the other columns need parsing
+        self._parsers = [(position, codec.parse) for position, codec in enumerate(codecs)
+                         if codec is not TEXT and codec is not RAW_TEXT]
+        self._raw_positions = [position for position, codec in enumerate(codecs) if codec is RAW_TEXT]
+
+    def row_to_item(self, row: list, money: Money = Money.FLOAT) -> Optional[tuple]:
+        """
+        :param row: a row of the table, as read from the sheet (the API leaves out trailing empty cells)
+        :return: the row as a row_type, or None if it's empty
+        """
+        if row == []:
+            return None
+        if len(row) < self.min_cells:
+            raise Exception("Badly formatted row")
+        if len(row) < len(self.codecs):
+            values = row + [""] * (len(self.codecs)-len(row))
+        else:
+            values = list(row)
+        for position, parse in self._parsers:
+            values[position] = parse(values[position], money)
+        return self.row_type._make(values)
+
+    def item_to_row(self, item: Optional[tuple], money: Money = Money.FLOAT) -> list:
+        """
+        Inverse of row_to_item
+        """
+        if item is None:
+            return []
+        return [codec.format(value, money) for codec, value in zip(self.codecs, item)]
+
+    def typed_rows(self, rows: List[list]) -> List[list]:
+        """
+        :param rows: rows as given by item_to_row/items_to_rows, i.e. as they are to read back from the sheet
+        :return: the rows as they have to be typed into the sheet (see AspireSpreadsheetInterface.set) to read back as
+                 they are - which takes an apostrophe in front of the values of RAW_TEXT columns, telling the sheet
+                 that they are text (and which isn't kept as part of the value)
+        """
+        if not self._raw_positions:
+            return rows
+        typed = []
+        for row in rows:
+            row = list(row)
+            for position in self._raw_positions:
+                if position < len(row) and row[position] != "":
+                    row[position] = "'" + row[position]
+            typed.append(row)
+        return typed
+
+    def rows_to_items(self, rows: List[list], money: Money = Money.FLOAT) -> List[Optional[tuple]]:
+        """
+        Same as [row_to_item(row, money) for row in rows], but parsing each column of the block in one go (see the
+        codecs' parse_many), which is several times faster for big blocks.
+        """
+        present = list(map(bool, rows))
+        filled = rows if all(present) else list(compress(rows, present))
+        if not filled:
+            return [None] * len(rows)
+        if self.min_cells and min(map(len, filled)) < self.min_cells:
+            raise Exception("Badly formatted row")
+        # transposed, with the trailing empty cells left out by the API filled back in
+        qt_columns = len(self.codecs)
+        columns = list(islice(zip_longest(*filled, fillvalue=""), qt_columns))
+        columns.extend([("",) * len(filled)] * (qt_columns-len(columns)))
+        columns = [codec.parse_many(column, money) for codec, column in zip(self.codecs, columns)]
+        # same as row_type._make, without a python call per row
+        items = list(map(tuple.__new__, repeat(self.row_type, len(filled)), zip(*columns)))
+        if len(items) == len(rows):
+            return items
+        items = iter(items)
+        return [next(items) if row else None for row in rows]
+
+    def items_to_rows(self, items: List[Optional[tuple]], money: Money = Money.FLOAT) -> List[list]:
+        """
+        Same as [item_to_row(item, money) for item in items], but formatting each column in one go
+        """
+        present = [item for item in items if item is not None]
+        if not present:
+            return [[] for _ in items]
+        columns = [codec.format_many(column, money) for codec, column in zip(self.codecs, zip(*present))]
+        rows = list(map(list, zip(*columns)))
+        if len(rows) == len(items):
+            return rows
+        rows = iter(rows)
+        return [[] if item is None else next(rows) for item in items]
+
+
+class CompactRows:
+    """
+    The local copy of a table in cached mode. Rather than as a list of namedtuples (each holding a datetime, floats, an
+    Enum...), the rows are kept column by column, each column in an array of plain numbers (or a list of strings) as
+    given by the codecs of the schema - plus a bytearray telling which rows are empty. This takes a fraction of the
+    memory, and rows are only turned back into namedtuples when read.
+
+    Rows after the last non-empty one aren't kept, so len() is the number of rows up to it.
+    """
+
+    __slots__ = ("_schema", "_money", "_present", "_columns")
+
+    def __init__(self, schema: TableSchema, money: Money, items: List[Optional[tuple]] = ()):
+        self._schema = schema
+        self._money = money
+        self._present = bytearray()
+        self._columns = [[] if codec.typecode is None else array(codec.typecode) for codec in schema.codecs]
+        self.assign(0, items)
+
+    def __len__(self):
+        return len(self._present)
+
+    def __getitem__(self, index: int) -> Optional[tuple]:
+        if index >= len(self._present) or not self._present[index]:
+            return None
+        money = self._money
+        return self._schema.row_type._make([codec.unpack(column[index], money)
+                                            for codec, column in zip(self._schema.codecs, self._columns)])
+
+    def slice(self, start: int, stop: int) -> List[Optional[tuple]]:
+        """
+        :return: the rows from start up to (but not including) stop, as namedtuples (or None for empty ones)
+        """
+        if start >= stop:
+            return []
+        items = [None] * (stop-start)
+        stop_present = min(stop, len(self._present))
+        if start >= stop_present:
+            return items
+        money = self._money
+        present = self._present[start:stop_present]
+        all_present = 0 not in present
+        unpacked = []
+        for codec, column in zip(self._schema.codecs, self._columns):
+            values = column[start:stop_present]
+            if not all_present:
+                # empty rows hold codec.empty, which needn't be something that can be unpacked (e.g. date ordinal 0)
+                values = list(compress(values, present))
+            unpacked.append(codec.unpack_many(values, money))
+        # same as row_type._make, without a python call per row
+        rows = map(tuple.__new__, repeat(self._schema.row_type, len(unpacked[0])), zip(*unpacked))
+        if all_present:
+            items[:stop_present-start] = rows
+        else:
+            items[:stop_present-start] = [next(rows) if row_present else None for row_present in present]
+        return items
+
+    def first_empty(self) -> int:
+        """
+        :return: index of the first empty row
+        """
+        index = self._present.find(0)
+        return len(self._present) if index == -1 else index
+
+    def _extend(self, length: int):
+        qt_rows = length-len(self._present)
+        self._present.extend(bytes(qt_rows))
+        for codec, column in zip(self._schema.codecs, self._columns):
+            column.extend([codec.empty] * qt_rows)
+
+    def _trim(self):
+        length = len(self._present)
+        while length > 0 and not self._present[length-1]:
+            length -= 1
+        if length < len(self._present):
+            del self._present[length:]
+            for column in self._columns:
+                del column[length:]
+
+    def assign(self, start: int, items: List[Optional[tuple]]):
+        """
+        Sets the rows from start onwards (None to empty them)
+        """
+        stop = start+len(items)
+        if len(self._present) < stop:
+            self._extend(stop)
+        money = self._money
+        self._present[start:stop] = bytes(0 if item is None else 1 for item in items)
+        for position, (codec, column) in enumerate(zip(self._schema.codecs, self._columns)):
+            empty, pack = codec.empty, codec.pack
+            values = [empty if item is None else pack(item[position], money) for item in items]
+            column[start:stop] = values if codec.typecode is None else array(codec.typecode, values)
+        self._trim()
+
+    def insert(self, start: int, qt_rows: int):
+        """
+        Inserts qt_rows empty rows at start, shifting down everything from there on
+        """
+        if start >= len(self._present):
+            return
+        self._present[start:start] = bytes(qt_rows)
+        for codec, column in zip(self._schema.codecs, self._columns):
+            empties = [codec.empty] * qt_rows
+            column[start:start] = empties if codec.typecode is None else array(codec.typecode, empties)
+
+    def delete(self, start: int, stop: int):
+        """
+        Deletes the rows from start up to (but not including) stop, shifting up everything below them
+        """
+        del self._present[start:stop]
+        for column in self._columns:
+            del column[start:stop]
+        self._trim()
+
+
+class SheetTable:
+    """
+    The machinery shared by the tables of the spreadsheet (Transactions and CategoryTransfers), each of which is
+    described by a TableSchema - its columns, where it starts, and how its cells are read and written.
+
+    This API has the sheet behave somewhat like a stack, supporting
+    - Get (.__getitem__, .batch_get)
+    - Push (.push, .batch_push)
+    - Insert (.insert, .batch_insert, and .insert_sorted, .batch_insert_sorted to keep the rows sorted by date)
+    - Pop (.pop, .batch_pop)
+    - Replace (.replace, .batch_replace)
+
+    # Indexing
+
+    Nonnegative indices are interpreted as referring to rows, with the first one being index 0 and ascending
+    indefinitely. Negative indices refer to rows, with -1 referring to the last *nonempty* row and going backwards
+    from there - until the beginning of the table, at which point negative indices become invalid.
+
+    # Private methods and the normal form
+
+    The stack behaviour of the sheet requires that the sheet is in a particular form at the beginning (and
+    also end) of each operation - namely, all rows are valid and adjacent, i.e. from the first point that there is an
+    empty row, there are no more non-empty rows. That this is indeed the case can be verified by asserting
+    .is_healthy(). The public attribute .first_empty_index always has the index of the first empty row.
+
+    Note that assuming that this state is indeed present at the start and must be kept through to the end of each
+    of the eight methods above affects the implementation of these methods. More importantly, the private auxiliary
+    methods for setting and clearing do not follow this philosophy - before or after their execution, the sheet
+    may not be in the normal form described above. These are:
+    - Generic get (._generic_get, _batch_generic_get)
+    - Set (._set, ._batch_set)
+    - Clear (._clear, ._batch_clear)
+
+    # Cached mode
+
+    If constructed with cached=True, the whole table is read once and kept in memory (see CompactRows). From then on
+    all reads are served from this local copy, and all writes are applied both to it and to the sheet. This is only
+    correct as long as nothing else modifies the table in the meantime - .revalidate can be used to cheaply check that
+    this is the case, and .resync to unconditionally reload it.
+
+    # Amounts of money
+
+    Amounts are read and written as given by .money (see Locale.Money) - floats by default, or, to have them be exact,
+    Decimals or integer cents. Either way, they are written rounded to the cent.
+
+    # Fingerprint index
+
+    .find, .find_all, .count, .contains (and `in`) and .duplicates look rows up by their fingerprint (see
+    TableSchema), through an index of the fingerprints of every row (see AspireAPI.FingerprintIndex). It is built the
+    first time one of them is used - reading the whole table, unless in cached mode - and from then on kept up to date
+    by every write made through this object, so that lookups take no queries at all. As with cached mode, this is only
+    correct as long as nothing else modifies the table; .resync drops the index, to be rebuilt when next needed.
+    .save_index and .load_index keep it between runs, as long as the spreadsheet hasn't changed in the meantime.
+    """
+
+    _SCHEMA: TableSchema = None
+
+    @traced
+    def __init__(self, sheet_interface: AspireSheetInterface, cached=False, money: Money = Money.FLOAT,
+                 rows: Optional[CompactRows] = None):
+        """
+        :param rows: local copy of the table to start from (e.g. one loaded from a snapshot, see AspireAPI.Snapshot),
+                     rather than reading it from the sheet. Implies cached mode, and that it is never dropped (see
+                     ._write), since it may not be possible to read it again from the sheet
+        """
+        self._sheet = sheet_interface
+        self._cached = cached or rows is not None
+        self._keep_mirror = rows is not None
+        self.money = money
+        self._mirror = None
+        self._index = None
+        if rows is None:
+            self.resync()
+        else:
+            self._mirror = rows
+            self.first_empty_index = rows.first_empty()
+
+    def _row_to_item(self, row: list) -> Optional[tuple]:
+        return self._SCHEMA.row_to_item(row, self.money)
+
+    def _rows_to_items(self, rows: List[list]) -> List[Optional[tuple]]:
+        return self._SCHEMA.rows_to_items(rows, self.money)
+
+    def _items_to_rows(self, items: List[Optional[tuple]]) -> List[list]:
+        return self._SCHEMA.items_to_rows(items, self.money)
+
+    def _cell_range(self, row_index_1: int, row_index_2: Optional[int] = None) -> str:
+        """
+        :return: the range (in A1 notation) of the table's columns from row row_index_1 to row_index_2 - or to the end
+                 of the sheet, if it's None
+        """
+        return "{}{}:{}{}".format(self._SCHEMA.first_column, row_index_1, self._SCHEMA.last_column,
+                                  "" if row_index_2 is None else row_index_2)
+
+    def _find_first_empty_index(self) -> int:
+        return self._sheet.find_first_empty_row(self._SCHEMA.first_column, self._SCHEMA.table_start) \
+            - self._SCHEMA.table_start
+
+    @traced
+    def resync(self):
+        """
+        Rediscovers .first_empty_index (and, in cached mode, reloads the local copy of the table) from the sheet. Only
+        needed if the sheet was modified by something other than this object (or if a batch of writes made through it
+        was discarded).
+        """
+        self._index = None
+        if self._cached:
+            self._load_mirror()
+        else:
+            self.first_empty_index = self._find_first_empty_index()
+
+    def _load_mirror(self):
+        self._index = None
+        rows = self._sheet.get(self._cell_range(self._SCHEMA.table_start))
+        self._mirror = CompactRows(self._SCHEMA, self.money, self._rows_to_items(rows))
+        self.first_empty_index = self._mirror.first_empty()
+
+    def _get_mirror(self) -> CompactRows:
+        if self._mirror is None:
+            self._load_mirror()
+        return self._mirror
+
+    def _mirror_slice(self, row_index_1: int, row_index_2: int) -> List[Optional[tuple]]:
+        return self._get_mirror().slice(row_index_1-self._SCHEMA.table_start, row_index_2-self._SCHEMA.table_start+1)
+
+    def _mirror_assign(self, row_index: int, items: List[Optional[tuple]]):
+        self._get_mirror().assign(row_index-self._SCHEMA.table_start, items)
+
+    @traced
+    def revalidate(self, tail_rows=20) -> bool:
+        """
+        In cached mode, checks whether the local copy of the table still matches the sheet, reloading it if it
+        doesn't. This takes a single query, which compares the last tail_rows rows of the table and checks that
+        the row right after them is still empty - so it catches rows being added, removed or modified at the end
+        of the table, but not modifications further up.
+
+        :return: whether the local copy was still up to date (always True outside of cached mode)
+        """
+        if not self._cached:
+            return True
+        row_index_1 = self._localize_index(max(0, self.first_empty_index-tail_rows))
+        row_index_2 = self._localize_index(self.first_empty_index)
+        items = self._sheet.get(self._cell_range(row_index_1, row_index_2))
+        items = self._rows_to_items(items)
+        if len(items) < row_index_2 - row_index_1 + 1:
+            items.extend([None] * (row_index_2 - row_index_1 + 1 - len(items)))
+        if items != self._mirror_slice(row_index_1, row_index_2):
+            self._load_mirror()
+            return False
+        return True
+
+    def _localize_index(self, index: int):
+        if index >= 0:
+            row_index = index+self._SCHEMA.table_start
+        else:
+            row_index = index+self._SCHEMA.table_start+self.first_empty_index
+        if row_index < self._SCHEMA.table_start:
+            raise IndexError("Tried to access an index before the start of the {} table".format(self._SCHEMA.name))
+        return row_index
+
+    def __setitem__(self, *args, **kwargs):
+        raise Exception("{0} does not support externally setting by index."
+                        " Please use {0}.push, {0}.insert, {0}.replace"
+                        " or their batched versions."
+                        " Don't use ._set or _batch_set unless you're sure you know what you're doing."
+                        .format(type(self).__name__))
+
+    def _generic_get(self, index: int) -> Optional[tuple]:
+        row_index = self._localize_index(index)
+        if self._cached:
+            return self._get_mirror()[row_index-self._SCHEMA.table_start]
+        item = self._sheet.get(self._cell_range(row_index, row_index))
+        return self._row_to_item(item[0]) if item else None
+
+    def _generic_batch_get(self, first_index: int, last_index: int) -> List[Optional[tuple]]:
+        if first_index > last_index:
+            return []
+        if first_index < 0 <= last_index:
+            raise IndexError("{}._generic_batch_get does not support indexing"
+                             " from the negative to the nonnegative part".format(type(self).__name__))
+
+        row_index_1 = self._localize_index(first_index)
+        row_index_2 = self._localize_index(last_index)
+        if self._cached:
+            return self._mirror_slice(row_index_1, row_index_2)
+
+        items = self._sheet.get(self._cell_range(row_index_1, row_index_2))
+        items = self._rows_to_items(items)
+        if len(items) < row_index_2 - row_index_1 + 1:
+            items.extend([None] * (row_index_2 - row_index_1 + 1 - len(items)))
+        return items
+
+    def _set(self, index: int, item: tuple, ensure_no_overwrite=True):
+        if ensure_no_overwrite:
+            if self._generic_get(index) is not None:
+                raise Exception(
+                    "Attempted to overwrite in {}, at index"
+                    " {}\n\tOriginal data:{}\n\tWritten data:{}".format(self._SCHEMA.name, index, self[index], item)
+                )
+
+        with self._write() as writes:
+            writes.append(self._batch_set_write(index, [item]))
+
+    def _batch_set(self, start_index: int, items: List[tuple], ensure_no_overwrite=True):
+        if ensure_no_overwrite:
+            end_index = start_index + len(items) - 1
+            if self._generic_batch_get(start_index, end_index) != [None]*len(items):
+                raise Exception(
+                    "Attempted to overwrite in {},"
+                    " from indices {} to {}".format(self._SCHEMA.name, start_index, end_index)
+                )
+
+        with self._write() as writes:
+            writes.append(self._batch_set_write(start_index, items))
+
+    def _batch_set_write(self, start_index: int, items: List[tuple]) -> SheetWrite:
+        row_index_1 = self._localize_index(start_index)
+        row_index_2 = row_index_1+len(items)-1
+
+        data = self._items_to_rows(items)
+        if self._cached:
+            # what the sheet will hold, and so what reading it back would give - amounts rounded to the cent, etc.
+            self._mirror_assign(row_index_1, self._rows_to_items(data))
+        if self._index is not None:
+            self._index.assign(row_index_1-self._SCHEMA.table_start,
+                               [None if item is None else self._fingerprint(item) for item in items])
+        return self._sheet.set_write(self._cell_range(row_index_1, row_index_2), self._SCHEMA.typed_rows(data))
+
+    @contextmanager
+    def _write(self) -> Iterator[List[SheetWrite]]:
+        """
+        Collects the writes built within the with block by ._batch_set_write/._batch_clear_write/... (which apply them
+        to the local copy of the table as they are built, in cached mode), and sends them all at the end of it. If
+        anything fails before they are through - building them included - the local copy is dropped, to be reloaded
+        when next needed (unless it was given to the constructor, in which case it's up to whoever gave it to make sure
+        it can't be left half-modified).
+        """
+        writes = []
+        try:
+            yield writes
+            self._sheet.batch_write(writes)
+        except BaseException:
+            if not self._keep_mirror:
+                self._mirror = None
+            self._index = None
+            raise
+
+    def _clear(self, index: int, ensure_nonempty=True):
+        if ensure_nonempty:
+            if self._generic_get(index) is None:
+                raise Exception("Attempted to clear empty row @ index {}".format(index))
+        with self._write() as writes:
+            writes.append(self._batch_clear_write(index, index))
+
+    def _batch_clear(self, first_index: int, last_index: int, ensure_nonempty=True):
+        if ensure_nonempty:
+            if None in self._generic_batch_get(first_index, last_index):
+                raise Exception("Attempted to clear empty row between indices {}, {}".format(first_index, last_index))
+        with self._write() as writes:
+            writes.append(self._batch_clear_write(first_index, last_index))
+
+    def _batch_clear_write(self, first_index: int, last_index: int) -> SheetWrite:
+        row_index_1 = self._localize_index(first_index)
+        row_index_2 = self._localize_index(last_index)
+        if self._cached:
+            self._mirror_assign(row_index_1, [None] * (row_index_2-row_index_1+1))
+        if self._index is not None:
+            self._index.assign(row_index_1-self._SCHEMA.table_start, [None] * (row_index_2-row_index_1+1))
+        return self._sheet.clear_write(self._cell_range(row_index_1, row_index_2))
+
+    def _batch_insert_write(self, start_index: int, qt_rows: int) -> SheetWrite:
+        row_index_1 = self._localize_index(start_index)
+        row_index_2 = row_index_1+qt_rows-1
+        if self._cached:
+            self._get_mirror().insert(row_index_1-self._SCHEMA.table_start, qt_rows)
+        if self._index is not None:
+            self._index.insert(row_index_1-self._SCHEMA.table_start, qt_rows)
+        return self._sheet.insert_write(self._cell_range(row_index_1, row_index_2))
+
+    def _batch_delete_write(self, first_index: int, last_index: int) -> SheetWrite:
+        row_index_1 = self._localize_index(first_index)
+        row_index_2 = self._localize_index(last_index)
+        if self._cached:
+            self._get_mirror().delete(row_index_1-self._SCHEMA.table_start, row_index_2-self._SCHEMA.table_start+1)
+        if self._index is not None:
+            self._index.delete(row_index_1-self._SCHEMA.table_start, row_index_2-self._SCHEMA.table_start)
+        return self._sheet.delete_write(self._cell_range(row_index_1, row_index_2))
+
+    def _batch_insert_writes(self, start_index: int, items: List[tuple]) -> List[SheetWrite]:
+        """
+        Writes that insert items at start_index, shifting down everything from there on. The rows that are shifted are
+        moved by the sheet itself, so the size of the writes doesn't depend on how many rows there are below.
+        """
+        writes = []
+        if start_index != self.first_empty_index:
+            writes.append(self._batch_insert_write(start_index, len(items)))
+        writes.append(self._batch_set_write(start_index, items))
+        return writes
+
+    def _batch_remove_write(self, first_index: int, last_index: int) -> SheetWrite:
+        """
+        Write that removes the rows from first_index to last_index, shifting up everything below them. When there
+        is nothing below them, they are just cleared instead.
+        """
+        if last_index == -1 or last_index == self.first_empty_index-1:
+            return self._batch_clear_write(first_index, last_index)
+        return self._batch_delete_write(first_index, last_index)
+
+    def _batch_replace_writes(self, start_index: int, items: List[tuple]) -> List[SheetWrite]:
+        """
+        Writes that overwrite the rows starting at start_index with items. In cached mode, only the (contiguous runs
+        of) rows that actually differ from the ones already there are written.
+        """
+        if not self._cached:
+            return [self._batch_set_write(start_index, items)]
+        if start_index < 0:
+            start_index += self.first_empty_index
+        current = self._generic_batch_get(start_index, start_index+len(items)-1)
+        writes = []
+        run_start = None
+        for offset, (old, new) in enumerate(zip(current + [None], items + [None])):
+            if old != new and run_start is None:
+                run_start = offset
+            elif old == new and run_start is not None:
+                writes.append(self._batch_set_write(start_index+run_start, items[run_start:offset]))
+                run_start = None
+        return writes
+
+    @traced
+    def __getitem__(self, index: int) -> Optional[tuple]:
+        if index >= self.first_empty_index:
+            return None
+        return self._generic_get(index)
+
+    @traced
+    def batch_get(self, first_index: int, last_index: int) -> List[Optional[tuple]]:
+        if first_index >= self.first_empty_index:
+            return [None]*(last_index-first_index+1)
+        if last_index >= self.first_empty_index:
+            tail = [None]*(last_index-self.first_empty_index+1)
+            items = self._generic_batch_get(first_index, self.first_empty_index-1)
+            items.extend(tail)
+            return items
+        return self._generic_batch_get(first_index, last_index)
+
+    @traced
+    def push(self, item: tuple):
+        self._set(self.first_empty_index, item, ensure_no_overwrite=False)
+        self.first_empty_index += 1
+
+    @traced
+    def batch_push(self, items: List[tuple]):
+        if not items:
+            return
+        self._batch_set(self.first_empty_index, items, ensure_no_overwrite=False)
+        self.first_empty_index += len(items)
+
+    @traced
+    def pop(self, index: int) -> tuple:
+        if index >= self.first_empty_index:
+            raise Exception("Attempted to pop out of range")
+        element = self[index]
+        with self._write() as writes:
+            writes.append(self._batch_remove_write(index, index))
+        self.first_empty_index -= 1
+        return element
+
+    @traced
+    def batch_pop(self, first_index: int, last_index: int) -> List[tuple]:
+        if first_index > last_index:
+            return []
+        if first_index < 0 <= last_index:
+            raise IndexError("{}.batch_pop does not support indexing"
+                             " from the negative to the nonnegative part".format(type(self).__name__))
+        if last_index >= self.first_empty_index:
+            raise Exception("Attempted to pop out of range")
+
+        elements = self.batch_get(first_index, last_index)
+        with self._write() as writes:
+            writes.append(self._batch_remove_write(first_index, last_index))
+        self.first_empty_index -= last_index-first_index+1
+        return elements
+
+    @traced
+    def insert(self, index: int, item: tuple):
+        if index > self.first_empty_index:
+            raise Exception("Attempted to insert out of range")
+        with self._write() as writes:
+            writes.extend(self._batch_insert_writes(index, [item]))
+        self.first_empty_index += 1
+
+    @traced
+    def batch_insert(self, start_index: int, items: List[tuple]):
+        if start_index > self.first_empty_index:
+            raise Exception("Attempted to insert out of range")
+        if not items:
+            return
+        with self._write() as writes:
+            writes.extend(self._batch_insert_writes(start_index, items))
+        self.first_empty_index += len(items)
+
+    @traced
+    def date_at(self, index: int, probed: Optional[dict] = None) -> Datetime:
+        """
+        :param index: nonnegative index of a nonempty row
+        :param probed: dates already read, by index - looked in first, and added to. For sharing between calls
+        :return: the date of the row at index, reading just that cell (or nothing, in cached mode)
+        """
+        if probed is None:
+            probed = dict()
+        if index not in probed:
+            if self._cached:
+                probed[index] = self._get_mirror()[index].date
+            else:
+                cell = self._sheet.get("{}{}".format(self._SCHEMA.first_column, self._localize_index(index)))[0][0]
+                probed[index] = self._SCHEMA.codecs[0].parse(cell, self.money)
+        return probed[index]
+
+    @traced
+    def bisect_date(self, date: Datetime, low=0, probed: Optional[dict] = None) -> int:
+        """
+        Finds, by binary search, the index right after the last row (from low on) with the same or an earlier date -
+        i.e. where a row with that date goes for the table to stay sorted by date. Reads O(log n) single cells (or
+        none, in cached mode).
+
+        :param probed: as for .date_at
+        """
+        if probed is None:
+            probed = dict()
+        high = self.first_empty_index
+        while low < high:
+            middle = (low+high)//2
+            if date < self.date_at(middle, probed):
+                high = middle
+            else:
+                low = middle+1
+        return low
+
+    @traced
+    def insert_sorted(self, item: tuple) -> int:
+        """
+        Inserts item right after the last row with the same or an earlier date, so that (if the table was sorted by
+        date) it stays sorted. The position is found by binary search, which reads O(log n) single cells (or none, in
+        cached mode).
+
+        :return: the index at which it was inserted
+        """
+        index = self.bisect_date(item.date)
+        self.insert(index, item)
+        return index
+
+    @traced
+    def batch_insert_sorted(self, items: List[tuple]):
+        """
+        Analogous to .insert_sorted, for many rows at once. The rows can be given in any order. Rows that end up in
+        the same position of the table are inserted together, and all of them are sent in a single batch_write.
+        """
+        items = sorted(items, key=lambda item: item.date)
+        probed = dict()
+        groups = []
+        position = 0
+        for item in items:
+            position = self.bisect_date(item.date, position, probed)
+            if groups and groups[-1][0] == position:
+                groups[-1][1].append(item)
+            else:
+                groups.append((position, [item]))
+
+        # make room for every group from the bottom up, so that the positions of the ones above are unaffected.
+        # once that's done, group i starts at its original position plus the size of all groups before it
+        with self._write() as writes:
+            for position, group in reversed(groups):
+                if position != self.first_empty_index:
+                    writes.append(self._batch_insert_write(position, len(group)))
+            offset = 0
+            for position, group in groups:
+                writes.append(self._batch_set_write(position+offset, group))
+                offset += len(group)
+        self.first_empty_index += len(items)
+
+    @traced
+    def replace(self, index: int, item: tuple):
+        if index >= self.first_empty_index:
+            raise Exception("Attempted to replace out of range")
+        with self._write() as writes:
+            writes.extend(self._batch_replace_writes(index, [item]))
+
+    @traced
+    def batch_replace(self, start_index: int, items: List[tuple]):
+        end_index = start_index+len(items)-1
+        if end_index >= self.first_empty_index:
+            raise Exception("Attempted to replace out of range")
+        if not items:
+            return
+        with self._write() as writes:
+            writes.extend(self._batch_replace_writes(start_index, items))
+
+    def _table_rows(self) -> List[list]:
+        """
+        :return: every row of the table, as read from the sheet (in a single query) - for .to_columns
+        """
+        if self.first_empty_index == 0:
+            return []
+        return self._sheet.get(self._cell_range(self._SCHEMA.table_start,
+                                                self._localize_index(self.first_empty_index-1)))
+
+    def _compact_rows(self) -> CompactRows:
+        """
+        :return: the whole table as a CompactRows (the local copy itself, in cached mode) - for snapshots
+        """
+        if self._cached:
+            return self._get_mirror()
+        return CompactRows(self._SCHEMA, self.money, self._rows_to_items(self._table_rows()))
+
+    def _chunk_ranges(self, chunk_size: int, start: int, stop: Optional[int]) -> List[Tuple[int, int]]:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        if stop is None:
+            stop = self.first_empty_index
+        if start < 0:
+            start += self.first_empty_index
+        if stop < 0:
+            stop += self.first_empty_index
+        if start < 0 or stop < 0:
+            raise IndexError("Tried to access an index before the start of the {} table".format(self._SCHEMA.name))
+        return [(first, min(first+chunk_size, stop)-1) for first in range(start, stop, chunk_size)]
+
+    @traced
+    def iter_rows(self, chunk_size=2000, start=0, stop=None, prefetch=False) -> Iterator[Optional[tuple]]:
+        """
+        Iterates over the rows from index start up to (but not including) stop - by default, over all of them -
+        reading them chunk_size rows at a time. Outside of cached mode, this keeps no more than a chunk or two in memory
+        at once, however big the table is. The table shouldn't be modified until the iteration is over.
+
+        :param prefetch: whether to read each chunk in a background thread while the one before it is being iterated
+                         over. Only do so if the spreadsheet interface is safe to use from several threads (see
+                         GoogleSheetsInterface's pooled_transport), or nothing else uses it in the meantime.
+        """
+        chunks = self._chunk_ranges(chunk_size, start, stop)
+        if not prefetch:
+            for first_index, last_index in chunks:
+                yield from self.batch_get(first_index, last_index)
+            return
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            following = None
+            for position, (first_index, last_index) in enumerate(chunks):
+                chunk = self.batch_get(first_index, last_index) if following is None else following.result()
+                if position+1 < len(chunks):
+                    # run in a copy of this context, so that the queries are still attributed to this method
+                    following = executor.submit(copy_context().run, self.batch_get, *chunks[position+1])
+                yield from chunk
+        finally:
+            executor.shutdown()
+
+    @traced
+    def is_healthy(self, safety_margin=1000, chunk_size=10000):
+        """
+        Checks that the table is in normal form (see the docstring of the class): every row up to .first_empty_index
+        holds an item, they are sorted by date, and the safety_margin rows after them are empty. The table is read
+        chunk_size rows at a time (see .iter_rows).
+        """
+        previous = None
+        for item in self.iter_rows(chunk_size):
+            if item is None:
+                return False
+            if previous is not None and previous.date > item.date:
+                return False
+            previous = item
+        no_data = self._generic_batch_get(self.first_empty_index, self.first_empty_index+safety_margin)
+        if not all([x is None for x in no_data]):
+            return False
+        return True
+
+    def _fingerprint(self, item: tuple) -> int:
+        return self._SCHEMA.fingerprint(item, self.money)
+
+    def _get_index(self) -> FingerprintIndex:
+        if self._index is None:
+            if self._cached:
+                items = self._get_mirror().slice(0, self.first_empty_index)
+            else:
+                items = self.iter_rows(10000)
+            self._index = FingerprintIndex(None if item is None else self._fingerprint(item) for item in items)
+        return self._index
+
+    @property
+    def indexed(self) -> bool:
+        """
+        Whether the fingerprint index (see the docstring of the class) has already been built or loaded, so that looking
+        rows up takes no queries.
+        """
+        return self._index is not None
+
+    @traced
+    def find(self, item: tuple) -> Optional[int]:
+        """
+        :return: index of the first row with the same fingerprint as item, or None if there is none
+        """
+        return self._get_index().find(self._fingerprint(item))
+
+    @traced
+    def find_all(self, item: tuple) -> List[int]:
+        """
+        :return: indices of the rows with the same fingerprint as item, in ascending order
+        """
+        return self._get_index().find_all(self._fingerprint(item))
+
+    @traced
+    def count(self, item: tuple) -> int:
+        """
+        :return: how many rows have the same fingerprint as item
+        """
+        return self._get_index().count(self._fingerprint(item))
+
+    @traced
+    def contains(self, item: tuple) -> bool:
+        """
+        :return: whether any row has the same fingerprint as item
+        """
+        return self._fingerprint(item) in self._get_index()
+
+    def __contains__(self, item: tuple) -> bool:
+        return self.contains(item)
+
+    @traced
+    def duplicates(self) -> List[List[int]]:
+        """
+        :return: the indices of the rows that have the same fingerprint as some other row, as a list of groups of rows
+                 with the same one
+        """
+        return sorted(self._get_index().duplicates().values())
+
+    @traced
+    def save_index(self, path):
+        """
+        Saves the fingerprint index (building it first, if need be) to path, to be loaded back by .load_index.
+        """
+        # taken before building the index, so that changes made in between leave the file stale, rather than wrongly
+        # current
+        fingerprint = self._sheet.fingerprint()
+        self._get_index().save(path, {"table": type(self).__name__, "fingerprint": fingerprint,
+                                      "first_empty_index": self.first_empty_index})
+
+    @traced
+    def load_index(self, path) -> bool:
+        """
+        Loads the fingerprint index saved to path by .save_index, if the spreadsheet hasn't changed since (as told by
+        AspireSpreadsheetInterface.fingerprint - so never, if the spreadsheet interface doesn't support it).
+
+        :return: whether it was loaded
+        """
+        loaded = FingerprintIndex.load(path)
+        if loaded is None:
+            return False
+        header, index = loaded
+        if header.get("table") != type(self).__name__ or header.get("first_empty_index") != self.first_empty_index \
+                or header.get("fingerprint") is None or header.get("fingerprint") != self._sheet.fingerprint():
+            return False
+        self._index = index
+        return True
@@ -0,0 +1,282 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
+
+from AspireAPI.Locale import Money
+from AspireAPI.SheetTable import CompactRows, TableSchema
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite
+
+
+# A snapshot file is laid out as
+#   _MAGIC, then the length of the header as an 8 byte little endian integer, then the header itself - a json object,
+#   padded with spaces up to a multiple of 8 bytes - and then the columns of every table, one after the other, each
+#   starting at a multiple of 8 bytes (counting from the end of the header)
+# where the numbers in the columns are little endian, of the size given by their array typecode (see the codecs in
+# AspireAPI.SheetTable), so that they can be used straight from the memory-mapped file.
+#
+# The header has the format, the fingerprint of the spreadsheet, the names of its sheets, the reads of the
+# configuration and the dashboard (as [sheet name, range, rows]) and, for each table, its .first_empty_index and where
+# its columns are: [offset, length in bytes] of which rows are empty (a byte per row) and of each column. Columns of
+# strings are kept as a code per row (an "I" array) into the distinct strings of the column, which are written one
+# after the other in utf-8, plus where each one starts (a "q" array, with one more entry for the end of the last one).
+_MAGIC = b"ASPIRE-SNAPSHOT\n"
+_FORMAT = 1
+_ALIGNMENT = 8
+_READ_ONLY = "Aspire objects made from snapshots are read-only"
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def save_snapshot(path, tables: Dict[str, CompactRows], reads: Dict[Tuple[str, str], List[list]], header: dict):
+    """
+    Writes a snapshot file (see above) to path.
+
+    :param tables: the local copy of each table (see SheetTable), by name
+    :param reads: the rows read from each (sheet name, range) - which is what the snapshot will answer reads with
+    :param header: anything else to keep in the header
+    """
+    blobs = []
+    size = 0
+
+    def add(data: bytes) -> list:
+        nonlocal size
+        blobs.append(data)
+        blobs.append(bytes(-len(data) % _ALIGNMENT))
+        location = [size, len(data)]
+        size += len(data) + len(blobs[-1])
+        return location
+
+    saved_tables = dict()
+    for name, rows in tables.items():
+        columns = []
+        for column in rows._columns:
+            if isinstance(column, array):
+                columns.append({"typecode": column.typecode, "itemsize": column.itemsize,
+                                "values": add(_little_endian(column))})
+                continue
+            codes = {string: code for code, string in enumerate(dict.fromkeys(column))}
+            encoded = [string.encode("utf-8") for string in codes]
+            offsets = array("q", [0])
+            offsets.extend(accumulate(map(len, encoded)))
+            columns.append({"typecode": None,
+                            "codes": add(_little_endian(array("I", map(codes.__getitem__, column)))),
+                            "offsets": add(_little_endian(offsets)),
+                            "strings": add(b"".join(encoded))})
+        saved_tables[name] = {"first_empty_index": rows.first_empty(), "present": add(bytes(rows._present)),
+                              "columns": columns}
+
+    header = dict(header, format=_FORMAT, tables=saved_tables,
+                  reads=[[sheet_name, cell_range, data] for (sheet_name, cell_range), data in reads.items()])
+    header = json.dumps(header, ensure_ascii=False).encode("utf-8")
+    header += b" " * (-len(header) % _ALIGNMENT)
+
+    # written to a different file first so that a crash midway can't leave a broken snapshot behind
+    temporary_path = "{}.tmp".format(path)
+    with open(temporary_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+    os.replace(temporary_path, path)
+
+
+class _StringColumn:
+    """
+    A column of strings of a snapshot, decoded as they are read
+    """
+
+    __slots__ = ("_codes", "_offsets", "_strings")
+
+    def __init__(self, codes, offsets, strings: memoryview):
+        self._codes = codes
+        self._offsets = offsets
+        self._strings = strings
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _string(self, code: int) -> str:
+        return str(self._strings[self._offsets[code]:self._offsets[code+1]], "utf-8")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            codes = self._codes[index]
+            distinct = {code: self._string(code) for code in set(codes)}
+            return list(map(distinct.__getitem__, codes))
+        return self._string(self._codes[index])
+
+
+class _SnapshotRows(CompactRows):
+    """
+    CompactRows over the columns of a snapshot, straight from the memory-mapped file - so nothing is read into memory
+    until it's needed. Read-only.
+    """
+
+    __slots__ = ("_first_empty",)
+
+    def __init__(self, schema: TableSchema, money: Money, present, columns: list, first_empty: int):
+        self._schema = schema
+        self._money = money
+        self._present = present
+        self._columns = columns
+        self._first_empty = first_empty
+
+    def first_empty(self) -> int:
+        return self._first_empty
+
+    def assign(self, start: int, items: List[Optional[tuple]]):
+        raise Exception(_READ_ONLY)
+
+    def insert(self, start: int, qt_rows: int):
+        raise Exception(_READ_ONLY)
+
+    def delete(self, start: int, stop: int):
+        raise Exception(_READ_ONLY)
+
+
+class Snapshot:
+    """
+    A snapshot file written by save_snapshot (see Aspire.export_snapshot), memory-mapped.
+    """
+
+    def __init__(self, path):
+        try:
+            with open(path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if self._map[:len(_MAGIC)] != _MAGIC:
+                raise ValueError()
+            header_start = len(_MAGIC)+8
+            header_length, = struct.unpack("<Q", self._map[len(_MAGIC):header_start])
+            self.header = json.loads(self._map[header_start:header_start+header_length].decode("utf-8"))
+        except (OSError, ValueError, struct.error) as e:
+            raise Exception("{} is not a snapshot of an Aspire spreadsheet".format(path)) from e
+        if self.header.get("format") != _FORMAT:
+            raise Exception("{} is a snapshot in a format this version can't read ({})"
+                            .format(path, self.header.get("format")))
+        self.path = path
+        self._data = memoryview(self._map)[header_start+header_length:]
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """
+        :return: the fingerprint (see AspireSpreadsheetInterface.fingerprint) of the spreadsheet when it was saved
+        """
+        return self.header["fingerprint"]
+
+    @property
+    def sheetnames(self) -> Dict[str, str]:
+        """
+        :return: the names of the sheets of the spreadsheet, as the keyword arguments of Aspire that give them
+        """
+        return self.header["sheetnames"]
+
+    def reads(self) -> Dict[Tuple[str, str], List[list]]:
+        return {(sheet_name, cell_range): data for sheet_name, cell_range, data in self.header["reads"]}
+
+    def _view(self, location: list, typecode: str = "B"):
+        offset, length = location
+        view = self._data[offset:offset+length]
+        if typecode == "B":
+            return view
+        if sys.byteorder != "little":
+            # can't be used as is, so it's read into memory after all
+            values = array(typecode, view)
+            values.byteswap()
+            return values
+        return view.cast(typecode)
+
+    def rows(self, name: str, schema: TableSchema, money: Money) -> CompactRows:
+        """
+        :return: the rows of the table saved as name, read-only
+        """
+        table = self.header["tables"][name]
+        if len(table["columns"]) != len(schema.codecs):
+            raise Exception("The {} table in the snapshot at {} doesn't have the expected columns"
+                            .format(schema.name, self.path))
+        columns = []
+        for codec, column in zip(schema.codecs, table["columns"]):
+            if column["typecode"] != codec.typecode \
+                    or (codec.typecode is not None and column["itemsize"] != array(codec.typecode).itemsize):
+                raise Exception("The {} table in the snapshot at {} doesn't have the expected columns"
+                                .format(schema.name, self.path))
+            if codec.typecode is None:
+                columns.append(_StringColumn(self._view(column["codes"], "I"), self._view(column["offsets"], "q"),
+                                             self._view(column["strings"])))
+            else:
+                columns.append(self._view(column["values"], codec.typecode))
+        return _SnapshotRows(schema, money, self._view(table["present"]), columns, table["first_empty_index"])
+
+
+class RecordingSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Wraps another AspireSpreadsheetInterface, remembering what every read returned (in .reads), to be saved to a
+    snapshot. Only for reading.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface):
+        self._interface = interface
+        self.reads = dict()
+
+    def _record(self, sheet_name, cell_range, data: List[list]):
+        # copied, since whoever asked for it may modify it
+        self.reads[(sheet_name, cell_range)] = [list(row) for row in data]
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        data = self._interface.get(sheet_name, cell_range, major_dimension=major_dimension)
+        if major_dimension == "ROWS":
+            self._record(sheet_name, cell_range, data)
+        return data
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        results = self._interface.cross_sheet_batch_get(sheet_ranges, major_dimension=major_dimension)
+        if major_dimension == "ROWS":
+            for (sheet_name, cell_range), data in zip(sheet_ranges, results):
+                self._record(sheet_name, cell_range, data)
+        return results
+
+
+class SnapshotSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Answers the reads saved in a snapshot (those of the configuration and the dashboard - the tables are served by the
+    snapshot itself, see Snapshot.rows) without touching the network, and refuses everything else.
+    """
+
+    def __init__(self, snapshot: Snapshot):
+        self._snapshot = snapshot
+        self._reads = snapshot.reads()
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        data = self._reads.get((sheet_name, cell_range)) if major_dimension == "ROWS" else None
+        if data is None:
+            raise Exception("{}!{} is not in the snapshot at {}".format(sheet_name, cell_range, self._snapshot.path))
+        # copied, since whoever asked for it may modify it
+        return [list(row) for row in data]
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        raise Exception(_READ_ONLY)
+
+    def clear(self, sheet_name, cell_range):
+        raise Exception(_READ_ONLY)
+
+    def insert_range(self, sheet_name, cell_range):
+        raise Exception(_READ_ONLY)
+
+    def delete_range(self, sheet_name, cell_range):
+        raise Exception(_READ_ONLY)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        raise Exception(_READ_ONLY)
+
+    def fingerprint(self) -> Optional[str]:
+        return self._snapshot.fingerprint
@@ -0,0 +1,95 @@
+import re
+from collections import namedtuple
+from typing import Optional, Tuple
+
+
+# Zero-based, inclusive bounds of a range of cells. last_row/last_column are None when the range is unbounded in
+# that direction (e.g. "B9:H" or "A:C"), in which case it extends until the end of the sheet.
+CellRange = namedtuple("CellRange", "first_column first_row last_column last_row")
+
+
+_cell_parser = re.compile(r"^([A-Za-z]*)(\d*)$")
+
+
+def column_index(letters: str) -> int:
+    """
+    Zero-based index of a column given its letters, e.g. "A" -> 0, "AA" -> 26
+    """
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def column_letters(index: int) -> str:
+    """
+    Inverse of column_index
+    """
+    letters = ""
+    index += 1
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def _parse_cell(cell: str) -> Tuple[Optional[int], Optional[int]]:
+    match = _cell_parser.match(cell)
+    if match is None or cell == "":
+        raise ValueError("Badly formatted cell in A1 notation: '{}'".format(cell))
+    letters, digits = match.groups()
+    return (column_index(letters) if letters else None,
+            int(digits) - 1 if digits else None)
+
+
+def parse_range(cell_range: str) -> CellRange:
+    """
+    :param cell_range: range of cells in A1 notation, without the sheet name - e.g. "B9:H20", "D5", "B9:B", "H:H"
+    :return: the corresponding CellRange
+    """
+    first, _, last = cell_range.partition(":")
+    first_column, first_row = _parse_cell(first)
+    if last == "":
+        if first_column is None or first_row is None:
+            raise ValueError("Badly formatted range in A1 notation: '{}'".format(cell_range))
+        return CellRange(first_column, first_row, first_column, first_row)
+    last_column, last_row = _parse_cell(last)
+    if first_column is None and last_column is not None or first_row is None and last_row is not None:
+        raise ValueError("Badly formatted range in A1 notation: '{}'".format(cell_range))
+    parsed = CellRange(0 if first_column is None else first_column,
+                       0 if first_row is None else first_row,
+                       last_column, last_row)
+    if parsed.last_column is not None and parsed.last_column < parsed.first_column \
+            or parsed.last_row is not None and parsed.last_row < parsed.first_row:
+        raise ValueError("Range in A1 notation is reversed: '{}'".format(cell_range))
+    return parsed
+
+
+def format_range(cell_range: CellRange) -> str:
+    """
+    Inverse of parse_range (up to normalization, e.g. "D5:D5" becomes "D5")
+    """
+    first = column_letters(cell_range.first_column) + str(cell_range.first_row + 1)
+    if cell_range.last_column == cell_range.first_column and cell_range.last_row == cell_range.first_row:
+        return first
+    last = ("" if cell_range.last_column is None else column_letters(cell_range.last_column)) \
+        + ("" if cell_range.last_row is None else str(cell_range.last_row + 1))
+    return "{}:{}".format(first, last)
+
+
+def range_shape(cell_range: CellRange) -> Optional[Tuple[int, int]]:
+    """
+    :return: (rows, columns) of the range, or None if it is unbounded
+    """
+    if cell_range.last_row is None or cell_range.last_column is None:
+        return None
+    return cell_range.last_row - cell_range.first_row + 1, cell_range.last_column - cell_range.first_column + 1
+
+
+def _intervals_overlap(first_1, last_1, first_2, last_2) -> bool:
+    return (last_1 is None or first_2 <= last_1) and (last_2 is None or first_1 <= last_2)
+
+
+def ranges_overlap(range_1: CellRange, range_2: CellRange) -> bool:
+    return _intervals_overlap(range_1.first_row, range_1.last_row, range_2.first_row, range_2.last_row) \
+        and _intervals_overlap(range_1.first_column, range_1.last_column, range_2.first_column, range_2.last_column)
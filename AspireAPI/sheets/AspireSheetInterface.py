@@ -1,6 +1,7 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET, CLEAR, \
+    INSERT, DELETE
 
 
 class AspireSheetInterface:
@@ -20,6 +21,12 @@ class AspireSheetInterface:
         return self._spreadsheet_interface.get(self._name, cell_range, major_dimension=major_dimension)
         #  return self._spreadsheet_interface.get(self._name, *args, **kwargs)
 
+    def batch_get(self, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        """
+        Analogous to AspireSpreadsheetInterface.batch_get
+        """
+        return self._spreadsheet_interface.batch_get(self._name, cell_ranges, major_dimension=major_dimension)
+
     # def set(self, *args, **kwargs):
     def set(self, cell_range, data, major_dimension="ROWS"):
         """
@@ -35,3 +42,106 @@ class AspireSheetInterface:
         """
         return self._spreadsheet_interface.clear(self._name, cell_range)
         # return self._spreadsheet_interface.clear(self._name, *args, **kwargs)
+
+    def insert_range(self, cell_range):
+        """
+        Analogous to AspireSpreadsheetInterface.insert_range
+        """
+        return self._spreadsheet_interface.insert_range(self._name, cell_range)
+
+    def delete_range(self, cell_range):
+        """
+        Analogous to AspireSpreadsheetInterface.delete_range
+        """
+        return self._spreadsheet_interface.delete_range(self._name, cell_range)
+
+    def set_write(self, cell_range, data) -> SheetWrite:
+        """
+        :return: a SheetWrite that, when passed to .batch_write, is equivalent to .set(cell_range, data)
+        """
+        return SheetWrite(SET, self._name, cell_range, data)
+
+    def clear_write(self, cell_range) -> SheetWrite:
+        """
+        :return: a SheetWrite that, when passed to .batch_write, is equivalent to .clear(cell_range)
+        """
+        return SheetWrite(CLEAR, self._name, cell_range)
+
+    def insert_write(self, cell_range) -> SheetWrite:
+        """
+        :return: a SheetWrite that, when passed to .batch_write, is equivalent to .insert_range(cell_range)
+        """
+        return SheetWrite(INSERT, self._name, cell_range)
+
+    def delete_write(self, cell_range) -> SheetWrite:
+        """
+        :return: a SheetWrite that, when passed to .batch_write, is equivalent to .delete_range(cell_range)
+        """
+        return SheetWrite(DELETE, self._name, cell_range)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        """
+        Analogous to AspireSpreadsheetInterface.batch_write. The writes should be built through .set_write,
+        .clear_write, .insert_write and .delete_write
+        """
+        return self._spreadsheet_interface.batch_write(writes)
+
+    def sheet_size(self) -> Optional[Tuple[int, int]]:
+        """
+        Analogous to AspireSpreadsheetInterface.sheet_size
+        """
+        return self._spreadsheet_interface.sheet_size(self._name)
+
+    def fingerprint(self) -> Optional[str]:
+        """
+        Analogous to AspireSpreadsheetInterface.fingerprint (which is for the whole spreadsheet, not just this sheet)
+        """
+        return self._spreadsheet_interface.fingerprint()
+
+    def find_first_empty_row(self, column: str, first_row: int, probes_per_query=64) -> int:
+        """
+        :param column: letter(s) of the column to search
+        :param first_row: row number (as in A1 notation) where the search starts
+        :param probes_per_query: how many cells are read at once in each step of the search
+        :return: the row number of the first empty cell in the column, at or after first_row
+
+        Assumes that the cells of the column are non-empty from first_row up to some point, and empty from then on.
+        Rather than reading the whole column, this reads a few spaced out cells per query and narrows down the
+        search to the gap between the last non-empty one and the first empty one. So it takes a number of queries
+        that grows with the logarithm (base probes_per_query) of the size of the sheet, i.e. 2 to 4 in practice,
+        plus one to find out the size of the sheet.
+        """
+        # invariant: every row before low is non-empty, and row high is empty (or past the end of the sheet)
+        low = first_row
+        size = self.sheet_size()
+        if size is not None:
+            high = size[0] + 1
+        else:
+            # no limit on the size of the sheet, so start with exponentially spaced probes to find an upper bound
+            high = None
+            while high is None:
+                probes = [low + 2 ** k - 1 for k in range(min(probes_per_query, 25))]
+                results = self.batch_get(["{0}{1}".format(column, row) for row in probes])
+                for row, result in zip(probes, results):
+                    if result == []:
+                        high = row
+                        break
+                    low = row + 1
+
+        while high - low > probes_per_query:
+            step = (high - low) / (probes_per_query + 1)
+            probes = sorted(set(low + int(step * i) for i in range(1, probes_per_query + 1)))
+            results = self.batch_get(["{0}{1}".format(column, row) for row in probes])
+            for row, result in zip(probes, results):
+                if result == []:
+                    high = row
+                    break
+                low = row + 1
+
+        if low == high:
+            return low
+        result = self.get("{0}{1}:{0}{2}".format(column, low, high - 1))
+        for offset, cell in enumerate(result):
+            if cell == []:
+                return low + offset
+        return low + len(result)
@@ -1,4 +1,53 @@
-from typing import List
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+from AspireAPI.sheets.A1Notation import parse_range, range_shape, ranges_overlap
+
+
+# A single write to the spreadsheet, as understood by AspireSpreadsheetInterface.batch_write. kind is one of the
+# constants below, and data is only meaningful for SET (in which case it is the same as the data argument of .set)
+SheetWrite = namedtuple("SheetWrite", "kind sheet_name cell_range data", defaults=[None])
+SET = "set"
+CLEAR = "clear"
+INSERT = "insert"
+DELETE = "delete"
+
+
+def split_queries(writes: List[SheetWrite]) -> List[List[SheetWrite]]:
+    """
+    Splits writes into the groups that GoogleSheetsInterface.batch_write sends as a single query each:
+    - consecutive insertions/deletions go together (as a spreadsheets.batchUpdate)
+    - consecutive sets and bounded clears go together (as a values.batchUpdate), unless one overlaps an earlier one in
+      the group - so that the order in which those in a group are applied doesn't matter
+    - unbounded clears go on their own (as a values.clear)
+
+    Google applies each of these all or nothing, but a batch of several may be left halfway through.
+    """
+    groups = []
+    group_kind = None  # SET for a group of sets/clears, INSERT for one of insertions/deletions, None if it can't grow
+    group_ranges = []
+    for write in writes:
+        if write.kind in (INSERT, DELETE):
+            if group_kind != INSERT:
+                groups.append([])
+                group_kind = INSERT
+            groups[-1].append(write)
+            continue
+        if write.kind not in (SET, CLEAR):
+            raise ValueError("Unknown kind of write: '{}'".format(write.kind))
+        cell_range = parse_range(write.cell_range)
+        if write.kind == CLEAR and range_shape(cell_range) is None:
+            groups.append([write])
+            group_kind = None
+            continue
+        if group_kind != SET or any(sheet_name == write.sheet_name and ranges_overlap(other_range, cell_range)
+                                    for sheet_name, other_range in group_ranges):
+            groups.append([])
+            group_kind = SET
+            group_ranges = []
+        groups[-1].append(write)
+        group_ranges.append((write.sheet_name, cell_range))
+    return groups
 
 
 class AspireSpreadsheetInterface:
@@ -19,6 +68,30 @@ class AspireSpreadsheetInterface:
         """
         raise NotImplementedError()
 
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        """
+        :param sheet_name: name of the specific sheet (within the spreadsheet) where the command will be executed
+        :param cell_ranges: list of ranges of cells in A1 notation
+        :param major_dimension: whether the return will be in row-major or column-major order
+        :return: a list with one element per range in cell_ranges, each in the same format as the return of .get
+
+        Equivalent to calling .get once per range, but implementations are encouraged to do it in a single query.
+        """
+        return self.cross_sheet_batch_get([(sheet_name, cell_range) for cell_range in cell_ranges],
+                                          major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        """
+        :param sheet_ranges: list of (sheet_name, cell_range) pairs, possibly referring to different sheets
+        :param major_dimension: whether the return will be in row-major or column-major order
+        :return: a list with one element per pair in sheet_ranges, each in the same format as the return of .get
+
+        The default implementation just calls .get once per range - subclasses backed by an actual API should
+        override it so that it takes a single query.
+        """
+        return [self.get(sheet_name, cell_range, major_dimension=major_dimension)
+                for sheet_name, cell_range in sheet_ranges]
+
     def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
         """
         :param sheet_name: name of the specific sheet (within the spreadsheet) where the command will be executed
@@ -43,3 +116,81 @@ class AspireSpreadsheetInterface:
         Clears the content (but not the formatting) of all cells in the provided range
         """
         raise NotImplementedError()
+
+    def insert_range(self, sheet_name, cell_range):
+        """
+        :param sheet_name: name of the specific sheet (within the spreadsheet) where the command will be executed
+        :param cell_range: bounded range of cells in A1 notation
+
+        Inserts empty cells in place of the given range, shifting the cells that were there (and all cells below them,
+        within the same columns) down by as many rows as the range has. Cells in other columns are not affected.
+
+        Has to be applied as a single step - it can't be emulated by reading the cells below and writing them back
+        further down, since that would have sheets parse them again as if they had been typed in (turning text like
+        "00123" into a number) and could be left halfway through.
+        """
+        raise NotImplementedError()
+
+    def delete_range(self, sheet_name, cell_range):
+        """
+        :param sheet_name: name of the specific sheet (within the spreadsheet) where the command will be executed
+        :param cell_range: bounded range of cells in A1 notation
+
+        Removes the cells in the given range, shifting all the cells below them (within the same columns) up by as
+        many rows as the range has. Cells in other columns are not affected.
+
+        Has to be applied as a single step, as for .insert_range.
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def _bounded_shape(cell_range) -> Tuple[int, int]:
+        shape = range_shape(parse_range(cell_range))
+        if shape is None:
+            raise ValueError("Expected a bounded range, got '{}'".format(cell_range))
+        return shape
+
+    def batch_write(self, writes: List[SheetWrite]):
+        """
+        :param writes: list of SheetWrite, possibly referring to different sheets
+
+        Applies all the given writes in order, as if though .set/.clear/.insert_range/.delete_range had been called for
+        each of them. The default implementation does exactly that - subclasses backed by an actual API should
+        override it so that it takes as few queries as possible, as this is used to keep multi-step operations from
+        being left half-applied.
+        """
+        for write in writes:
+            if write.kind == SET:
+                self.set(write.sheet_name, write.cell_range, write.data)
+            elif write.kind == CLEAR:
+                self.clear(write.sheet_name, write.cell_range)
+            elif write.kind == INSERT:
+                self.insert_range(write.sheet_name, write.cell_range)
+            elif write.kind == DELETE:
+                self.delete_range(write.sheet_name, write.cell_range)
+            else:
+                raise ValueError("Unknown kind of write: '{}'".format(write.kind))
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        """
+        :param sheet_name: name of the specific sheet (within the spreadsheet)
+        :return: (rows, columns) of the grid of the sheet, i.e. how far ranges in it may extend - or None if the
+                 sheet has no such limit (or it can't be known cheaply). The default implementation returns None.
+        """
+        return None
+
+    def fingerprint(self) -> Optional[str]:
+        """
+        :return: a short string that is guaranteed to change whenever anything in the spreadsheet does (and is not
+                 likely to otherwise), for checking whether something read from it earlier is still current - or None
+                 if there is no cheap way to get such a thing. The default implementation returns None.
+        """
+        return None
+
+    @property
+    def thread_safe(self) -> bool:
+        """
+        :return: whether this object can be used from several threads at the same time (see
+                 ExecutorSpreadsheetInterface). The default implementation returns False.
+        """
+        return False
@@ -0,0 +1,87 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from AspireAPI.sheets.AspireSpreadsheetInterface import SheetWrite, SET, CLEAR, INSERT, DELETE
+
+
+class AsyncSpreadsheetInterface:
+    """
+    Asynchronous analogue of AspireSpreadsheetInterface: the same methods, with the same arguments and semantics,
+    but as coroutines - so that queries can be awaited from an event loop without blocking it, and independent ones
+    can run concurrently.
+    """
+
+    async def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        """
+        Analogous to AspireSpreadsheetInterface.get
+        """
+        raise NotImplementedError()
+
+    async def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        """
+        Analogous to AspireSpreadsheetInterface.batch_get
+        """
+        return await self.cross_sheet_batch_get([(sheet_name, cell_range) for cell_range in cell_ranges],
+                                                major_dimension=major_dimension)
+
+    async def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]],
+                                    major_dimension="ROWS") -> List[List[list]]:
+        """
+        Analogous to AspireSpreadsheetInterface.cross_sheet_batch_get. The default implementation runs one .get per
+        range, concurrently.
+        """
+        return list(await asyncio.gather(*[self.get(sheet_name, cell_range, major_dimension=major_dimension)
+                                           for sheet_name, cell_range in sheet_ranges]))
+
+    async def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        """
+        Analogous to AspireSpreadsheetInterface.set
+        """
+        raise NotImplementedError()
+
+    async def clear(self, sheet_name, cell_range):
+        """
+        Analogous to AspireSpreadsheetInterface.clear
+        """
+        raise NotImplementedError()
+
+    async def insert_range(self, sheet_name, cell_range):
+        """
+        Analogous to AspireSpreadsheetInterface.insert_range
+        """
+        raise NotImplementedError()
+
+    async def delete_range(self, sheet_name, cell_range):
+        """
+        Analogous to AspireSpreadsheetInterface.delete_range
+        """
+        raise NotImplementedError()
+
+    async def batch_write(self, writes: List[SheetWrite]):
+        """
+        Analogous to AspireSpreadsheetInterface.batch_write. The default implementation applies the writes one at a
+        time, in order.
+        """
+        for write in writes:
+            if write.kind == SET:
+                await self.set(write.sheet_name, write.cell_range, write.data)
+            elif write.kind == CLEAR:
+                await self.clear(write.sheet_name, write.cell_range)
+            elif write.kind == INSERT:
+                await self.insert_range(write.sheet_name, write.cell_range)
+            elif write.kind == DELETE:
+                await self.delete_range(write.sheet_name, write.cell_range)
+            else:
+                raise ValueError("Unknown kind of write: '{}'".format(write.kind))
+
+    async def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        """
+        Analogous to AspireSpreadsheetInterface.sheet_size
+        """
+        return None
+
+    async def fingerprint(self) -> Optional[str]:
+        """
+        Analogous to AspireSpreadsheetInterface.fingerprint
+        """
+        return None
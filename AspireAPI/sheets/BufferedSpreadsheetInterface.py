@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from itertools import zip_longest
+from threading import local
+from typing import List, Optional, Tuple
+
+from AspireAPI.sheets.A1Notation import parse_range, ranges_overlap
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET, CLEAR, \
+    INSERT, DELETE
+
+
+class BufferedSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Wraps another AspireSpreadsheetInterface, with the ability to hold back writes and send them all at once.
+
+    Outside of .buffered() this is a transparent wrapper. Inside of it, every write (set, clear, insert_range,
+    delete_range, batch_write) is queued, and the whole queue is sent as a single batch_write when the outermost
+    .buffered() block exits. If it exits through an exception, the queue is discarded instead, so nothing that was
+    written inside the block reaches the spreadsheet.
+
+    Reads are still executed immediately. If a read overlaps a queued write, the queue is flushed before reading, so
+    reads always see the effect of earlier writes (at the cost of an extra query). .fingerprint is the exception: it
+    never flushes, and so doesn't account for the queued writes.
+
+    Each thread has a queue of its own: .buffered() only holds back the writes made by the thread that entered it, and
+    .flush/.discard only affect the calling thread's queue - so this is as safe to share between threads as the
+    wrapped interface is.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface):
+        self._interface = interface
+        self._local = local()
+
+    @property
+    def _depth(self) -> int:
+        return getattr(self._local, "depth", 0)
+
+    @_depth.setter
+    def _depth(self, depth: int):
+        self._local.depth = depth
+
+    @property
+    def _pending(self) -> List[SheetWrite]:
+        if not hasattr(self._local, "pending"):
+            self._local.pending = []
+        return self._local.pending
+
+    @_pending.setter
+    def _pending(self, pending: List[SheetWrite]):
+        self._local.pending = pending
+
+    @property
+    def is_buffering(self) -> bool:
+        """
+        :return: whether the calling thread is within .buffered()
+        """
+        return self._depth > 0
+
+    @contextmanager
+    def buffered(self):
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            if self._depth == 0:
+                self.discard()
+            raise
+        self._depth -= 1
+        if self._depth == 0:
+            self.flush()
+
+    def flush(self):
+        """
+        Sends all writes queued by the calling thread (if any) as a single batch_write
+        """
+        if not self._pending:
+            return
+        writes = self._pending
+        self._pending = []
+        self._interface.batch_write(writes)
+
+    def discard(self):
+        """
+        Drops all writes queued by the calling thread without sending them
+        """
+        self._pending = []
+
+    def _flush_if_overlapping(self, sheet_ranges: List[Tuple[str, str]]):
+        if not self._pending:
+            return
+        parsed = [(sheet_name, parse_range(cell_range)) for sheet_name, cell_range in sheet_ranges]
+        for write in self._pending:
+            write_range = parse_range(write.cell_range)
+            if write.kind in (INSERT, DELETE):
+                # these move every cell below them around
+                write_range = write_range._replace(last_row=None)
+            if any(sheet_name == write.sheet_name and ranges_overlap(cell_range, write_range)
+                   for sheet_name, cell_range in parsed):
+                self.flush()
+                return
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        self._flush_if_overlapping([(sheet_name, cell_range)])
+        return self._interface.get(sheet_name, cell_range, major_dimension=major_dimension)
+
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        self._flush_if_overlapping([(sheet_name, cell_range) for cell_range in cell_ranges])
+        return self._interface.batch_get(sheet_name, cell_ranges, major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        self._flush_if_overlapping(sheet_ranges)
+        return self._interface.cross_sheet_batch_get(sheet_ranges, major_dimension=major_dimension)
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        if self.is_buffering:
+            if major_dimension != "ROWS":
+                # queued (and sent) as rows, like every other SheetWrite
+                data = [list(row) for row in zip_longest(*data, fillvalue="")]
+            self._pending.append(SheetWrite(SET, sheet_name, cell_range, data))
+        else:
+            return self._interface.set(sheet_name, cell_range, data, major_dimension=major_dimension)
+
+    def clear(self, sheet_name, cell_range):
+        if self.is_buffering:
+            self._pending.append(SheetWrite(CLEAR, sheet_name, cell_range))
+        else:
+            return self._interface.clear(sheet_name, cell_range)
+
+    def insert_range(self, sheet_name, cell_range):
+        if self.is_buffering:
+            self._pending.append(SheetWrite(INSERT, sheet_name, cell_range))
+        else:
+            return self._interface.insert_range(sheet_name, cell_range)
+
+    def delete_range(self, sheet_name, cell_range):
+        if self.is_buffering:
+            self._pending.append(SheetWrite(DELETE, sheet_name, cell_range))
+        else:
+            return self._interface.delete_range(sheet_name, cell_range)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        if self.is_buffering:
+            self._pending.extend(writes)
+        else:
+            return self._interface.batch_write(writes)
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return self._interface.sheet_size(sheet_name)
+
+    def fingerprint(self) -> Optional[str]:
+        # inside .buffered(), this is the fingerprint from before the queued writes - sending them early to get an up to
+        # date one would break the promise that they all go out together (and it would change again when they do)
+        return self._interface.fingerprint()
+
+    @property
+    def thread_safe(self) -> bool:
+        return self._interface.thread_safe
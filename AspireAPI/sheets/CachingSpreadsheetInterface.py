@@ -0,0 +1,158 @@
+from bisect import bisect_right, insort
+from collections import OrderedDict
+from itertools import count
+from time import monotonic
+from typing import List, Optional, Tuple, Union
+from datetime import timedelta as TimeDelta
+
+from AspireAPI.sheets.A1Notation import CellRange, parse_range, ranges_overlap
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET, CLEAR, \
+    INSERT, DELETE
+
+
+class _RangeIndex:
+    """
+    The ranges of every cached entry of a single sheet, sorted by their first row, so that finding the ones that
+    overlap some other range only has to look at those that start before it ends.
+    """
+
+    def __init__(self):
+        self._entries = []  # (first_row, tiebreaker, cell_range, key)
+        self._tiebreaker = count()
+
+    def add(self, cell_range: CellRange, key):
+        insort(self._entries, (cell_range.first_row, next(self._tiebreaker), cell_range, key))
+
+    def remove(self, key):
+        self._entries = [entry for entry in self._entries if entry[3] != key]
+
+    def overlapping(self, cell_range: CellRange) -> list:
+        if cell_range.last_row is None:
+            candidates = self._entries
+        else:
+            candidates = self._entries[:bisect_right(self._entries, (cell_range.last_row, float("inf")))]
+        return [key for _, _, other_range, key in candidates if ranges_overlap(cell_range, other_range)]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachingSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Wraps another AspireSpreadsheetInterface, remembering the results of reads so that repeating them doesn't take
+    a query.
+
+    Results are remembered for each (sheet, range, major dimension) for at most ttl seconds, and at most max_entries
+    of them are kept at a time (dropping the least recently used ones first). Any write made through this object
+    forgets every remembered result that it may have changed, i.e. whose range overlaps the written one (or lies below
+    it, for insert_range/delete_range). Writes made by anything else are, of course, not noticed - so the ttl should be
+    set according to how stale a read is allowed to be.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface, ttl: Union[TimeDelta, int, float] = 60,
+                 max_entries: int = 256):
+        if isinstance(ttl, TimeDelta):
+            ttl = ttl.total_seconds()
+
+        self._interface = interface
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # (sheet_name, cell_range, major_dimension) -> (time read, data)
+        self._indices = dict()  # sheet_name -> _RangeIndex
+
+    @staticmethod
+    def _copy(data: List[list]) -> List[list]:
+        # callers are free to modify what they get, which mustn't affect what is remembered
+        return [list(row) for row in data]
+
+    def _lookup(self, key) -> Optional[List[list]]:
+        if key not in self._entries:
+            return None
+        time_read, data = self._entries[key]
+        if monotonic() - time_read > self.ttl:
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return self._copy(data)
+
+    def _remember(self, key, data: List[list]):
+        if key in self._entries:
+            self._forget(key)
+        sheet_name, cell_range, _ = key
+        self._entries[key] = (monotonic(), self._copy(data))
+        self._indices.setdefault(sheet_name, _RangeIndex()).add(parse_range(cell_range), key)
+        while len(self._entries) > self.max_entries:
+            self._forget(next(iter(self._entries)))
+
+    def _forget(self, key):
+        del self._entries[key]
+        self._indices[key[0]].remove(key)
+
+    def _invalidate(self, write: SheetWrite):
+        if write.sheet_name not in self._indices:
+            return
+        cell_range = parse_range(write.cell_range)
+        if write.kind in (INSERT, DELETE):
+            cell_range = cell_range._replace(last_row=None)
+        for key in self._indices[write.sheet_name].overlapping(cell_range):
+            self._forget(key)
+
+    def invalidate(self, sheet_name=None):
+        """
+        Forgets everything remembered about the given sheet (or about every sheet, if None)
+        """
+        keys = [key for key in self._entries if sheet_name is None or key[0] == sheet_name]
+        for key in keys:
+            self._forget(key)
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        return self.cross_sheet_batch_get([(sheet_name, cell_range)], major_dimension=major_dimension)[0]
+
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        return self.cross_sheet_batch_get([(sheet_name, cell_range) for cell_range in cell_ranges],
+                                          major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        results = [self._lookup((sheet_name, cell_range, major_dimension)) for sheet_name, cell_range in sheet_ranges]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if len(missing) == 1:
+            sheet_name, cell_range = sheet_ranges[missing[0]]
+            fetched = [self._interface.get(sheet_name, cell_range, major_dimension=major_dimension)]
+        elif missing:
+            fetched = self._interface.cross_sheet_batch_get([sheet_ranges[i] for i in missing],
+                                                            major_dimension=major_dimension)
+        else:
+            fetched = []
+        for i, data in zip(missing, fetched):
+            sheet_name, cell_range = sheet_ranges[i]
+            self._remember((sheet_name, cell_range, major_dimension), data)
+            results[i] = data
+        return results
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        self._invalidate(SheetWrite(SET, sheet_name, cell_range, data))
+        return self._interface.set(sheet_name, cell_range, data, major_dimension=major_dimension)
+
+    def clear(self, sheet_name, cell_range):
+        self._invalidate(SheetWrite(CLEAR, sheet_name, cell_range))
+        return self._interface.clear(sheet_name, cell_range)
+
+    def insert_range(self, sheet_name, cell_range):
+        self._invalidate(SheetWrite(INSERT, sheet_name, cell_range))
+        return self._interface.insert_range(sheet_name, cell_range)
+
+    def delete_range(self, sheet_name, cell_range):
+        self._invalidate(SheetWrite(DELETE, sheet_name, cell_range))
+        return self._interface.delete_range(sheet_name, cell_range)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        for write in writes:
+            self._invalidate(write)
+        return self._interface.batch_write(writes)
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return self._interface.sheet_size(sheet_name)
+
+    def fingerprint(self) -> Optional[str]:
+        return self._interface.fingerprint()
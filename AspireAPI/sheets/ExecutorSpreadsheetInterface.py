@@ -0,0 +1,89 @@
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite
+from AspireAPI.sheets.AsyncSpreadsheetInterface import AsyncSpreadsheetInterface
+
+
+# size of the pool for interfaces that are safe to use from several threads - enough for the dashboard, both tables
+# and one more thing to be in flight at the same time
+_DEFAULT_MAX_WORKERS = 4
+
+
+class ExecutorSpreadsheetInterface(AsyncSpreadsheetInterface):
+    """
+    Specification of AsyncSpreadsheetInterface that runs the queries of a regular (blocking) AspireSpreadsheetInterface
+    on a bounded pool of worker threads, so that the event loop itself never blocks on them.
+
+    At most max_workers queries run at the same time. By default that's a few, if the interface is safe to use from
+    several threads at once (see AspireSpreadsheetInterface.thread_safe - e.g. GoogleSheetsInterface with
+    pooled_transport=True, or LocalSpreadsheetInterface), and 1 otherwise. With 1, the queries to this spreadsheet run
+    one after the other, however many are awaited at once - what's gained is only that the event loop can do other
+    work (e.g. serve other spreadsheets, each with its own ExecutorSpreadsheetInterface) while a query is in flight.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface, max_workers: Optional[int] = None,
+                 executor: Optional[Executor] = None):
+        """
+        :param interface: the interface whose queries are to be run on the pool
+        :param max_workers: size of the pool (see above for the default). Ignored if executor is given. Should only
+                            be more than 1 if the interface is safe to use from several threads at once.
+        :param executor: pool to run the queries on, if it should be shared with something else. It is then up to
+                         the caller to shut it down.
+        """
+        self._interface = interface
+        if max_workers is None:
+            max_workers = _DEFAULT_MAX_WORKERS if interface.thread_safe else 1
+        self._owns_executor = executor is None
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if executor is None else executor
+
+    @property
+    def interface(self) -> AspireSpreadsheetInterface:
+        return self._interface
+
+    async def run(self, function, *args, **kwargs):
+        """
+        Runs function(*args, **kwargs) on the pool, and returns its result
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(function, *args, **kwargs))
+
+    def close(self):
+        """
+        Shuts down the pool (if it was created by this object), waiting for running queries to finish
+        """
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+
+    async def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        return await self.run(self._interface.get, sheet_name, cell_range, major_dimension=major_dimension)
+
+    async def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        return await self.run(self._interface.batch_get, sheet_name, cell_ranges, major_dimension=major_dimension)
+
+    async def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]],
+                                    major_dimension="ROWS") -> List[List[list]]:
+        return await self.run(self._interface.cross_sheet_batch_get, sheet_ranges, major_dimension=major_dimension)
+
+    async def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        return await self.run(self._interface.set, sheet_name, cell_range, data, major_dimension=major_dimension)
+
+    async def clear(self, sheet_name, cell_range):
+        return await self.run(self._interface.clear, sheet_name, cell_range)
+
+    async def insert_range(self, sheet_name, cell_range):
+        return await self.run(self._interface.insert_range, sheet_name, cell_range)
+
+    async def delete_range(self, sheet_name, cell_range):
+        return await self.run(self._interface.delete_range, sheet_name, cell_range)
+
+    async def batch_write(self, writes: List[SheetWrite]):
+        return await self.run(self._interface.batch_write, writes)
+
+    async def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return await self.run(self._interface.sheet_size, sheet_name)
+
+    async def fingerprint(self) -> Optional[str]:
+        return await self.run(self._interface.fingerprint)
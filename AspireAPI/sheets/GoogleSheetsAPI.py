@@ -1,36 +1,160 @@
-from typing import List
+from threading import Lock, local
+from typing import List, Optional, Tuple
 
-from googleapiclient.discovery import build
+from AspireAPI.sheets.A1Notation import CellRange, parse_range, range_shape
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, CLEAR, INSERT, \
+    DELETE, split_queries
 
-from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface
+
+_services = dict()  # (api, version, id(credentials)) -> (credentials, service)
+_services_lock = Lock()
+
+
+def _build_service(api: str, version: str, credentials):
+    """
+    Same as googleapiclient.discovery.build, except that it is only imported on the first call (importing it takes
+    a good while), the service is built from the discovery document that ships with it (rather than one fetched over
+    the network), and services are reused for as long as they are built with the same credentials.
+    """
+    key = (api, version, id(credentials))
+    with _services_lock:
+        cached = _services.get(key)
+        # the cache keeps the credentials alive, so their id can't have been reused by some other object
+        if cached is not None and cached[0] is credentials:
+            return cached[1]
+        from googleapiclient.discovery import build
+        service = build(api, version, credentials=credentials, static_discovery=True, cache_discovery=False)
+        _services[key] = (credentials, service)
+        return service
 
 
 class GoogleSheetsInterface(AspireSpreadsheetInterface):
     """
     Straightforward specification of AspireSpreadsheetInterface by means of google's actual API for google sheets
+
+    By default, every query goes through the single HTTP connection that google's client sets up, which must not be
+    used by two threads at once. With pooled_transport=True, each thread gets a connection of its own instead (kept
+    alive between its queries), so that the same object can be used from several threads in parallel - e.g. from an
+    ExecutorSpreadsheetInterface with max_workers > 1.
     """
 
-    def __init__(self, spreadsheet_id, credentials):
+    def __init__(self, spreadsheet_id, credentials, pooled_transport=False, timeout: Optional[float] = None):
         """
         :param spreadsheet_id: Spreadsheet id. When opening the spreadsheet, the url should be of the form
                                https://docs.google.com/spreadsheets/d/<spreadsheet-id>/<some other stuff>
         :param credentials: a google.oauth2.credentials.Credentials object.
                             Refer to google documentation for how to generate these.
+        :param pooled_transport: whether to give each thread its own connection (see above)
+        :param timeout: seconds after which a query with no response is given up on. Only used if pooled_transport.
         """
         self._spreadsheet_id = spreadsheet_id
         self._credentials = credentials
-        self._service = build('sheets', 'v4', credentials=credentials)
-        self._spreadsheets = self._service.spreadsheets()
+        self._pooled_transport = pooled_transport
+        self._timeout = timeout
+        self._thread_local = local()
+        self._spreadsheets_resource = None
+        self._sheet_ids = dict()
+        self._drive_files = None
 
-    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+    @property
+    def _spreadsheets(self):
+        # built on first use, so that constructing this object is free (e.g. if everything needed is cached)
+        if self._spreadsheets_resource is None:
+            self._spreadsheets_resource = _build_service('sheets', 'v4', self._credentials).spreadsheets()
+        return self._spreadsheets_resource
+
+    def _http(self):
+        http = getattr(self._thread_local, "http", None)
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = self._thread_local.http = AuthorizedHttp(self._credentials, http=httplib2.Http(timeout=self._timeout))
+        return http
+
+    def _execute(self, request) -> dict:
+        if self._pooled_transport:
+            return request.execute(http=self._http())
+        return request.execute()
+
+    @staticmethod
+    def _range_str(sheet_name, cell_range):
         if " " in sheet_name:
             sheet_name = "'{}'".format(sheet_name)
-        range_str = "{}!{}".format(sheet_name, cell_range)
-        data = self._spreadsheets.values().get(
+        return "{}!{}".format(sheet_name, cell_range)
+
+    def _sheet_properties(self) -> dict:
+        response_obj = self._execute(self._spreadsheets.get(
+            spreadsheetId=self._spreadsheet_id,
+            fields="sheets.properties(sheetId,title,gridProperties(rowCount,columnCount))"
+        ))
+        properties = {sheet["properties"]["title"]: sheet["properties"] for sheet in response_obj["sheets"]}
+        for title, sheet_properties in properties.items():
+            self._sheet_ids[title] = sheet_properties["sheetId"]
+        return properties
+
+    def _sheet_id(self, sheet_name) -> int:
+        if sheet_name not in self._sheet_ids:
+            self._sheet_properties()
+        return self._sheet_ids[sheet_name]
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        grid_properties = self._sheet_properties()[sheet_name]["gridProperties"]
+        return grid_properties["rowCount"], grid_properties["columnCount"]
+
+    @property
+    def thread_safe(self) -> bool:
+        return self._pooled_transport
+
+    def fingerprint(self) -> Optional[str]:
+        """
+        Uses the version number that google drive keeps of the spreadsheet, which goes up with every change to it.
+        This takes a query to the drive API (which has its own quotas), and the credentials to have one of the drive
+        scopes - e.g. https://www.googleapis.com/auth/drive.metadata.readonly - without which this returns None.
+        """
+        from googleapiclient.errors import HttpError
+        try:
+            if self._drive_files is None:
+                self._drive_files = _build_service('drive', 'v3', self._credentials).files()
+            response_obj = self._execute(self._drive_files.get(fileId=self._spreadsheet_id, fields="version"))
+        except HttpError as e:
+            if e.resp.status in (401, 403):
+                return None
+            raise
+        return "{}:{}".format(self._spreadsheet_id, response_obj["version"])
+
+    def _grid_range(self, sheet_name, cell_range: CellRange) -> dict:
+        if range_shape(cell_range) is None:
+            raise ValueError("Expected a bounded range, got {}".format(cell_range))
+        return {
+            "sheetId": self._sheet_id(sheet_name),
+            "startRowIndex": cell_range.first_row,
+            "endRowIndex": cell_range.last_row + 1,
+            "startColumnIndex": cell_range.first_column,
+            "endColumnIndex": cell_range.last_column + 1,
+        }
+
+    def _shift_requests(self, write: SheetWrite) -> List[dict]:
+        cell_range = parse_range(write.cell_range)
+        grid_range = self._grid_range(write.sheet_name, cell_range)
+        if write.kind == DELETE:
+            return [{"deleteRange": {"range": grid_range, "shiftDimension": "ROWS"}}]
+        # newly inserted cells come with no formatting or data validation, so copy those over from the row right
+        # below them (which, once the insertion is applied, is the first of the rows that were shifted down)
+        row_below = self._grid_range(write.sheet_name, cell_range._replace(first_row=cell_range.last_row + 1,
+                                                                           last_row=cell_range.last_row + 1))
+        return [
+            {"insertRange": {"range": grid_range, "shiftDimension": "ROWS"}},
+            {"copyPaste": {"source": row_below, "destination": grid_range, "pasteType": "PASTE_FORMAT"}},
+            {"copyPaste": {"source": row_below, "destination": grid_range, "pasteType": "PASTE_DATA_VALIDATION"}},
+        ]
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        range_str = self._range_str(sheet_name, cell_range)
+        data = self._execute(self._spreadsheets.values().get(
             spreadsheetId=self._spreadsheet_id,
             range=range_str,
             majorDimension=major_dimension
-        ).execute()
+        ))
         assert data["range"] == range_str
         assert data["majorDimension"] == major_dimension
         if "values" in data:
@@ -38,25 +162,76 @@ class GoogleSheetsInterface(AspireSpreadsheetInterface):
         else:
             return []
 
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        if not sheet_ranges:
+            return []
+        range_strs = [self._range_str(sheet_name, cell_range) for sheet_name, cell_range in sheet_ranges]
+        data = self._execute(self._spreadsheets.values().batchGet(
+            spreadsheetId=self._spreadsheet_id,
+            ranges=range_strs,
+            majorDimension=major_dimension
+        ))
+        assert data["spreadsheetId"] == self._spreadsheet_id
+        value_ranges = data["valueRanges"]
+        assert len(value_ranges) == len(range_strs)
+        results = []
+        for range_str, value_range in zip(range_strs, value_ranges):
+            assert value_range["range"] == range_str
+            results.append(value_range.get("values", []))
+        return results
+
     def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
-        if " " in sheet_name:
-            sheet_name = "'{}'".format(sheet_name)
-        range_str = "{}!{}".format(sheet_name, cell_range)
-        response_obj = self._spreadsheets.values().update(
+        range_str = self._range_str(sheet_name, cell_range)
+        response_obj = self._execute(self._spreadsheets.values().update(
             spreadsheetId=self._spreadsheet_id,
             range=range_str,
             valueInputOption="USER_ENTERED",
             body={"values": data},
             # majorDimension=major_dimension TODO
-        ).execute()
+        ))
         assert response_obj["spreadsheetId"]==self._spreadsheet_id
 
     def clear(self, sheet_name, cell_range):
-        if " " in sheet_name:
-            sheet_name = "'{}'".format(sheet_name)
-        range_str = "{}!{}".format(sheet_name, cell_range)
-        self._spreadsheets.values().clear(
+        range_str = self._range_str(sheet_name, cell_range)
+        self._execute(self._spreadsheets.values().clear(
             spreadsheetId=self._spreadsheet_id,
             range=range_str,
             body=dict()
-        ).execute()
+        ))
+
+    def batch_write(self, writes: List[SheetWrite]):
+        """
+        Sends the writes in as few queries as possible (see split_queries): consecutive insertions/deletions of ranges
+        as a single spreadsheets.batchUpdate, and consecutive sets and clears as a single values.batchUpdate - bounded
+        clears are sent as writes of empty strings (which the API treats as clearing the cell), so that they can share
+        a query with the sets.
+        """
+        for group in split_queries(writes):
+            if group[0].kind in (INSERT, DELETE):
+                response_obj = self._execute(self._spreadsheets.batchUpdate(
+                    spreadsheetId=self._spreadsheet_id,
+                    body={"requests": [request for write in group for request in self._shift_requests(write)]}
+                ))
+                assert response_obj["spreadsheetId"] == self._spreadsheet_id
+                continue
+            if group[0].kind == CLEAR and range_shape(parse_range(group[0].cell_range)) is None:
+                self.clear(group[0].sheet_name, group[0].cell_range)
+                continue
+            data = []
+            for write in group:
+                values = write.data
+                if write.kind == CLEAR:
+                    rows, columns = range_shape(parse_range(write.cell_range))
+                    values = [[""] * columns for _ in range(rows)]
+                data.append({"range": self._range_str(write.sheet_name, write.cell_range), "values": values})
+            response_obj = self._execute(self._spreadsheets.values().batchUpdate(
+                spreadsheetId=self._spreadsheet_id,
+                body={"valueInputOption": "USER_ENTERED", "data": data}
+            ))
+            assert response_obj["spreadsheetId"] == self._spreadsheet_id
+
+    def insert_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(INSERT, sheet_name, cell_range)])
+
+    def delete_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(DELETE, sheet_name, cell_range)])
@@ -0,0 +1,211 @@
+import json
+from bisect import bisect_left
+from collections import namedtuple
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET
+from AspireAPI.sheets.Tracing import current_operation, collect_throttle_waits
+
+
+# A single call made through an InstrumentedSpreadsheetInterface.
+# - method: name of the AspireSpreadsheetInterface method called
+# - operation: public method (e.g. "Transactions.pop") that made the call, or None if it was made directly
+# - sheet_ranges: list of (sheet_name, cell_range) that the call touched
+# - cells: number of (nonempty) cells read or written
+# - bytes_sent, bytes_received: approximate size of the values sent and received, as JSON
+# - seconds: how long the call took, including throttle_wait
+# - throttle_wait: how many of those seconds were spent waiting on a rate limiter (see ThrottledSpreadsheetInterface)
+# - error: name of the type of the exception raised by the call, or None if it succeeded
+CallRecord = namedtuple("CallRecord", "method operation sheet_ranges cells bytes_sent bytes_received seconds "
+                                      "throttle_wait error")
+
+
+def _payload_size(payload) -> int:
+    return len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+
+def _cell_count(data) -> int:
+    return sum(len(row) for row in data)
+
+
+class CallMetrics:
+    """
+    Counters and latency histograms of the calls recorded by an InstrumentedSpreadsheetInterface, broken down by
+    method, sheet and operation. Safe to share between threads.
+    """
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._series = dict()  # (method, sheet, operation) -> dict of counters
+        self._lock = Lock()
+
+    def record(self, call: CallRecord):
+        sheet_names = {sheet_name for sheet_name, _ in call.sheet_ranges}
+        sheet = sheet_names.pop() if len(sheet_names) == 1 else "*"
+        key = (call.method, sheet, call.operation or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"calls": 0, "errors": 0, "cells": 0, "bytes_sent": 0,
+                                              "bytes_received": 0, "seconds": 0.0, "throttle_wait_seconds": 0.0,
+                                              "buckets": [0] * (len(self.buckets) + 1)}
+            series["calls"] += 1
+            series["errors"] += call.error is not None
+            series["cells"] += call.cells
+            series["bytes_sent"] += call.bytes_sent
+            series["bytes_received"] += call.bytes_received
+            series["seconds"] += call.seconds
+            series["throttle_wait_seconds"] += call.throttle_wait
+            series["buckets"][bisect_left(self.buckets, call.seconds)] += 1
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def as_dict(self) -> list:
+        """
+        :return: one dict per (method, sheet, operation) seen, with its counters
+        """
+        with self._lock:
+            return [dict(series, method=method, sheet=sheet, operation=operation, buckets=list(series["buckets"]))
+                    for (method, sheet, operation), series in sorted(self._series.items())]
+
+    def to_json(self) -> str:
+        return json.dumps({"buckets": list(self.buckets), "series": self.as_dict()}, ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix="aspire_sheets") -> str:
+        """
+        :return: the metrics in Prometheus' text exposition format
+        """
+        escape = lambda value: value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        counters = [("calls", "calls_total", "Calls made to the spreadsheet"),
+                    ("errors", "errors_total", "Calls to the spreadsheet that raised an exception"),
+                    ("cells", "cells_total", "Cells read or written"),
+                    ("bytes_sent", "sent_bytes_total", "Approximate size of the values sent"),
+                    ("bytes_received", "received_bytes_total", "Approximate size of the values received"),
+                    ("throttle_wait_seconds", "throttle_wait_seconds_total", "Time spent waiting on rate limiters")]
+        all_series = self.as_dict()
+        lines = []
+        for field, name, description in counters:
+            lines.append("# HELP {}_{} {}".format(prefix, name, description))
+            lines.append("# TYPE {}_{} counter".format(prefix, name))
+            for series in all_series:
+                labels = "method=\"{}\",sheet=\"{}\",operation=\"{}\"".format(
+                    escape(series["method"]), escape(series["sheet"]), escape(series["operation"]))
+                lines.append("{}_{}{{{}}} {}".format(prefix, name, labels, series[field]))
+        name = "{}_call_duration_seconds".format(prefix)
+        lines.append("# HELP {} Duration of calls made to the spreadsheet".format(name))
+        lines.append("# TYPE {} histogram".format(name))
+        for series in all_series:
+            labels = "method=\"{}\",sheet=\"{}\",operation=\"{}\"".format(
+                escape(series["method"]), escape(series["sheet"]), escape(series["operation"]))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series["buckets"]):
+                cumulative += count
+                lines.append("{}_bucket{{{},le=\"{}\"}} {}".format(name, labels,
+                                                                  "+Inf" if bound == float("inf") else bound,
+                                                                  cumulative))
+            lines.append("{}_sum{{{}}} {}".format(name, labels, series["seconds"]))
+            lines.append("{}_count{{{}}} {}".format(name, labels, series["calls"]))
+        return "\n".join(lines) + "\n"
+
+
+class InstrumentedSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Wraps another AspireSpreadsheetInterface, recording every call made through it as a CallRecord - which is added to
+    .metrics and passed to each of the hooks.
+
+    Calls are attributed to the public method of Transactions, CategoryTransfers, Dashboard or Aspire that made them
+    (see Tracing.traced). To also tell apart the time spent waiting on a ThrottledSpreadsheetInterface, this should
+    wrap it, rather than the other way around.
+
+    Measuring payload sizes takes a JSON encoding of everything read and written, which is cheap next to a query to
+    google, but may not be next to a LocalSpreadsheetInterface.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface, hooks: Iterable[Callable[[CallRecord], None]] = (),
+                 metrics: Optional[CallMetrics] = None):
+        """
+        :param interface: the interface to be instrumented
+        :param hooks: functions to be called with the CallRecord of every call, once it has finished
+        :param metrics: where to aggregate the calls, if it should be shared with something else
+        """
+        self._interface = interface
+        self.hooks = list(hooks)
+        self.metrics = CallMetrics() if metrics is None else metrics
+
+    def _call(self, method_name: str, sheet_ranges: List[Tuple[str, str]], sent, function, *args, **kwargs):
+        error = None
+        result = None
+        start = perf_counter()
+        with collect_throttle_waits() as waits:
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self._record(method_name, sheet_ranges, sent, result, perf_counter() - start, sum(waits), error)
+        return result
+
+    def _record(self, method_name: str, sheet_ranges: List[Tuple[str, str]], sent, result, seconds: float,
+                throttle_wait: float, error: Optional[str]):
+        if method_name == "get" and result is not None:
+            cells = _cell_count(result)
+        elif method_name in ("batch_get", "cross_sheet_batch_get") and result is not None:
+            cells = sum(_cell_count(data) for data in result)
+        else:
+            cells = _cell_count(sent) if sent else 0
+        call = CallRecord(method_name, current_operation(), sheet_ranges, cells,
+                          _payload_size([sheet_ranges, sent]),
+                          0 if result is None else _payload_size(result),
+                          seconds, throttle_wait, error)
+        self.metrics.record(call)
+        for hook in self.hooks:
+            hook(call)
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        return self._call("get", [(sheet_name, cell_range)], None, self._interface.get,
+                          sheet_name, cell_range, major_dimension=major_dimension)
+
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        return self._call("batch_get", [(sheet_name, cell_range) for cell_range in cell_ranges], None,
+                          self._interface.batch_get, sheet_name, cell_ranges, major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        return self._call("cross_sheet_batch_get", list(sheet_ranges), None,
+                          self._interface.cross_sheet_batch_get, sheet_ranges, major_dimension=major_dimension)
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return self._call("sheet_size", [(sheet_name, "")], None, self._interface.sheet_size, sheet_name)
+
+    def fingerprint(self) -> Optional[str]:
+        return self._call("fingerprint", [], None, self._interface.fingerprint)
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        return self._call("set", [(sheet_name, cell_range)], data, self._interface.set,
+                          sheet_name, cell_range, data, major_dimension=major_dimension)
+
+    def clear(self, sheet_name, cell_range):
+        return self._call("clear", [(sheet_name, cell_range)], None, self._interface.clear, sheet_name, cell_range)
+
+    def insert_range(self, sheet_name, cell_range):
+        return self._call("insert_range", [(sheet_name, cell_range)], None, self._interface.insert_range,
+                          sheet_name, cell_range)
+
+    def delete_range(self, sheet_name, cell_range):
+        return self._call("delete_range", [(sheet_name, cell_range)], None, self._interface.delete_range,
+                          sheet_name, cell_range)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        sent = [row for write in writes if write.kind == SET for row in write.data]
+        return self._call("batch_write", [(write.sheet_name, write.cell_range) for write in writes], sent,
+                          self._interface.batch_write, writes)
+
+    @property
+    def thread_safe(self) -> bool:
+        return self._interface.thread_safe
@@ -0,0 +1,425 @@
+import json
+import os
+from collections import namedtuple
+from itertools import zip_longest
+from threading import RLock
+from typing import Dict, List, Optional, Tuple
+
+from AspireAPI.sheets.A1Notation import CellRange, parse_range, format_range
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET, CLEAR, \
+    INSERT, DELETE
+
+
+# What JournaledSpreadsheetInterface.recover did with the operations it found unfinished:
+# - qt_replayed: how many were carried through to the end
+# - qt_rolled_back: how many had not reached the spreadsheet at all, and were dropped
+RecoveryResult = namedtuple("RecoveryResult", "qt_replayed qt_rolled_back")
+
+# how many rows of each range inserted/deleted are read back to tell whether it went through (see _probe_plan)
+_PROBE_ROWS = 3
+
+
+def _steps(writes: List[SheetWrite]) -> List[Tuple[int, int]]:
+    """
+    Splits writes into runs of consecutive insertions/deletions and runs of consecutive sets/clears, the same way
+    GoogleSheetsInterface.batch_write splits them into queries.
+
+    :return: (start, stop) of each run, as slice indices into writes
+    """
+    steps = []
+    for index, write in enumerate(writes):
+        if steps and _is_shift(writes[steps[-1][0]]) == _is_shift(write):
+            steps[-1][1] = index+1
+        else:
+            steps.append([index, index+1])
+    return [(start, stop) for start, stop in steps]
+
+
+def _is_shift(write: SheetWrite) -> bool:
+    return write.kind in (INSERT, DELETE)
+
+
+def _origin(row: int, sheet_name, run: List[SheetWrite]) -> Optional[int]:
+    """
+    :param row: zero-based row of sheet_name, as it would be after applying run (a run of insertions/deletions)
+    :return: the row that it would come from, as it was before applying run - or None if it would have been inserted
+    """
+    for write in reversed(run):
+        if write.sheet_name != sheet_name:
+            continue
+        cell_range = parse_range(write.cell_range)
+        if row < cell_range.first_row:
+            continue
+        qt_rows = cell_range.last_row - cell_range.first_row + 1
+        if write.kind == DELETE:
+            row += qt_rows
+        elif row <= cell_range.last_row:
+            return None
+        else:
+            row -= qt_rows
+    return row
+
+
+def _probe_plan(run: List[SheetWrite]) -> Dict[str, Tuple[int, int, List[int]]]:
+    """
+    Picks the rows to read back to tell whether run (a run of insertions/deletions) went through: the first few of
+    every range it inserts or deletes. Sheets where the ranges don't all span the same columns are left out, since
+    then it isn't whole rows that are moved around.
+
+    :return: (first column, last column, rows) by sheet name, all zero-based
+    """
+    spans = dict()
+    rows = dict()
+    for write in run:
+        cell_range = parse_range(write.cell_range)
+        span = (cell_range.first_column, cell_range.last_column)
+        if spans.setdefault(write.sheet_name, span) != span or None in span or cell_range.last_row is None:
+            spans[write.sheet_name] = None
+            continue
+        qt_rows = min(cell_range.last_row - cell_range.first_row + 1, _PROBE_ROWS)
+        rows.setdefault(write.sheet_name, set()).update(range(cell_range.first_row, cell_range.first_row + qt_rows))
+    return {sheet_name: (span[0], span[1], sorted(rows[sheet_name]))
+            for sheet_name, span in spans.items() if span is not None}
+
+
+def _blocks(rows: List[int]) -> List[Tuple[int, int]]:
+    """
+    :param rows: sorted, without repetitions
+    :return: (first, last) of each run of consecutive rows
+    """
+    blocks = []
+    for row in rows:
+        if blocks and blocks[-1][1] == row-1:
+            blocks[-1][1] = row
+        else:
+            blocks.append([row, row])
+    return [(first, last) for first, last in blocks]
+
+
+def _trimmed(cells: list) -> list:
+    cells = list(cells)
+    while cells and cells[-1] == "":
+        cells.pop()
+    return cells
+
+
+def _apply(unfinished: Dict[int, dict], record: dict):
+    """
+    Updates unfinished (see JournaledSpreadsheetInterface._read_journal) with a record of the journal
+    """
+    if "begin" in record:
+        unfinished[record["begin"]] = {"writes": [SheetWrite(*write) for write in record["writes"]],
+                                       "started": dict(), "done": set()}
+    elif "step" in record:
+        unfinished[record["of"]]["started"][record["step"]] = {"fingerprint": record["fingerprint"],
+                                                               "probe": record.get("probe", [])}
+    elif "done" in record:
+        unfinished[record["of"]]["done"].add(record["done"])
+    elif "end" in record:
+        unfinished.pop(record["end"], None)
+
+
+class JournaledSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Wraps another AspireSpreadsheetInterface, writing down every batch of writes in a journal (a local file) before
+    sending it, so that a batch that was cut short - by a crash, or by an error between the queries it takes - can be
+    carried through to the end later, through .recover.
+
+    # Why
+
+    A batch_write can take several queries: e.g. inserting a row into a table takes one query to make room for it and
+    another one to fill it in (see GoogleSheetsInterface.batch_write), and one left halfway through leaves an empty
+    row in the middle of the table. Sets and clears can be sent again at no harm, but insertions and deletions can't -
+    sending one twice shifts the table twice - so before sending each run of those it is written to the journal, and
+    after sending it, the fact that it was sent. If a run was cut short before the latter, .recover has to tell
+    whether it went through. For that, right before sending each run, the spreadsheet's fingerprint is taken, and the
+    first few rows of each range that the run inserts or deletes are read, along with the rows that it would move
+    there (see _probe_plan) - which takes two queries per run (one of them to the drive API, for
+    GoogleSheetsInterface). A fingerprint that changed since means that the run went through. One that didn't is
+    double-checked against the rows, since google drive's version of a file (which is what GoogleSheetsInterface uses)
+    may take a moment to catch up with an edit: the run is only sent again if they are as they were before it, and
+    not as they would be after it. If neither tells, .recover raises an exception (see .recover's abandon).
+
+    This takes each run of insertions and deletions to be applied all or nothing - as is the case for
+    GoogleSheetsInterface - and nobody else to edit the spreadsheet until .recover has run.
+
+    # The journal
+
+    Is a file with a line of json per record, each flushed to disk (os.fsync) before going on:
+        {"begin": id, "writes": [[kind, sheet_name, cell_range, data], ...]}  - before sending anything
+        {"step": i, "of": id, "fingerprint": ..., "probe": [[sheet_name, rows_in_grid, [[row, cells], ...]], ...]}
+            - before the i-th run of insertions/deletions (see _steps), with the rows read by ._probe
+        {"done": i, "of": id}  - after it
+        {"end": id}  - once the whole batch went through (or was dealt with by .recover)
+    Once every batch in it has ended and it's bigger than max_size bytes, the file is emptied.
+
+    While a batch is unfinished, further writes raise an exception instead of being sent, since they were made on the
+    assumption that it went through. Reads are unaffected.
+    """
+
+    def __init__(self, interface: AspireSpreadsheetInterface, path, max_size=1 << 20):
+        """
+        :param path: path of the journal. Each spreadsheet should have its own
+        :param max_size: size (in bytes) from which the journal is emptied when nothing in it is unfinished
+        """
+        self._interface = interface
+        self.path = path
+        self.max_size = max_size
+        self._lock = RLock()
+        self._unfinished = self._read_journal()
+        self._next_id = max(self._unfinished, default=-1) + 1
+
+    def _read_journal(self) -> Dict[int, dict]:
+        """
+        :return: the batches in the journal that haven't ended, by id, as dicts with their "writes", "started"
+                 (dict from index of run to the fingerprint recorded before it) and "done" (set of indices of runs)
+        """
+        try:
+            with open(self.path, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return dict()
+        unfinished = dict()
+        *lines, last = content.split(b"\n")
+        for line_number, line in enumerate(lines, start=1):
+            try:
+                record = json.loads(line.decode("utf-8"))
+            except ValueError:
+                raise Exception("Line {} of the journal at {} is corrupted".format(line_number, self.path))
+            _apply(unfinished, record)
+        if last:
+            # the last record was cut short while being written (either before the end of line, or halfway through,
+            # in which case whatever it was about didn't happen) - so it's ended or dropped before appending anything
+            try:
+                record = json.loads(last.decode("utf-8"))
+            except ValueError:
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(content)-len(last))
+                    os.fsync(f.fileno())
+            else:
+                _apply(unfinished, record)
+                with open(self.path, "ab") as f:
+                    f.write(b"\n")
+                    os.fsync(f.fileno())
+        return unfinished
+
+    def _append(self, record: dict):
+        """
+        Writes record to the journal, and applies it to ._unfinished
+        """
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
+            f.flush()
+            os.fsync(f.fileno())
+        _apply(self._unfinished, record)
+
+    def _end(self, id_: int):
+        self._append({"end": id_})
+        if not self._unfinished and os.path.getsize(self.path) > self.max_size:
+            with open(self.path, "w", encoding="utf-8") as f:
+                os.fsync(f.fileno())
+
+    @property
+    def unfinished(self) -> int:
+        """
+        :return: how many batches in the journal haven't gone through (and are waiting for .recover)
+        """
+        return len(self._unfinished)
+
+    def _probe(self, run: List[SheetWrite]) -> list:
+        """
+        Reads what .recover needs to tell whether run (a run of insertions/deletions) went through, before it is sent:
+        the rows picked by _probe_plan, and the rows that run would move to them.
+
+        :return: [sheet name, rows in its grid (or None if unknown), [[row, cells], ...]] for each sheet in the plan
+        """
+        sheets = []
+        sheet_ranges = []
+        for sheet_name, (first_column, last_column, rows) in _probe_plan(run).items():
+            wanted = set(rows) | {_origin(row, sheet_name, run) for row in rows}
+            wanted.discard(None)
+            # the grid may end anywhere below the first range of the run - rows beyond it would move in as empty
+            grid_rows = None
+            within = parse_range(next(write.cell_range for write in run if write.sheet_name == sheet_name)).last_row
+            if max(wanted) > within:
+                size = self._interface.sheet_size(sheet_name)
+                if size is not None:
+                    grid_rows = size[0]
+                    within = grid_rows-1
+            blocks = _blocks(sorted(row for row in wanted if row <= within))
+            sheets.append((sheet_name, grid_rows, blocks))
+            sheet_ranges.extend((sheet_name, format_range(CellRange(first_column, first, last_column, last)))
+                                for first, last in blocks)
+
+        results = iter(self._interface.cross_sheet_batch_get(sheet_ranges) if sheet_ranges else [])
+        probe = []
+        for sheet_name, grid_rows, blocks in sheets:
+            rows = []
+            for first, last in blocks:
+                data = next(results)
+                rows.extend([row, _trimmed(data[row-first]) if row-first < len(data) else []]
+                            for row in range(first, last+1))
+            probe.append([sheet_name, grid_rows, rows])
+        return probe
+
+    def _probe_matches(self, run: List[SheetWrite], probe: list) -> Tuple[bool, bool]:
+        """
+        Reads back the rows picked by _probe_plan, to compare them with what ._probe read before run was sent.
+
+        :return: whether they are as they would be if run went through, and whether they are as they would be if it
+                 didn't (both True if there's nothing to compare)
+        """
+        plan = _probe_plan(run)
+        checks = []
+        for sheet_name, grid_rows, rows in probe:
+            before = {row: cells for row, cells in rows}
+            for row in plan.get(sheet_name, (None, None, []))[2]:
+                if row not in before:
+                    continue
+                origin = _origin(row, sheet_name, run)
+                if origin is None or grid_rows is not None and origin >= grid_rows:
+                    after = []
+                elif origin in before:
+                    after = before[origin]
+                else:
+                    continue
+                checks.append((sheet_name, row, after, before[row]))
+
+        blocks = []
+        for sheet_name in dict.fromkeys(sheet_name for sheet_name, _, _, _ in checks):
+            blocks.extend((sheet_name, first, last)
+                          for first, last in _blocks(sorted(row for name, row, _, _ in checks if name == sheet_name)))
+        sheet_ranges = [(sheet_name, format_range(CellRange(plan[sheet_name][0], first, plan[sheet_name][1], last)))
+                        for sheet_name, first, last in blocks]
+        now = dict()
+        results = self._interface.cross_sheet_batch_get(sheet_ranges) if sheet_ranges else []
+        for (sheet_name, first, _), data in zip(blocks, results):
+            for offset, cells in enumerate(data):
+                now[(sheet_name, first+offset)] = _trimmed(cells)
+        return (all(now.get((sheet_name, row), []) == after for sheet_name, row, after, _ in checks),
+                all(now.get((sheet_name, row), []) == before for sheet_name, row, _, before in checks))
+
+    def _went_through(self, id_: int, run: List[SheetWrite], started: dict) -> bool:
+        """
+        :param started: what was recorded right before sending run (see _apply)
+        :return: whether run, which was cut short, got to be applied
+        """
+        before = started["fingerprint"]
+        now = None if before is None else self._interface.fingerprint()
+        if before is not None and now is not None and before != now:
+            return True
+        # an unchanged fingerprint may also be one that is yet to catch up, so it has to be confirmed by the rows
+        applied, not_applied = self._probe_matches(run, started["probe"])
+        if applied == not_applied:
+            raise Exception("Can't tell whether the insertions/deletions of rows of unfinished batch {} in the journal "
+                            "at {} went through, since the spreadsheet's fingerprint didn't change and its rows are {} "
+                            "as they were before them and as they would be after them"
+                            .format(id_, self.path, "both" if applied else "neither"))
+        return applied
+
+    def _send(self, id_: int, writes: List[SheetWrite], first_step: int):
+        steps = _steps(writes)
+        for step in range(first_step, len(steps)):
+            start, stop = steps[step]
+            if _is_shift(writes[start]):
+                fingerprint = self._interface.fingerprint()
+                probe = self._probe(writes[start:stop])
+                self._append({"step": step, "of": id_, "fingerprint": fingerprint, "probe": probe})
+                self._interface.batch_write(writes[start:stop])
+                self._append({"done": step, "of": id_})
+            else:
+                self._interface.batch_write(writes[start:stop])
+        self._end(id_)
+
+    def _first_unsent_step(self, id_: int) -> Optional[int]:
+        """
+        :return: index of the first run of writes of the batch that has to be sent again, or None if the batch hadn't
+                 reached the spreadsheet at all
+        """
+        batch = self._unfinished[id_]
+        steps = _steps(batch["writes"])
+        # a run is only started once every run before it is through
+        known_sent = max(list(batch["done"]) + [step-1 for step in batch["started"]], default=-1)
+        step = known_sent+1
+        if step < len(steps) and step in batch["started"] and step not in batch["done"]:
+            start, stop = steps[step]
+            if self._went_through(id_, batch["writes"][start:stop], batch["started"][step]):
+                return step+1
+            return None if step == 0 else step
+        if step == 0 and _is_shift(batch["writes"][0]):
+            return None
+        # anything else may have been sent in part, but sets and clears can safely be sent again
+        return step
+
+    def recover(self, abandon=False) -> RecoveryResult:
+        """
+        Carries every unfinished batch in the journal through to the end, oldest first - sending again whatever part
+        of it may not have been sent - except for those that hadn't reached the spreadsheet at all, which are dropped.
+
+        :param abandon: if True, unfinished batches are dropped as they are, without sending anything. This is a last
+                        resort for batches that the spreadsheet rejects (e.g. a write out of the bounds of the sheet)
+                        and so can never go through, or that can't be told whether they went through (see above) -
+                        the tables they wrote to may have to be fixed by hand (see SheetTable.is_healthy)
+        """
+        qt_replayed, qt_rolled_back = 0, 0
+        with self._lock:
+            for id_ in sorted(self._unfinished):
+                if abandon:
+                    self._end(id_)
+                    qt_rolled_back += 1
+                    continue
+                first_step = self._first_unsent_step(id_)
+                if first_step is None:
+                    self._end(id_)
+                    qt_rolled_back += 1
+                else:
+                    self._send(id_, self._unfinished[id_]["writes"], first_step)
+                    qt_replayed += 1
+        return RecoveryResult(qt_replayed, qt_rolled_back)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        if not writes:
+            return
+        with self._lock:
+            if self._unfinished:
+                raise Exception("The journal at {} has {} unfinished batch(es) of writes, which have to be recovered "
+                                "(see Aspire.recover) before writing anything else".format(self.path, self.unfinished))
+            id_ = self._next_id
+            self._next_id += 1
+            self._append({"begin": id_, "writes": [list(write) for write in writes]})
+            self._send(id_, writes, 0)
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        if major_dimension != "ROWS":
+            # journaled (and sent) as rows, like every other SheetWrite
+            data = [list(row) for row in zip_longest(*data, fillvalue="")]
+        self.batch_write([SheetWrite(SET, sheet_name, cell_range, data)])
+
+    def clear(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(CLEAR, sheet_name, cell_range)])
+
+    def insert_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(INSERT, sheet_name, cell_range)])
+
+    def delete_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(DELETE, sheet_name, cell_range)])
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        return self._interface.get(sheet_name, cell_range, major_dimension=major_dimension)
+
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        return self._interface.batch_get(sheet_name, cell_ranges, major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        return self._interface.cross_sheet_batch_get(sheet_ranges, major_dimension=major_dimension)
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return self._interface.sheet_size(sheet_name)
+
+    def fingerprint(self) -> Optional[str]:
+        return self._interface.fingerprint()
+
+    @property
+    def thread_safe(self) -> bool:
+        return self._interface.thread_safe
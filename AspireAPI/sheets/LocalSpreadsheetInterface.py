@@ -0,0 +1,326 @@
+import json
+import re
+import uuid
+from collections import deque
+from threading import RLock
+from time import monotonic, sleep
+from typing import List, Optional, Tuple
+
+from AspireAPI.Locale import Locale
+from AspireAPI.sheets.A1Notation import CellRange, parse_range, range_shape
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, SET, CLEAR, \
+    INSERT, DELETE, split_queries
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised by LocalSpreadsheetInterface when a query goes over its quota - the counterpart to google's HTTP 429
+    """
+    status_code = 429
+
+
+class _Sheet:
+    """
+    A single sheet: a grid of rows x columns cells, of which only those up to the last nonempty one of each row are
+    actually stored.
+    """
+
+    def __init__(self, rows: int, columns: int):
+        self.rows = rows
+        self.columns = columns
+        self.data = []  # list of rows, each a list of strings, "" meaning an empty cell
+
+    def check_bounds(self, cell_range: CellRange, description: str):
+        if cell_range.first_row >= self.rows or cell_range.first_column >= self.columns \
+                or cell_range.last_row is not None and cell_range.last_row >= self.rows \
+                or cell_range.last_column is not None and cell_range.last_column >= self.columns:
+            raise Exception("Range ({}) exceeds grid limits. Max rows: {}, max columns: {}"
+                            .format(description, self.rows, self.columns))
+
+    def read(self, cell_range: CellRange) -> List[list]:
+        last_row = len(self.data) - 1 if cell_range.last_row is None else min(cell_range.last_row, len(self.data) - 1)
+        stop_column = None if cell_range.last_column is None else cell_range.last_column + 1
+        result = []
+        for row in self.data[cell_range.first_row:last_row + 1]:
+            cells = row[cell_range.first_column:stop_column]
+            while cells and cells[-1] == "":
+                cells.pop()
+            result.append(cells)
+        while result and not result[-1]:
+            result.pop()
+        return result
+
+    def write(self, first_row: int, first_column: int, data: List[list]):
+        for i, values in enumerate(data):
+            row_index = first_row + i
+            if row_index >= len(self.data):
+                if all(value == "" for value in values):
+                    continue
+                self.data.extend([] for _ in range(row_index - len(self.data) + 1))
+            row = self.data[row_index]
+            if len(row) < first_column + len(values):
+                row.extend([""] * (first_column + len(values) - len(row)))
+            row[first_column:first_column + len(values)] = values
+            while row and row[-1] == "":
+                row.pop()
+        while self.data and not self.data[-1]:
+            self.data.pop()
+
+    def clear(self, cell_range: CellRange):
+        last_row = len(self.data) - 1 if cell_range.last_row is None else min(cell_range.last_row, len(self.data) - 1)
+        for row_index in range(cell_range.first_row, last_row + 1):
+            row = self.data[row_index]
+            stop_column = len(row) if cell_range.last_column is None else min(cell_range.last_column + 1, len(row))
+            if stop_column > cell_range.first_column:
+                row[cell_range.first_column:stop_column] = [""] * (stop_column - cell_range.first_column)
+            while row and row[-1] == "":
+                row.pop()
+        while self.data and not self.data[-1]:
+            self.data.pop()
+
+    def shift(self, cell_range: CellRange, rows: int):
+        """
+        Moves every cell from cell_range.first_row downwards (within the columns of cell_range) by rows, which may be
+        negative, in which case the cells that would end up above cell_range.first_row are dropped.
+        """
+        first_column = cell_range.first_column
+        stop_column = cell_range.last_column + 1
+        start = cell_range.first_row if rows > 0 else cell_range.first_row - rows
+        moved = [self._cells(row_index, first_column, stop_column) for row_index in range(start, len(self.data))]
+        blanks = [[""] * (stop_column - first_column) for _ in range(abs(rows))]
+        # rewrites every row from cell_range.first_row to the end at once, vacated cells included
+        self.write(cell_range.first_row, first_column, blanks + moved if rows > 0 else moved + blanks)
+
+    def _cells(self, row_index: int, first_column: int, stop_column: int) -> list:
+        row = self.data[row_index]
+        return row[first_column:stop_column] + [""] * max(0, stop_column - max(first_column, len(row)))
+
+
+class LocalSpreadsheetInterface(AspireSpreadsheetInterface):
+    """
+    Specification of AspireSpreadsheetInterface that keeps the spreadsheet in memory, for benchmarking and testing
+    without touching google. It tries to behave like GoogleSheetsInterface in every way that the rest of this package
+    could notice:
+    - Ranges are in A1 notation, and going past the size of the grid of a sheet raises an exception.
+    - Trailing empty cells and rows are left out of what is read.
+    - Values are stored as typed in (USER_ENTERED) and read back as displayed. The only formatting that is emulated is
+      that of amounts of money in the currency of Locale, e.g. "€1000,5" is read back as "€1.000,50".
+    - Insertion and deletion of ranges shift the cells below, within the same columns.
+    - Every call counts as the same number of queries that GoogleSheetsInterface would make for it, and each of
+      those is applied on its own - so a batch_write that fails halfway through is left half-applied.
+    - It is safe to use from several threads at once (as GoogleSheetsInterface is with pooled_transport=True), and
+      their queries overlap - each query is applied in one go, but the latency is waited out outside of the lock.
+
+    Latency (a fixed number of seconds per query) and quotas (of read and write queries per time_horizon seconds,
+    going over which raises QuotaExceededError, as google does with an HTTP 429) can be injected to see how the rest
+    of the package copes with them.
+
+    .stats counts queries, cells and (approximate, as JSON) bytes sent and received since the last .reset_stats().
+    """
+
+    def __init__(self, latency: float = 0, max_read_queries: Optional[int] = None,
+                 max_write_queries: Optional[int] = None, time_horizon: float = 60, locale=Locale):
+        """
+        :param latency: seconds that each query takes
+        :param max_read_queries: how many read queries are allowed within any time_horizon seconds (None for no limit)
+        :param max_write_queries: analogous to max_read_queries, for writes
+        :param time_horizon: length, in seconds, of the window over which the quotas are measured
+        :param locale: Locale whose currency format is emulated
+        """
+        self.latency = latency
+        self.max_read_queries = max_read_queries
+        self.max_write_queries = max_write_queries
+        self.time_horizon = time_horizon
+        self._currency_parser = re.compile(r"^(-?){}(\d[\d.]*)(?:,(\d*))?$".format(re.escape(locale.currency_symbol)))
+        self._currency_symbol = locale.currency_symbol
+
+        self._lock = RLock()
+        self._sheets = dict()
+        self._id = uuid.uuid4().hex
+        self._revision = 0
+        self._read_times = deque()
+        self._write_times = deque()
+        self.reset_stats()
+
+    def add_sheet(self, sheet_name, rows=1000, columns=26):
+        """
+        Adds an empty sheet with a grid of the given size
+        """
+        if sheet_name in self._sheets:
+            raise Exception("A sheet with the name \"{}\" already exists".format(sheet_name))
+        self._sheets[sheet_name] = _Sheet(rows, columns)
+
+    def reset_stats(self):
+        self.stats = {
+            "queries": 0,
+            "read_queries": 0,
+            "write_queries": 0,
+            "cells_read": 0,
+            "cells_written": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+        }
+
+    def _query(self, is_write: bool):
+        times = self._write_times if is_write else self._read_times
+        max_queries = self.max_write_queries if is_write else self.max_read_queries
+        with self._lock:
+            if max_queries is not None:
+                now = monotonic()
+                while times and now - times[0] > self.time_horizon:
+                    times.popleft()
+                if len(times) >= max_queries:
+                    raise QuotaExceededError("Quota exceeded for {} requests".format("write" if is_write else "read"))
+                times.append(now)
+            self.stats["queries"] += 1
+            self.stats["write_queries" if is_write else "read_queries"] += 1
+        if self.latency:
+            sleep(self.latency)
+
+    def _count(self, direction: str, cells: str, payload):
+        self.stats[direction] += len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        if cells is not None:
+            self.stats[cells] += sum(len(row) for row in payload)
+
+    def _sheet(self, sheet_name, cell_range) -> Tuple[_Sheet, CellRange]:
+        description = "{}!{}".format(sheet_name, cell_range)
+        if sheet_name not in self._sheets:
+            raise Exception("Unable to parse range: {}".format(description))
+        sheet = self._sheets[sheet_name]
+        parsed = parse_range(cell_range)
+        sheet.check_bounds(parsed, description)
+        return sheet, parsed
+
+    def _user_entered(self, value) -> str:
+        if value is None:
+            return ""
+        value = str(value)
+        if value.startswith("'"):
+            return value[1:]
+        match = self._currency_parser.match(value)
+        if match is None:
+            return value
+        sign, integer_part, decimal_part = match.groups()
+        if "." in integer_part and not re.match(r"^\d{1,3}(\.\d{3})*$", integer_part):
+            return value
+        amount = round(float("{}.{}".format(integer_part.replace(".", ""), decimal_part or "0")), 2)
+        integer_part, decimal_part = "{:.2f}".format(amount).split(".")
+        if amount == 0:
+            sign = ""
+        return "{}{}{},{}".format(sign, self._currency_symbol, "{:,}".format(int(integer_part)).replace(",", "."),
+                                  decimal_part)
+
+    @staticmethod
+    def _transposed(data: List[list]) -> List[list]:
+        width = max((len(row) for row in data), default=0)
+        transposed = [[row[i] if i < len(row) else "" for row in data] for i in range(width)]
+        for column in transposed:
+            while column and column[-1] == "":
+                column.pop()
+        while transposed and not transposed[-1]:
+            transposed.pop()
+        return transposed
+
+    def _read(self, sheet_name, cell_range, major_dimension) -> List[list]:
+        sheet, parsed = self._sheet(sheet_name, cell_range)
+        data = sheet.read(parsed)
+        if major_dimension == "COLUMNS":
+            data = self._transposed(data)
+        self._count("bytes_received", "cells_read", data)
+        return data
+
+    def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
+        with self._lock:
+            self._sheet(sheet_name, cell_range)
+        self._query(False)
+        with self._lock:
+            self._count("bytes_sent", None, [sheet_name, cell_range])
+            return self._read(sheet_name, cell_range, major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        if not sheet_ranges:
+            return []
+        with self._lock:
+            for sheet_name, cell_range in sheet_ranges:
+                self._sheet(sheet_name, cell_range)
+        self._query(False)
+        with self._lock:
+            self._count("bytes_sent", None, sheet_ranges)
+            return [self._read(sheet_name, cell_range, major_dimension) for sheet_name, cell_range in sheet_ranges]
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        self._query(False)
+        with self._lock:
+            if sheet_name not in self._sheets:
+                raise KeyError(sheet_name)
+            sheet = self._sheets[sheet_name]
+            return sheet.rows, sheet.columns
+
+    def fingerprint(self) -> Optional[str]:
+        self._query(False)
+        with self._lock:
+            return "{}:{}".format(self._id, self._revision)
+
+    def _apply(self, write: SheetWrite, major_dimension="ROWS"):
+        sheet, cell_range = self._sheet(write.sheet_name, write.cell_range)
+        self._revision += 1
+        if write.kind == SET:
+            data = write.data if major_dimension == "ROWS" else self._transposed(write.data)
+            data = [[self._user_entered(value) for value in row] for row in data]
+            shape = range_shape(cell_range)
+            if len(data) > (sheet.rows - cell_range.first_row if shape is None else shape[0]) \
+                    or any(len(row) > (sheet.columns - cell_range.first_column if shape is None else shape[1])
+                           for row in data):
+                raise Exception("Requested writing within range [{}!{}], but tried writing beyond it"
+                                .format(write.sheet_name, write.cell_range))
+            self._count("bytes_sent", "cells_written", data)
+            sheet.write(cell_range.first_row, cell_range.first_column, data)
+        elif write.kind == CLEAR:
+            self._count("bytes_sent", None, [write.sheet_name, write.cell_range])
+            sheet.clear(cell_range)
+        elif write.kind in (INSERT, DELETE):
+            rows, _ = self._bounded_shape(write.cell_range)
+            self._count("bytes_sent", None, [write.sheet_name, write.cell_range])
+            if write.kind == INSERT:
+                sheet.rows += rows
+                sheet.shift(cell_range, rows)
+            else:
+                sheet.shift(cell_range, -rows)
+        else:
+            raise ValueError("Unknown kind of write: '{}'".format(write.kind))
+
+    def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
+        with self._lock:
+            self._sheet(sheet_name, cell_range)
+        self._query(True)
+        with self._lock:
+            self._apply(SheetWrite(SET, sheet_name, cell_range, data), major_dimension)
+
+    def clear(self, sheet_name, cell_range):
+        with self._lock:
+            self._sheet(sheet_name, cell_range)
+        self._query(True)
+        with self._lock:
+            self._apply(SheetWrite(CLEAR, sheet_name, cell_range))
+
+    def insert_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(INSERT, sheet_name, cell_range)])
+
+    def delete_range(self, sheet_name, cell_range):
+        self.batch_write([SheetWrite(DELETE, sheet_name, cell_range)])
+
+    def batch_write(self, writes: List[SheetWrite]):
+        # a query at a time, split like GoogleSheetsInterface.batch_write does it, so that going over the quota (or
+        # any other error) halfway through leaves the batch half-applied, as google would
+        for group in split_queries(writes):
+            with self._lock:
+                for write in group:
+                    self._sheet(write.sheet_name, write.cell_range)
+            self._query(True)
+            with self._lock:
+                for write in group:
+                    self._apply(write)
+
+    @property
+    def thread_safe(self) -> bool:
+        return True
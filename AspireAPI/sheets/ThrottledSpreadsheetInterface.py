@@ -1,51 +1,188 @@
-from typing import List, Union
+import random
+from threading import Lock
+from typing import List, Optional, Tuple, Union
 from datetime import timedelta as TimeDelta
-from datetime import datetime as DateTime
-from time import sleep
+from time import monotonic, sleep
 
-from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface
+from AspireAPI.sheets.AspireSpreadsheetInterface import AspireSpreadsheetInterface, SheetWrite, split_queries
+from AspireAPI.sheets.Tracing import record_throttle_wait
+
+
+class TokenBucket:
+    """
+    Rate limiter that allows up to capacity queries in a burst, and refill_rate queries per second sustained.
+
+    Safe to share between threads and coroutines: callers reserve their tokens under a lock (going into debt if
+    there aren't enough), and then wait outside of it for as long as it takes for the debt to be repaid.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._tokens = capacity
+        self._last_refill = monotonic()
+        self._lock = Lock()
+
+    def reserve(self, cost: float = 1) -> float:
+        """
+        Takes cost tokens from the bucket.
+        :return: how many seconds the caller has to wait before it may actually make its query
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_rate)
+            self._last_refill = now
+            self._tokens -= cost
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.refill_rate
+
+    def drain(self):
+        """
+        Empties the bucket, e.g. because the server said that we are going too fast regardless
+        """
+        with self._lock:
+            self._tokens = min(self._tokens, 0)
+
+    def acquire(self, cost: float = 1) -> float:
+        """
+        Takes cost tokens from the bucket, waiting for as long as it takes for them to be there.
+        :return: how many seconds it waited
+        """
+        wait = self.reserve(cost)
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+
+def is_rate_limit_error(exception: BaseException, statuses=(429, 503)) -> bool:
+    """
+    Whether the exception is an HTTP error with one of the given statuses. Works for googleapiclient's HttpError
+    (and anything else exposing the status as .status_code or .resp.status) without having to import it.
+    """
+    status = getattr(exception, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exception, "resp", None), "status", None)
+    try:
+        return int(status) in statuses
+    except (TypeError, ValueError):
+        return False
 
 
 class ThrottledSpreadsheetInterface(AspireSpreadsheetInterface):
     """
-    Straightforward specification of AspireSpreadsheetInterface by means of google's actual API for google sheets
+    Wraps another AspireSpreadsheetInterface, limiting the rate at which queries are made to it so as to stay within
+    google's quotas - which are separate for reads and writes, hence the two token buckets.
+
+    If a query fails nonetheless because of the rate limit (an HTTP 429, or a 503 for reads), it is retried after an
+    exponentially growing, randomly jittered wait. Writes are not retried on a 503, since it is not possible to tell
+    whether they were applied.
+
+    A batch_write is made (and paid for, and retried) one query at a time, split the same way as
+    GoogleSheetsInterface.batch_write splits it - retrying the whole batch when one of its later queries hit the rate
+    limit would send its insertions/deletions of rows again, shifting the rows twice.
     """
 
+    DEFAULT_COSTS = {
+        "get": 1,
+        "batch_get": 1,
+        "sheet_size": 1,
+        "set": 1,
+        "clear": 1,
+        "insert_range": 1,
+        "delete_range": 1,
+        "batch_write": 1,
+    }
+
     def __init__(self, time_horizon: Union[TimeDelta, int, float], max_queries: int,
-                 interface: AspireSpreadsheetInterface):
+                 interface: AspireSpreadsheetInterface, max_write_queries: Optional[int] = None,
+                 costs: Optional[dict] = None, max_retries=5, backoff_base: float = 1, backoff_max: float = 64):
         """
-        :param spreadsheet_id: Spreadsheet id. When opening the spreadsheet, the url should be of the form
-                               https://docs.google.com/spreadsheets/d/<spreadsheet-id>/<some other stuff>
-        :param credentials: a google.oauth2.credentials.Credentials object.
-                            Refer to google documentation for how to generate these.
+        :param time_horizon: length of the window over which max_queries is measured
+        :param max_queries: how many read queries may be made within time_horizon (and also in a single burst)
+        :param interface: the interface to be throttled
+        :param max_write_queries: analogous to max_queries, for writes. Defaults to max_queries.
+        :param costs: how many tokens each method takes (per query, for batch_write), for those to be overridden from
+                      DEFAULT_COSTS
+        :param max_retries: how many times a query is retried on a rate limit error before giving up
+        :param backoff_base: seconds to wait before the first retry (before jitter). Doubles for every retry after.
+        :param backoff_max: maximum number of seconds to wait before a retry (before jitter)
         """
 
         if not isinstance(time_horizon, TimeDelta):
             time_horizon = TimeDelta(seconds=time_horizon)
+        if max_write_queries is None:
+            max_write_queries = max_queries
 
         self._interface = interface
         self.time_horizon = time_horizon
         self.max_queries = max_queries
+        self.max_write_queries = max_write_queries
+        self.costs = dict(ThrottledSpreadsheetInterface.DEFAULT_COSTS, **(costs or dict()))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
 
-        self._query_times = [DateTime.now() - time_horizon for _ in range(max_queries)]
-        self._query_pointer = 0
+        seconds = time_horizon.total_seconds()
+        self.read_bucket = TokenBucket(max_queries, max_queries / seconds)
+        self.write_bucket = TokenBucket(max_write_queries, max_write_queries / seconds)
 
-    def _throttle(self):
-        now = DateTime.now()
-        then = self._query_times[self._query_pointer]
-        if now - then < self.time_horizon:
-            sleep((self.time_horizon - (now - then)).total_seconds())
-        self._query_times[self._query_pointer] = now
-        self._query_pointer = (self._query_pointer + 1) % self.max_queries
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _call(self, cost_name: str, is_write: bool, method, *args, **kwargs):
+        bucket = self.write_bucket if is_write else self.read_bucket
+        statuses = (429,) if is_write else (429, 503)
+        attempt = 0
+        while True:
+            record_throttle_wait(bucket.acquire(self.costs[cost_name]))
+            try:
+                return method(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_rate_limit_error(e, statuses):
+                    raise
+                bucket.drain()
+                backoff = self._backoff(attempt)
+                sleep(backoff)
+                record_throttle_wait(backoff)
+                attempt += 1
 
     def get(self, sheet_name, cell_range, major_dimension="ROWS") -> List[list]:
-        self._throttle()
-        return self._interface.get(sheet_name, cell_range, major_dimension=major_dimension)
+        return self._call("get", False, self._interface.get,
+                          sheet_name, cell_range, major_dimension=major_dimension)
+
+    def batch_get(self, sheet_name, cell_ranges, major_dimension="ROWS") -> List[List[list]]:
+        return self._call("batch_get", False, self._interface.batch_get,
+                          sheet_name, cell_ranges, major_dimension=major_dimension)
+
+    def cross_sheet_batch_get(self, sheet_ranges: List[Tuple[str, str]], major_dimension="ROWS") -> List[List[list]]:
+        return self._call("batch_get", False, self._interface.cross_sheet_batch_get,
+                          sheet_ranges, major_dimension=major_dimension)
+
+    def sheet_size(self, sheet_name) -> Optional[Tuple[int, int]]:
+        return self._call("sheet_size", False, self._interface.sheet_size, sheet_name)
+
+    def fingerprint(self) -> Optional[str]:
+        # not a query to the sheets API (see GoogleSheetsInterface.fingerprint), so not subject to its quotas
+        return self._interface.fingerprint()
 
     def set(self, sheet_name, cell_range, data, major_dimension="ROWS"):
-        self._throttle()
-        return self._interface.set(sheet_name, cell_range, data, major_dimension=major_dimension)
+        return self._call("set", True, self._interface.set,
+                          sheet_name, cell_range, data, major_dimension=major_dimension)
 
     def clear(self, sheet_name, cell_range):
-        self._throttle()
-        return self._interface.clear(sheet_name, cell_range)
+        return self._call("clear", True, self._interface.clear, sheet_name, cell_range)
+
+    def insert_range(self, sheet_name, cell_range):
+        return self._call("insert_range", True, self._interface.insert_range, sheet_name, cell_range)
+
+    def delete_range(self, sheet_name, cell_range):
+        return self._call("delete_range", True, self._interface.delete_range, sheet_name, cell_range)
+
+    def batch_write(self, writes: List[SheetWrite]):
+        for group in split_queries(writes):
+            self._call("batch_write", True, self._interface.batch_write, group)
+
+    @property
+    def thread_safe(self) -> bool:
+        return self._interface.thread_safe
@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from inspect import isgeneratorfunction
+from typing import Optional
+
+
+# The public method (of Transactions, Dashboard, etc.) currently being run, as "ClassName.method_name"
+_operation = ContextVar("aspire_operation", default=None)
+# Seconds spent waiting on the rate limiter by the sheet call currently being instrumented, if any
+_throttle_waits = ContextVar("aspire_throttle_waits", default=None)
+
+
+def traced(method):
+    """
+    Decorator for the public methods of the classes built on top of the spreadsheet interfaces, so that the calls to the
+    spreadsheet made while they run can be attributed to them (see InstrumentedSpreadsheetInterface). When one such
+    method calls another, the calls are attributed to the outermost one.
+
+    Methods that are generators are attributed the calls made while they run, i.e. while the next item is being taken
+    from them - but not those made by whoever iterates over them in between.
+    """
+    if isgeneratorfunction(method):
+        @wraps(method)
+        def generator_wrapper(self, *args, **kwargs):
+            name = "{}.{}".format(type(self).__name__, method.__name__)
+            generator = method(self, *args, **kwargs)
+            try:
+                while True:
+                    token = _operation.set(name) if _operation.get() is None else None
+                    try:
+                        item = next(generator)
+                    except StopIteration:
+                        return
+                    finally:
+                        if token is not None:
+                            _operation.reset(token)
+                    yield item
+            finally:
+                generator.close()
+        return generator_wrapper
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if _operation.get() is not None:
+            return method(self, *args, **kwargs)
+        token = _operation.set("{}.{}".format(type(self).__name__, method.__name__))
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _operation.reset(token)
+    return wrapper
+
+
+def current_operation() -> Optional[str]:
+    return _operation.get()
+
+
+def record_throttle_wait(seconds: float):
+    """
+    To be called by rate limiters whenever they hold back a call, with how long they did so
+    """
+    waits = _throttle_waits.get()
+    if waits is not None and seconds > 0:
+        waits.append(seconds)
+
+
+@contextmanager
+def collect_throttle_waits():
+    """
+    Context manager that yields a list, to which the waits recorded (through record_throttle_wait) within the block
+    are appended
+    """
+    waits = []
+    token = _throttle_waits.set(waits)
+    try:
+        yield waits
+    finally:
+        _throttle_waits.reset(token)
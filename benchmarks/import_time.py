@@ -0,0 +1,71 @@
+"""
+Measures how long it takes a fresh interpreter to import the package and get to the point of making its first query,
+which is what short-lived scripts (cron jobs, serverless functions) pay on every run.
+
+Run from the root of the repository:
+    python -m benchmarks.import_time --repeat 10
+Each measurement runs in its own interpreter, so that nothing is already imported or cached.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+
+_STAGES = {
+    "import AspireAPI.Aspire": "import AspireAPI.Aspire",
+    "import AspireAPI.sheets.GoogleSheetsAPI": "import AspireAPI.sheets.GoogleSheetsAPI",
+    "GoogleSheetsInterface(...)": "from AspireAPI.sheets.GoogleSheetsAPI import GoogleSheetsInterface\n"
+                                  "GoogleSheetsInterface('spreadsheet id', credentials)",
+    "GoogleSheetsInterface(...) + build service": "from AspireAPI.sheets.GoogleSheetsAPI import GoogleSheetsInterface\n"
+                                                  "GoogleSheetsInterface('spreadsheet id', credentials)._spreadsheets",
+    "import googleapiclient.discovery": "import googleapiclient.discovery",
+}
+
+_TEMPLATE = """
+import time
+{setup}
+start = time.perf_counter()
+{stage}
+elapsed = time.perf_counter() - start
+print(elapsed)
+"""
+
+# made up credentials - nothing here talks to google, and building the service doesn't check them
+_CREDENTIALS = "from google.oauth2.credentials import Credentials\ncredentials = Credentials(token='not a token')"
+
+
+def _measure(stage: str) -> float:
+    setup = _CREDENTIALS if "credentials" in stage else ""
+    output = subprocess.run([sys.executable, "-c", _TEMPLATE.format(setup=setup, stage=stage)],
+                            capture_output=True, text=True)
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+    return float(output.stdout.strip())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="how many interpreters to measure each stage in")
+    parser.add_argument("--save", help="file to write the results to, as JSON")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    print("{:<48}{:>12}{:>12}".format("", "median ms", "min ms"))
+    for name, stage in _STAGES.items():
+        try:
+            times = [_measure(stage) for _ in range(args.repeat)]
+        except RuntimeError as e:
+            print("{:<48}  skipped ({})".format(name, e))
+            continue
+        results[name] = {"median": statistics.median(times), "min": min(times)}
+        print("{:<48}{:>12.1f}{:>12.1f}".format(name, 1000*results[name]["median"], 1000*results[name]["min"]))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
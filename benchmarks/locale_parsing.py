@@ -0,0 +1,107 @@
+"""
+Compares the parsing in AspireAPI.Locale with the plain regex/strptime parsing it used to do, on strings like the ones
+found in the transactions sheet - checking along the way that both give the same results.
+
+Run from the root of the repository:
+    python -m benchmarks.locale_parsing --size 100000
+"""
+import argparse
+import json
+import re
+from datetime import datetime as DateTime
+from time import perf_counter
+
+from AspireAPI.Locale import EuropeLocale, USLocale, ChinaLocale
+from benchmarks.template import make_transaction
+
+
+def _reference_currency_parser(pattern):
+    def parse_currency(string):
+        if string == "":
+            return 0
+        s, i, w = re.match(pattern, string).groups()
+        return float("{}{}.{}".format(s, i.replace(".",""), w))
+    return parse_currency
+
+
+def _reference_date_parser(long_format, short_format):
+    def parse_date(string):
+        try:
+            return DateTime.strptime(string, long_format)
+        except ValueError:
+            return DateTime.strptime(string, short_format)
+    return parse_date
+
+
+# locale -> (how it used to parse currency, how it used to parse dates, how dates are written in its sheets)
+_REFERENCES = {
+    EuropeLocale: (_reference_currency_parser(EuropeLocale.currency_parser),
+                   _reference_date_parser("%d/%m/%Y", "%d/%m/%y"), "%d/%m/%Y"),
+    USLocale: (_reference_currency_parser(USLocale.currency_parser),
+               _reference_date_parser("%m/%d/%Y", "%m/%d/%y"), "%m/%d/%y"),
+    ChinaLocale: (_reference_currency_parser(ChinaLocale.currency_parser),
+                  _reference_date_parser("%Y/%m/%d", "%y/%m/%d"), "%Y/%m/%d"),
+}
+
+
+def _format_amount(amount: float, symbol: str) -> str:
+    if amount == 0:
+        return ""
+    integer, cents = "{:,.2f}".format(abs(amount)).split(".")
+    return "{}{}{},{}".format("-" if amount < 0 else "", symbol, integer.replace(",", "."), cents)
+
+
+def _columns(locale, size: int):
+    transactions = [make_transaction(i) for i in range(size)]
+    date_format = _REFERENCES[locale][2]
+    dates = [transaction.date.strftime(date_format) for transaction in transactions]
+    amounts = [_format_amount(transaction.outflow - transaction.inflow, locale.currency_symbol)
+               for transaction in transactions]
+    return dates, amounts
+
+
+def _time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="how many dates and amounts to parse")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to time each, keeping the best")
+    parser.add_argument("--save", help="file to write the results to, as JSON")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    print("{:<28}{:>14}{:>14}{:>14}{:>10}".format("", "reference ms", "cold ms", "warm ms", "speedup"))
+    for locale, (reference_currency, reference_date, _) in _REFERENCES.items():
+        dates, amounts = _columns(locale, args.size)
+        for kind, strings, reference, parse, parse_many in (
+                ("dates", dates, reference_date, locale.parse_date, locale.parse_date_many),
+                ("amounts", amounts, reference_currency, locale.parse_currency, locale.parse_currency_many)):
+            if parse_many(strings) != [reference(string) for string in strings]:
+                raise Exception("{} parses {} differently than it used to".format(locale.__name__, kind))
+
+            def cold():
+                parse.cache_clear()
+                parse_many(strings)
+            reference_seconds = _time(lambda: [reference(string) for string in strings], args.repeat)
+            cold_seconds = _time(cold, args.repeat)
+            warm_seconds = _time(lambda: parse_many(strings), args.repeat)
+
+            name = "{} {}".format(locale.__name__, kind)
+            results[name] = {"reference": reference_seconds, "cold": cold_seconds, "warm": warm_seconds}
+            print("{:<28}{:>14.1f}{:>14.1f}{:>14.1f}{:>9.1f}x".format(
+                name, 1000*reference_seconds, 1000*cold_seconds, 1000*warm_seconds, reference_seconds/cold_seconds))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"size": args.size, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measures how many queries (round trips), how many bytes and how much time each of the main operations of the API takes,
+against an in-memory spreadsheet laid out like the Aspire template, for tables of different sizes.
+
+Run from the root of the repository, e.g.
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --save baseline.json
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 --check baseline.json
+the latter exiting with an error if any operation now takes more queries than it did in the saved run.
+"""
+import argparse
+import json
+import sys
+from time import perf_counter
+
+from AspireAPI.Aspire import Aspire
+from benchmarks.template import make_spreadsheet, make_transaction, FIRST_DATE
+
+
+def _operations(aspire: Aspire):
+    transactions = aspire.transactions
+    middle = lambda: transactions.first_empty_index // 2
+    batch = [make_transaction(i) for i in range(100)]
+    late = make_transaction(10**7)
+    return [
+        ("transactions[-1]", lambda: transactions[-1]),
+        ("transactions.batch_get(-100, -1)", lambda: transactions.batch_get(-100, -1)),
+        ("transactions.push", lambda: transactions.push(late)),
+        ("transactions.batch_push(100)", lambda: transactions.batch_push([late]*100)),
+        ("transactions.insert(0)", lambda: transactions.insert(0, batch[0])),
+        ("transactions.batch_insert(middle, 100)", lambda: transactions.batch_insert(middle(), batch)),
+        ("transactions.insert_sorted", lambda: transactions.insert_sorted(make_transaction(middle()))),
+        ("transactions.batch_insert_sorted(100)",
+         lambda: transactions.batch_insert_sorted([t._replace(date=FIRST_DATE) for t in batch])),
+        ("transactions.replace(-1)", lambda: transactions.replace(-1, late)),
+        ("transactions.batch_replace(-100, 100)", lambda: transactions.batch_replace(-100, [late]*100)),
+        ("transactions.pop(0)", lambda: transactions.pop(0)),
+        ("transactions.pop(middle)", lambda: transactions.pop(middle())),
+        ("transactions.batch_pop(-100, -1)", lambda: transactions.batch_pop(-100, -1)),
+        ("transactions.is_healthy", lambda: transactions.is_healthy()),
+        ("dashboard.snapshot", lambda: aspire.dashboard.snapshot()),
+        ("dashboard.balance + available", lambda: (aspire.dashboard.balance("Bank"),
+                                                   aspire.dashboard.available("Rent"))),
+    ]
+
+
+def _measure(spreadsheet, function) -> dict:
+    spreadsheet.reset_stats()
+    start = perf_counter()
+    function()
+    elapsed = perf_counter() - start
+    return dict(spreadsheet.stats, seconds=elapsed)
+
+
+def run(size: int, latency: float) -> dict:
+    """
+    :return: dict from the name of each benchmark to its measurements
+    """
+    results = dict()
+    for cached in (False, True):
+        suffix = " [cached]" if cached else ""
+        spreadsheet = make_spreadsheet(size, size // 10, latency=latency)
+
+        def construct():
+            aspire = Aspire(spreadsheet, cache_tables=cached)
+            aspire.transactions, aspire.category_transfers
+            return aspire
+        spreadsheet.reset_stats()
+        start = perf_counter()
+        aspire = construct()
+        results["Aspire() + load tables" + suffix] = dict(spreadsheet.stats, seconds=perf_counter() - start)
+
+        for name, function in _operations(aspire):
+            results[name + suffix] = _measure(spreadsheet, function)
+    return results
+
+
+def _print_table(size: int, results: dict):
+    print("\n{} rows".format(size))
+    print("{:<52}{:>8}{:>12}{:>12}{:>10}".format("", "queries", "bytes sent", "bytes recv", "ms"))
+    for name, stats in results.items():
+        print("{:<52}{:>8}{:>12}{:>12}{:>10.1f}".format(name, stats["queries"], stats["bytes_sent"],
+                                                       stats["bytes_received"], 1000*stats["seconds"]))
+
+
+def _regressions(results: dict, baseline: dict) -> list:
+    regressions = []
+    for size, size_results in results.items():
+        for name, stats in size_results.items():
+            before = baseline.get(size, dict()).get(name)
+            if before is not None and stats["queries"] > before["queries"]:
+                regressions.append("{} rows, {}: {} queries, up from {}".format(size, name, stats["queries"],
+                                                                                before["queries"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="amounts of transactions to benchmark with")
+    parser.add_argument("--latency", type=float, default=0, help="seconds that each query should take")
+    parser.add_argument("--save", help="file to write the results to, as JSON")
+    parser.add_argument("--check", help="file with results saved by an earlier run to compare query counts against")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    for size in args.sizes:
+        results[str(size)] = run(size, args.latency)
+        _print_table(size, results[str(size)])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.check:
+        with open(args.check, "r") as f:
+            regressions = _regressions(results, json.load(f))
+        if regressions:
+            print("\nMore queries than in {}:".format(args.check))
+            print("\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares reading and writing a block of rows of the tables one row at a time (row_to_transaction/transaction_to_row,
+which is what batch_get and the batched writes used to do) against doing it a column at a time (rows_to_transactions/
+transactions_to_rows) - checking along the way that both give the same results.
+
+Run from the root of the repository:
+    python -m benchmarks.table_decoding --size 100000
+"""
+import argparse
+import json
+from time import perf_counter
+
+from AspireAPI.CategoryTransfers import row_to_category_transfer, category_transfer_to_row, \
+    rows_to_category_transfers, category_transfers_to_rows
+from AspireAPI.Locale import Locale, Money
+from AspireAPI.Transactions import row_to_transaction, transaction_to_row, rows_to_transactions, \
+    transactions_to_rows
+from benchmarks.template import make_transaction, make_category_transfer
+
+
+# table -> (make an item, row by row decoding, row by row encoding, block decoding, block encoding)
+_TABLES = {
+    "transactions": (make_transaction, row_to_transaction, transaction_to_row,
+                     rows_to_transactions, transactions_to_rows),
+    "category transfers": (make_category_transfer, row_to_category_transfer, category_transfer_to_row,
+                           rows_to_category_transfers, category_transfers_to_rows),
+}
+
+
+def _time(function, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        # so that every run starts with the locale's caches empty, as the first read of a table would
+        Locale.parse_date.cache_clear()
+        Locale.parse_currency.cache_clear()
+        start = perf_counter()
+        function()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=100000, help="how many rows to read and write")
+    parser.add_argument("--repeat", type=int, default=3, help="how many times to time each, keeping the best")
+    parser.add_argument("--save", help="file to write the results to, as JSON")
+    args = parser.parse_args(argv)
+
+    results = dict()
+    print("{:<36}{:>14}{:>14}{:>10}".format("", "row by row ms", "block ms", "speedup"))
+    for table, (make_item, row_to_item, item_to_row, rows_to_items, items_to_rows) in _TABLES.items():
+        for money in Money:
+            rows = [item_to_row(make_item(i)) for i in range(args.size)]
+            # the API leaves out trailing empty cells
+            for row in rows:
+                while row and row[-1] == "":
+                    row.pop()
+            items = [row_to_item(list(row), money) for row in rows]
+            if rows_to_items(rows, money) != [row_to_item(list(row), money) for row in rows]:
+                raise Exception("Decoding {} a block at a time gives different results".format(table))
+            if items_to_rows(items, money) != [item_to_row(item, money) for item in items]:
+                raise Exception("Encoding {} a block at a time gives different results".format(table))
+
+            for kind, row_by_row, block in (
+                    ("decoding", lambda: [row_to_item(list(row), money) for row in rows],
+                     lambda: rows_to_items(rows, money)),
+                    ("encoding", lambda: [item_to_row(item, money) for item in items],
+                     lambda: items_to_rows(items, money))):
+                row_by_row_seconds = _time(row_by_row, args.repeat)
+                block_seconds = _time(block, args.repeat)
+                name = "{} {} ({})".format(table, kind, money.value)
+                results[name] = {"row_by_row": row_by_row_seconds, "block": block_seconds}
+                print("{:<36}{:>14.1f}{:>14.1f}{:>9.1f}x".format(
+                    name, 1000*row_by_row_seconds, 1000*block_seconds, row_by_row_seconds/block_seconds))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"size": args.size, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
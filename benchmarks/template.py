@@ -0,0 +1,76 @@
+from datetime import datetime as Datetime, timedelta as TimeDelta
+
+from AspireAPI.CategoryTransfers import CategoryTransfer, CategoryTransferStatus, category_transfers_to_rows
+from AspireAPI.Locale import Locale
+from AspireAPI.Transactions import Transaction, TransactionStatus, transactions_to_rows
+from AspireAPI.sheets.LocalSpreadsheetInterface import LocalSpreadsheetInterface
+
+
+ACCOUNTS = ["Bank", "Savings", "Cash"]
+CREDIT_CARDS = ["Visa"]
+CATEGORY_GROUPS = {
+    "Essentials": ["Rent", "Groceries", "Utilities", "Transport"],
+    "Fun": ["Restaurants", "Hobbies", "Travel"],
+}
+FIRST_DATE = Datetime(2020, 1, 1)
+
+
+def make_transaction(i: int) -> Transaction:
+    categories = CATEGORY_GROUPS["Essentials"] + CATEGORY_GROUPS["Fun"]
+    return Transaction(FIRST_DATE + TimeDelta(days=i // 50), float(i % 97 + 1), 0, categories[i % len(categories)],
+                       ACCOUNTS[i % len(ACCOUNTS)], "memo {}".format(i), TransactionStatus.SETTLED)
+
+
+def make_category_transfer(i: int) -> CategoryTransfer:
+    categories = CATEGORY_GROUPS["Essentials"] + CATEGORY_GROUPS["Fun"]
+    return CategoryTransfer(FIRST_DATE + TimeDelta(days=i // 50), float(i % 89 + 1), "Available to budget",
+                            categories[i % len(categories)], "", CategoryTransferStatus.NONE)
+
+
+def make_spreadsheet(qt_transactions: int, qt_category_transfers: int, free_rows=2000,
+                     spreadsheet_class=LocalSpreadsheetInterface, **kwargs) -> LocalSpreadsheetInterface:
+    """
+    :return: a LocalSpreadsheetInterface laid out like the Aspire template, with the given amount of rows in each of
+             the tables (plus free_rows empty rows after them), and its stats reset.
+    :param spreadsheet_class: LocalSpreadsheetInterface, or a subclass of it to make instead
+    :param kwargs: passed on to spreadsheet_class
+    """
+    spreadsheet = spreadsheet_class(**kwargs)
+    spreadsheet.add_sheet("Configuration", rows=120)
+    spreadsheet.add_sheet("Dashboard", rows=120)
+    spreadsheet.add_sheet("Transactions", rows=8+qt_transactions+free_rows)
+    spreadsheet.add_sheet("Category Transfers", rows=7+qt_category_transfers+free_rows)
+
+    # format_currency leaves zeros empty, but these cells are formulas, which always display something
+    zero = "{}0,00".format(Locale.currency_symbol)
+    spreadsheet.set("Configuration", "B5:F5", [[Locale.format_currency(2500.0), "", zero,
+                                                Locale.format_currency(15000.0)]])
+    spreadsheet.set("Configuration", "H9:H23", [[account] for account in ACCOUNTS])
+    spreadsheet.set("Configuration", "I9:I23", [[credit_card] for credit_card in CREDIT_CARDS])
+
+    category_rows = []
+    for group, categories in CATEGORY_GROUPS.items():
+        category_rows.append(["✦", group])
+        for i, category in enumerate(categories):
+            category_rows.append(["•", category, Locale.format_currency(100.0*(i+1)), "", "✓" if i % 2 else ""])
+    spreadsheet.set("Configuration", "B9:F{}".format(8+len(category_rows)), category_rows)
+
+    spreadsheet.set("Dashboard", "H2:O2", [[Locale.format_currency(1234.5), Locale.format_currency(-432.1), "",
+                                            Locale.format_currency(2000.0), "", "", "", "3"]])
+    balances = []
+    for i in range(len(ACCOUNTS)+len(CREDIT_CARDS)):
+        balances += [[Locale.format_currency(1000.0*(i+1))], []]
+    spreadsheet.set("Dashboard", "C8:C{}".format(7+len(balances)), balances)
+    spreadsheet.set("Dashboard", "I6:O{}".format(5+len(category_rows)),
+                    [[Locale.format_currency(10.0*(i+1)), "", "", Locale.format_currency(-5.0*(i+1)), "", "",
+                      Locale.format_currency(20.0*(i+1))] for i in range(len(category_rows))])
+
+    if qt_transactions:
+        spreadsheet.set("Transactions", "B9:H{}".format(8+qt_transactions),
+                        transactions_to_rows([make_transaction(i) for i in range(qt_transactions)]))
+    if qt_category_transfers:
+        spreadsheet.set("Category Transfers", "B8:G{}".format(7+qt_category_transfers),
+                        category_transfers_to_rows([make_category_transfer(i) for i in range(qt_category_transfers)]))
+
+    spreadsheet.reset_stats()
+    return spreadsheet
@@ -3,7 +3,7 @@ from datetime import datetime as Datetime
 
 from AspireAPI.Aspire import Aspire
 from AspireAPI.CategoryTransfers import CategoryTransfer, CategoryTransferStatus
-from AspireAPI.Locale import Locale
+from AspireAPI.Locale import Locale, Money
 from AspireAPI.Transactions import Transaction, TransactionStatus
 from AspireAPI.sheets.ThrottledSpreadsheetInterface import ThrottledSpreadsheetInterface
 from AspireAPI.sheets.GoogleSheetsAPI import GoogleSheetsInterface
@@ -19,12 +19,13 @@ my_savings_account="FAKEBANK2"
 
 gsapi = GoogleSheetsInterface(sheet_id, creds)
 tgsapi = ThrottledSpreadsheetInterface(60, 60, gsapi)
-aspire = Aspire(tgsapi, ensure_healthy=False)
+aspire = Aspire(tgsapi, ensure_healthy=False, money=Money.CENTS)
 
 budgeted_categories = [c for c in aspire.categories if aspire.category_amount(c) is not None]
 
-available_to_budget = aspire.dashboard.available_to_budget()
-remainder_to_budget = {category:aspire.category_amount(category)-aspire.dashboard.available(category)
+dashboard = aspire.dashboard.snapshot()
+available_to_budget = dashboard.available_to_budget()
+remainder_to_budget = {category:aspire.category_amount(category)-dashboard.available(category)
                        for category in budgeted_categories}
 
 remainder_after_budgeting = available_to_budget - sum(remainder_to_budget.values())
@@ -45,9 +46,10 @@ transactions = [
     Transaction(today, 0, remainder_after_budgeting, "↕️ Account Transfer", my_savings_account, "", TransactionStatus.PENDING)
 ]
 
-aspire.category_transfers.batch_push(transfers)
-aspire.transactions.batch_push(transactions)
+with aspire.batch():
+    aspire.category_transfers.batch_push(transfers)
+    aspire.transactions.batch_push(transactions)
 
 print("Remember to go transfer {} from {} to {} and mark the first transaction as settled".format(
-    Locale.format_currency(remainder_after_budgeting), my_normal_account, my_savings_account
+    Locale.format_currency(remainder_after_budgeting, Money.CENTS), my_normal_account, my_savings_account
 ))
\ No newline at end of file
@@ -1,8 +1,14 @@
 import json
+import os
+from tempfile import TemporaryDirectory
 
 from AspireAPI.Aspire import Aspire
+from AspireAPI.Locale import Money
+from AspireAPI.sheets.AspireSpreadsheetInterface import SheetWrite, INSERT, DELETE
+from AspireAPI.sheets.CachingSpreadsheetInterface import CachingSpreadsheetInterface
 from AspireAPI.sheets.GoogleSheetsAPI import GoogleSheetsInterface
-from credentials import get_credentials
+from AspireAPI.sheets.LocalSpreadsheetInterface import LocalSpreadsheetInterface, QuotaExceededError
+from benchmarks.template import make_spreadsheet, make_transaction, make_category_transfer
 
 
 
@@ -47,26 +53,167 @@ def some_category_transfer_tests(aspire: Aspire):
 
 
 def some_category_grouping_tests(aspire: Aspire):
+    dashboard = aspire.dashboard.snapshot()
     for group in aspire.category_groups:
-        activity = aspire.dashboard.activity(group)
-        available = aspire.dashboard.available(group)
-        budgeted = aspire.dashboard.budgeted(group)
+        activity = dashboard.activity(group)
+        available = dashboard.available(group)
+        budgeted = dashboard.budgeted(group)
         for category in aspire.category_groups[group]:
-            activity -= aspire.dashboard.activity(category)
-            available -= aspire.dashboard.available(category)
-            budgeted -= aspire.dashboard.budgeted(category)
-        assert abs(activity)+abs(available)+abs(budgeted)<1e-10
+            activity -= dashboard.activity(category)
+            available -= dashboard.available(category)
+            budgeted -= dashboard.budgeted(category)
+        assert activity == available == budgeted == 0
+
+
+def some_dashboard_snapshot_tests(aspire: Aspire):
+    dashboard = aspire.dashboard.snapshot()
+    assert dashboard.available_to_budget() == aspire.dashboard.available_to_budget()
+    assert dashboard.spent_this_month() == aspire.dashboard.spent_this_month()
+    assert dashboard.budgeted_this_month() == aspire.dashboard.budgeted_this_month()
+    for account in aspire.accounts + aspire.credit_cards:
+        assert dashboard.balance(account) == aspire.dashboard.balance(account)
+    for category in aspire.categories:
+        assert dashboard.available(category) == aspire.dashboard.available(category)
+
+
+# The tests below need no spreadsheet of their own: they run on a LocalSpreadsheetInterface (see
+# benchmarks.template), making writes fail at every point they can.
+
+class _LaggingSpreadsheetInterface(LocalSpreadsheetInterface):
+    """
+    LocalSpreadsheetInterface whose fingerprint never changes (as if it were slow to catch up with every write), and
+    whose fail_after-th batch_write raises right after being applied - as a crash before hearing back would
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_after = None
+
+    def fingerprint(self):
+        return "lagging"
+
+    def batch_write(self, writes):
+        super().batch_write(writes)
+        if self.fail_after is not None:
+            self.fail_after -= 1
+            if self.fail_after == 0:
+                raise QuotaExceededError("Failed after being applied")
+
+
+def _tables(spreadsheet: LocalSpreadsheetInterface):
+    return spreadsheet.get("Transactions", "B9:H"), spreadsheet.get("Category Transfers", "B8:G")
+
+
+def _multi_step_operation(aspire: Aspire):
+    # a single batch with several runs of insertions/deletions, in both tables
+    with aspire.batch():
+        aspire.transactions.pop(7)
+        aspire.transactions.insert(3, make_transaction(3)._replace(memo="inserted"))
+        aspire.category_transfers.pop(2)
+        aspire.transactions.batch_insert_sorted([make_transaction(i)._replace(memo="sorted {}".format(i))
+                                                 for i in (10, 60, 90)])
+        aspire.category_transfers.push(make_category_transfer(1000))
+
+
+def some_journal_tests():
+    reference = make_spreadsheet(100, 20)
+    before = _tables(reference)
+    _multi_step_operation(Aspire(reference, cache_tables=True))
+    after = _tables(reference)
+
+    for fails_after_applying in (False, True):
+        qt_allowed = 0
+        while True:
+            with TemporaryDirectory() as directory:
+                journal_path = os.path.join(directory, "journal.jsonl")
+                spreadsheet = make_spreadsheet(100, 20, spreadsheet_class=_LaggingSpreadsheetInterface)
+                aspire = Aspire(spreadsheet, cache_tables=True, journal_path=journal_path)
+                if fails_after_applying:
+                    spreadsheet.fail_after = qt_allowed+1
+                else:
+                    spreadsheet.max_write_queries = qt_allowed
+                try:
+                    _multi_step_operation(aspire)
+                except QuotaExceededError:
+                    pass
+                else:
+                    # went through without failing, so every point it could fail at has been tried
+                    assert qt_allowed > 1 and _tables(spreadsheet) == after
+                    break
+
+                # nothing else is written until the batch is dealt with
+                try:
+                    aspire.transactions.push(make_transaction(0))
+                    raise Exception()
+                except Exception as e:
+                    assert "unfinished" in str(e)
+
+                spreadsheet.max_write_queries = None
+                spreadsheet.fail_after = None
+                recovered = Aspire(spreadsheet, journal_path=journal_path)
+                assert _tables(spreadsheet) == (before if qt_allowed == 0 and not fails_after_applying else after)
+                assert recovered.transactions.is_healthy() and recovered.category_transfers.is_healthy()
+                recovered.transactions.push(make_transaction(0))
+            qt_allowed += 1
+
+
+def some_batch_rollback_tests():
+    for cache_tables in (False, True):
+        spreadsheet = make_spreadsheet(100, 20)
+        aspire = Aspire(spreadsheet, cache_tables=cache_tables)
+        before = _tables(spreadsheet)
+        transactions = aspire.transactions.batch_get(0, aspire.transactions.first_empty_index-1)
+        try:
+            with aspire.batch():
+                aspire.transactions.push(make_transaction(1000))
+                aspire.transactions.insert(5, make_transaction(1001))
+                aspire.category_transfers.pop(3)
+                raise KeyboardInterrupt()
+        except KeyboardInterrupt:
+            pass
+        assert _tables(spreadsheet) == before
+        assert aspire.transactions.first_empty_index == len(transactions)
+        assert aspire.transactions.batch_get(0, len(transactions)-1) == transactions
+        assert aspire.transactions.is_healthy() and aspire.category_transfers.is_healthy()
+
+
+def some_cache_invalidation_tests():
+    spreadsheet = make_spreadsheet(100, 20)
+    cache = CachingSpreadsheetInterface(spreadsheet)
+    rows = spreadsheet.get("Transactions", "B9:H20")
+    category_transfer = cache.get("Category Transfers", "B8:G8")
+
+    assert cache.get("Transactions", "B9:H9") == rows[:1]
+    assert cache.get("Transactions", "B15:H15") == rows[6:7]
+    cache.insert_range("Transactions", "B12:H12")
+    assert cache.get("Transactions", "B15:H15") == rows[5:6]
+    cache.delete_range("Transactions", "B10:H11")
+    assert cache.get("Transactions", "B15:H15") == rows[7:8]
+    cache.batch_write([SheetWrite(DELETE, "Transactions", "B9:H9"), SheetWrite(INSERT, "Transactions", "B9:H10")])
+    assert cache.get("Transactions", "B15:H15") == rows[6:7]
+
+    # what none of the writes moved is still remembered
+    qt_queries = spreadsheet.stats["queries"]
+    assert cache.get("Category Transfers", "B8:G8") == category_transfer
+    assert spreadsheet.stats["queries"] == qt_queries
 
 
 if __name__ == '__main__':
+    some_journal_tests()
+    some_batch_rollback_tests()
+    some_cache_invalidation_tests()
+
+    from credentials import get_credentials
+
     with open("personal_data.json", "r") as f:
         sheet_id = json.load(f)["sheet_id"]
 
     creds = get_credentials(["https://www.googleapis.com/auth/spreadsheets"])
 
     gsapi = GoogleSheetsInterface(sheet_id, creds)
-    aspire = Aspire(gsapi, ensure_healthy=False)
+    aspire = Aspire(gsapi, ensure_healthy=False, money=Money.CENTS)
 
     some_transaction_tests(aspire)
     some_category_transfer_tests(aspire)
-    some_category_grouping_tests(aspire)
\ No newline at end of file
+    some_category_grouping_tests(aspire)
+    some_dashboard_snapshot_tests(aspire)
\ No newline at end of file